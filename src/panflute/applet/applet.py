@@ -28,6 +28,7 @@ Panflute provides over MPRIS.
 
 from __future__ import absolute_import, division
 
+import panflute.applet.cache
 import panflute.applet.conf
 import panflute.applet.player
 import panflute.applet.prefs
@@ -35,6 +36,8 @@ import panflute.applet.stock
 import panflute.applet.widget
 import panflute.defs
 import panflute.mpris
+import panflute.trace
+import panflute.util
 
 import dbus
 import functools
@@ -60,6 +63,10 @@ class Applet (object):
 
     TWO_ROW_SIZE_THRESHOLD = 48
 
+    # How long to keep showing the cached state, in ms, if no player is
+    # around yet, in case the daemon is still starting up.
+    CACHED_STATE_TIMEOUT = 10000
+
 
     def __init__ (self, applet):
         self.__applet = applet
@@ -68,22 +75,31 @@ class Applet (object):
         self.__first_widgets = []
         self.__second_widgets = []
 
-        gtk.window_set_default_icon_from_file (
-            os.path.join (panflute.defs.PKG_DATA_DIR, "{0}.svg".format (panflute.applet.stock.PANFLUTE)))
+        with panflute.trace.startup_phase ("default icon"):
+            gtk.window_set_default_icon_from_file (
+                os.path.join (panflute.defs.PKG_DATA_DIR, "{0}.svg".format (panflute.applet.stock.PANFLUTE)))
         applet.set_border_width (0)
         applet.set_background_widget (applet)       # the "transparency hack"
 
-        try:
-            import pynotify
-            pynotify.init ("panflute-applet")
-        except ImportError, e:
-            self.log.warn ("Couldn't initialize notifications: {0}".format (e))
+        with panflute.trace.startup_phase ("notifications"):
+            try:
+                import pynotify
+                pynotify.init ("panflute-applet")
+            except ImportError, e:
+                self.log.warn ("Couldn't initialize notifications: {0}".format (e))
+
+        with panflute.trace.startup_phase ("preferences"):
+            applet.add_preferences ("/schemas/apps/panflute/applet/prefs")
+            self.__conf = panflute.applet.conf.Conf (applet)
 
-        applet.add_preferences ("/schemas/apps/panflute/applet/prefs")
-        self.__conf = panflute.applet.conf.Conf (applet)
+        with panflute.trace.startup_phase ("cached state"):
+            self.__paint_cache = panflute.applet.cache.FirstPaintCache (applet)
+            self.__cached_state = self.__paint_cache.load ()
+        self.__cached_state_source = None
 
-        self.__layout = LayoutManager (self.__conf)
-        self.__layout.connect ("notify::layout", self.__layout_changed_cb)
+        with panflute.trace.startup_phase ("LayoutManager"):
+            self.__layout = LayoutManager (self.__conf)
+            self.__layout.connect ("notify::layout", self.__layout_changed_cb)
 
         self.__notification = None
         self.__conf.connect_bool ("show_notifications", self.__show_notifications_changed_cb, call_now = True)
@@ -92,27 +108,38 @@ class Applet (object):
         applet.connect ("change-orient", self.__change_orient_cb)
         applet.connect ("change-size", self.__change_size_cb)
         applet.connect ("destroy", self.__destroy_cb)
+        self.__first_paint_handler = applet.connect_after ("expose-event", self.__first_expose_event_cb)
 
         self.__prefs_dialog = None
         self.__about_dialog = None
 
-        bus = dbus.SessionBus ()
-        proxy = bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
-        self.__bus = dbus.Interface (proxy, "org.freedesktop.DBus")
+        with panflute.trace.startup_phase ("D-Bus proxies"):
+            bus = dbus.SessionBus ()
+            proxy = bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+            self.__bus = dbus.Interface (proxy, "org.freedesktop.DBus")
 
-        proxy = bus.get_object ("org.kuliniewicz.Panflute", "/connectors")
-        self.__manager = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Manager")
+            proxy = bus.get_object ("org.kuliniewicz.Panflute", "/connectors")
+            self.__manager = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Manager")
 
-        self.__bus.connect_to_signal ("NameOwnerChanged", self.__name_owner_changed_cb,
-                                      arg0 = "org.mpris.panflute")
-        self.__bus.NameHasOwner ("org.mpris.panflute",
-                                 reply_handler = self.__name_has_owner_cb,
-                                 error_handler = self.log.error)
+            self.__bus.connect_to_signal ("NameOwnerChanged", self.__name_owner_changed_cb,
+                                          arg0 = "org.mpris.panflute")
 
-        self.__menu = ContextMenu (applet, bus, [
-            ("Preferences", self.__preferences_cb),
-            ("About", self.__about_cb)])
-        self.__load_content ()
+            # Keep the daemon from exiting while the applet is around, even
+            # if no player is running, including after it restarts.
+            self.__bus.connect_to_signal ("NameOwnerChanged", self.__daemon_owner_changed_cb,
+                                          arg0 = "org.kuliniewicz.Panflute")
+            self.__manager.Hold (reply_handler = lambda: None,
+                                 error_handler = self.log.warn)
+            self.__bus.NameHasOwner ("org.mpris.panflute",
+                                     reply_handler = self.__name_has_owner_cb,
+                                     error_handler = self.log.error)
+
+        with panflute.trace.startup_phase ("ContextMenu"):
+            self.__menu = ContextMenu (applet, bus, [
+                ("Preferences", self.__preferences_cb),
+                ("About", self.__about_cb)])
+        with panflute.trace.startup_phase ("widgets"):
+            self.__load_content ()
 
         applet.show ()
 
@@ -122,17 +149,45 @@ class Applet (object):
         Shut down the player, if it exists.
         """
 
+        self.__paint_cache.unwatch ()
         if self.__player is not None:
             self.__player.shutdown ()
 
 
+    def __first_expose_event_cb (self, applet, event):
+        """
+        Note how long it took after starting for the applet to first show
+        anything.
+        """
+
+        applet.disconnect (self.__first_paint_handler)
+        panflute.trace.startup_mark ("first paint")
+
+        if self.__cached_state is not None:
+            showing = "cached state"
+        elif self.__connected:
+            showing = "player"
+        else:
+            showing = "launcher"
+        age = panflute.util.get_process_age ()
+        if age is not None:
+            self.log.info ("First paint {0:.0f} ms after starting, showing {1}".format (age * 1000, showing))
+        return False
+
+
     def __name_has_owner_cb (self, has_owner):
         """
         Display whether a connection to the Panflute daemon is available.
         """
 
-        self.__connected = has_owner
-        self.__load_content ()
+        panflute.trace.startup_mark ("NameHasOwner reply")
+        if not has_owner and self.__cached_state is not None:
+            self.__cached_state_source = gobject.timeout_add (self.CACHED_STATE_TIMEOUT,
+                                                              self.__cached_state_timeout_cb)
+            return
+
+        with panflute.trace.startup_phase ("widgets"):
+            self.__set_connected (has_owner)
 
 
     def __name_owner_changed_cb (self, name, old_owner, new_owner):
@@ -140,10 +195,50 @@ class Applet (object):
         Looks for the Panflute daemon to change its availability.
         """
 
-        self.__connected = (new_owner != "")
+        self.__set_connected (new_owner != "")
+
+
+    def __cached_state_timeout_cb (self):
+        """
+        Stop showing the cached state, since no player turned up.
+        """
+
+        self.log.debug ("No player turned up; dropping the cached state")
+        self.__cached_state_source = None
+        self.__set_connected (False)
+        return False
+
+
+    def __set_connected (self, connected):
+        """
+        Show whether a player is available.  If the cached state was being
+        shown, the live state replaces it without rebuilding the widgets.
+        """
+
+        self.__connected = connected
+        if self.__cached_state is not None:
+            self.__cached_state = None
+            if self.__cached_state_source is not None:
+                gobject.source_remove (self.__cached_state_source)
+                self.__cached_state_source = None
+            if connected and self.__player is not None:
+                self.log.debug ("Replacing the cached state with the live state")
+                self.__player.attach ()
+                self.__paint_cache.watch (self.__player)
+                return
         self.__load_content ()
 
 
+    def __daemon_owner_changed_cb (self, name, old_owner, new_owner):
+        """
+        Hold on to a newly started daemon.
+        """
+
+        if new_owner != "":
+            self.__manager.Hold (reply_handler = lambda: None,
+                                 error_handler = self.log.warn)
+
+
     def __load_content (self):
         """
         Fill the applet with the appropriate widgets.
@@ -155,11 +250,16 @@ class Applet (object):
         self.__first_widgets = []
         self.__second_widgets = []
 
-        if self.__connected:
+        if self.__connected or self.__cached_state is not None:
             self.log.debug ("Setting layout to connected")
 
             if self.__player is None:
-                self.__player = panflute.applet.player.Player ()
+                with panflute.trace.startup_phase ("Player"):
+                    if self.__connected:
+                        self.__player = panflute.applet.player.Player ()
+                        self.__paint_cache.watch (self.__player)
+                    else:
+                        self.__player = panflute.applet.player.Player (self.__cached_state)
                 self.__player.connect ("song-changed", self.__song_changed_cb)
                 self.__player.connect ("notify::art-file", self.__notify_art_file_cb)
 
@@ -173,6 +273,8 @@ class Applet (object):
             widget.show ()
             self.__first_widgets.append (widget)
             if self.__player is not None:
+                # Start out showing the launcher next time, too.
+                self.__paint_cache.clear ()
                 self.__player.shutdown ()
                 self.__player = None
 
@@ -835,20 +937,31 @@ class SongTip (gtk.HBox):
         vbox.show ()
         self.pack_start (vbox)
 
+        self.__handlers = {
+            "title":    self.__notify_title_cb,
+            "artist":   self.__notify_artist_cb,
+            "album":    self.__notify_album_cb,
+            "duration": self.__notify_time_cb,
+            "elapsed":  self.__notify_time_cb,
+            "art":      self.__notify_art_cb
+        }
+
         autodisconnect_gobject_handlers (self, player, [
-            player.connect ("notify::title", self.__notify_title_cb),
-            player.connect ("notify::artist", self.__notify_artist_cb),
-            player.connect ("notify::album", self.__notify_album_cb),
-            player.connect ("notify::duration", self.__notify_time_cb),
-            player.connect ("notify::elapsed", self.__notify_time_cb),
-            player.connect ("notify::art", self.__notify_art_cb)
+            player.connect ("state-changed", self.__state_changed_cb)
         ])
 
-        self.__notify_title_cb (player, None)
-        self.__notify_artist_cb (player, None)
-        self.__notify_album_cb (player, None)
-        self.__notify_time_cb (player, None)
-        self.__notify_art_cb (player, None)
+        self.__state_changed_cb (player, frozenset (self.__handlers.keys ()))
+        use_position_updates (self, player)
+
+
+    def __state_changed_cb (self, player, changed):
+        """
+        Refresh each part of the tip affected by a change in the player,
+        updating each one only once even if several of its inputs changed.
+        """
+
+        for handler in set (self.__handlers[name] for name in changed if name in self.__handlers):
+            handler (player, None)
 
 
     def __notify_title_cb (self, player, pspec):
@@ -1208,6 +1321,7 @@ class TimeLabel (gtk.EventBox):
         ])
 
         use_song_info_tooltip (self, player)
+        use_position_updates (self, player)
 
 
     def __show_remaining_time_cb (self, value):
@@ -1290,6 +1404,7 @@ class TimeBar (gtk.HBox):
         self.__notify_elapsed_cb (player, None)
         self.__notify_can_seek_cb (player, None)
         use_song_info_tooltip (self, player)
+        use_position_updates (self, player)
 
 
     def set_angle (self, angle):
@@ -1485,18 +1600,21 @@ class MetadataScroller (panflute.applet.widget.Scroller):
         self.__format_strings = []
         self.__replacements = {}
 
+        self.__fields = {
+            "title":        ("title",        self.__string_formatter),
+            "artist":       ("artist",       self.__string_formatter),
+            "album":        ("album",        self.__string_formatter),
+            "track-number": ("track_number", self.__string_formatter),
+            "genre":        ("genre",        self.__string_formatter),
+            "duration":     ("duration",     self.__time_formatter),
+            "year":         ("year",         self.__number_formatter)
+        }
+
         autodisconnect_gobject_handlers (self, player, [
-            player.connect ("notify::title",        self.__notify_field_cb, "title",        self.__string_formatter),
-            player.connect ("notify::artist",       self.__notify_field_cb, "artist",       self.__string_formatter),
-            player.connect ("notify::album",        self.__notify_field_cb, "album",        self.__string_formatter),
-            player.connect ("notify::track-number", self.__notify_field_cb, "track_number", self.__string_formatter),
-            player.connect ("notify::genre",        self.__notify_field_cb, "genre",        self.__string_formatter),
-            player.connect ("notify::duration",     self.__notify_field_cb, "duration",     self.__time_formatter),
-            player.connect ("notify::year",         self.__notify_field_cb, "year",         self.__number_formatter)
+            player.connect ("state-changed", self.__state_changed_cb)
         ])
 
-        for name in ["title", "artist", "album", "track-number", "genre", "duration", "year"]:
-            player.notify (name)
+        self.__apply_fields (player, self.__fields.keys ())
 
         autodisconnect_conf_handlers (self, conf, [
             conf.connect_string_list ("metadata_lines", self.__metadata_lines_cb, call_now = True)
@@ -1514,14 +1632,26 @@ class MetadataScroller (panflute.applet.widget.Scroller):
         self.__update_strings ()
 
 
-    def __notify_field_cb (self, player, pspec, field_name, formatter):
+    def __state_changed_cb (self, player, changed):
         """
-        Update a metadata field with a property from the player.
+        Update the metadata fields with the properties that changed, laying
+        out the scroller again only once no matter how many changed.
         """
 
-        text = formatter (player.get_property (pspec.name))
-        self.__replacements[field_name] = text
-        self.__update_strings ()
+        names = [name for name in changed if name in self.__fields]
+        if len (names) > 0:
+            self.__apply_fields (player, names)
+            self.__update_strings ()
+
+
+    def __apply_fields (self, player, names):
+        """
+        Update metadata fields with properties from the player.
+        """
+
+        for name in names:
+            field_name, formatter = self.__fields[name]
+            self.__replacements[field_name] = formatter (player.get_property (name))
 
 
     def __string_formatter (self, string):
@@ -1720,6 +1850,17 @@ def use_song_info_tooltip (widget, player):
     widget.connect ("destroy", discard_tooltip_cb)
 
 
+def use_position_updates (widget, player):
+    """
+    Have the player keep the elapsed time up to date only while the widget
+    is actually on screen.  A widget is unmapped when it's hidden, when the
+    tooltip it's in goes away, and before it's destroyed.
+    """
+
+    widget.connect ("map", lambda widget: player.watch_position ())
+    widget.connect ("unmap", lambda widget: player.unwatch_position ())
+
+
 # Cache these translated strings to avoid making lots and lots of
 # redundant calls to gettext.
 
@@ -1765,4 +1906,5 @@ def format_negative_time (milliseconds):
         return time_format_neg_ms.format (minutes = minutes, seconds = seconds)
 
 
-panflute.applet.stock.register_stock_icons ()
+with panflute.trace.startup_phase ("stock icons"):
+    panflute.applet.stock.register_stock_icons ()
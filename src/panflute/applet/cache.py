@@ -0,0 +1,204 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+
+"""
+Cache of what the applet last showed, so that it can show it again the
+moment it starts up, instead of waiting on the daemon.
+
+At login, the daemon may have to be started before it can say anything
+about the player, which leaves the applet empty for a few seconds.  Each
+applet instance remembers the state of the player it last displayed, and
+its art as a small thumbnail, and starts out showing that until the daemon
+reports what's actually going on.
+"""
+
+from __future__ import absolute_import
+
+import panflute.applet.widget
+import panflute.util
+
+import gobject
+import gtk
+import json
+import os
+import os.path
+import re
+
+
+class FirstPaintCache (object):
+    """
+    The cached state of one applet instance.
+    """
+
+    from panflute.util import log
+
+    # How long to wait after a change before saving the state, in seconds.
+    SAVE_DELAY = 5
+
+    THUMBNAIL_HEIGHT = 128
+
+    # Properties that change too often to be worth a write of their own.
+    # They're saved along with anything else, and when the applet exits.
+    MINOR = frozenset (["elapsed", "volume"])
+
+
+    def __init__ (self, applet):
+        key = applet.get_preferences_key ()
+        if key is None:
+            instance = "default"
+        else:
+            # e.g. /apps/panel/applets/applet_3/prefs
+            instance = re.sub (r"[^A-Za-z0-9_-]", "_", os.path.basename (os.path.dirname (key.rstrip ("/"))))
+
+        dirname = os.path.join (panflute.util.get_xdg_data_home_directory (), "applet")
+        try:
+            os.makedirs (dirname, 0700)
+        except OSError:
+            # Directory already existing is not a failure
+            pass
+
+        self.__state_file = os.path.join (dirname, "{0}.json".format (instance))
+        self.__art_file = os.path.join (dirname, "{0}.png".format (instance))
+        self.__player = None
+        self.__handler = None
+        self.__save_source = None
+        self.__unsaved = False
+        self.__saved_art = None
+
+
+    def load (self):
+        """
+        Get the state last saved for the applet, with the thumbnail of its
+        art loaded, or None if nothing was saved.
+        """
+
+        try:
+            with open (self.__state_file, "r") as input:
+                state = json.load (input)
+        except (IOError, ValueError), e:
+            self.log.debug ("No cached state: {0}".format (e))
+            return None
+        if not isinstance (state, dict):
+            return None
+
+        state["art"] = None
+        state["art-file"] = None
+        if os.path.exists (self.__art_file):
+            try:
+                state["art"] = gtk.gdk.pixbuf_new_from_file (self.__art_file)
+                state["art-file"] = self.__art_file
+            except Exception, e:
+                self.log.warn ("Couldn't load cached art: {0}".format (e))
+
+        return state
+
+
+    def watch (self, player):
+        """
+        Save the state of a player connected to the daemon whenever it
+        changes, until unwatch is called.
+        """
+
+        self.unwatch ()
+        self.__player = player
+        self.__handler = player.connect ("state-changed", self.__state_changed_cb)
+        self.__schedule_save ()
+
+
+    def unwatch (self):
+        """
+        Stop watching the player, saving any changes not yet saved.
+        """
+
+        if self.__save_source is not None:
+            gobject.source_remove (self.__save_source)
+            self.__save_cb ()
+        elif self.__unsaved:
+            self.__save_cb ()
+        if self.__player is not None:
+            self.__player.disconnect (self.__handler)
+            self.__player = None
+            self.__handler = None
+
+
+    def clear (self):
+        """
+        Forget the saved state, so the applet starts out showing nothing is
+        playing.
+        """
+
+        self.unwatch ()
+        for filename in [self.__state_file, self.__art_file]:
+            try:
+                os.remove (filename)
+            except OSError:
+                pass
+        self.__saved_art = None
+
+
+    def __state_changed_cb (self, player, changed):
+        """
+        Save the new state soon, unless all that changed was something
+        minor, like the elapsed time ticking along.
+        """
+
+        if changed <= self.MINOR:
+            self.__unsaved = True
+        else:
+            self.__schedule_save ()
+
+
+    def __schedule_save (self):
+        """
+        Save the state a little while from now, so that a burst of changes
+        only leads to one write.
+        """
+
+        if self.__save_source is None:
+            self.__save_source = gobject.timeout_add_seconds (self.SAVE_DELAY, self.__save_cb)
+
+
+    def __save_cb (self):
+        """
+        Write out the player's current state, and a thumbnail of its art if
+        the art changed.
+        """
+
+        self.__save_source = None
+        self.__unsaved = False
+        if self.__player is None:
+            return False
+
+        try:
+            art = self.__player.props.art
+            if art is not self.__saved_art:
+                if art is not None:
+                    thumbnail = panflute.applet.widget.scale_to_height (art, min (art.get_height (), self.THUMBNAIL_HEIGHT))
+                    thumbnail.save (self.__art_file, "png")
+                elif os.path.exists (self.__art_file):
+                    os.remove (self.__art_file)
+                self.__saved_art = art
+
+            with open (self.__state_file, "w") as output:
+                json.dump (self.__player.cached_state (), output)
+        except Exception, e:
+            self.log.warn ("Couldn't save cached state: {0}".format (e))
+
+        return False
@@ -28,12 +28,14 @@ from __future__ import absolute_import
 
 import panflute.defs
 import panflute.mpris
+import panflute.trace
 
 import dbus
 import gobject
 import gtk
 import Queue
 import threading
+import time
 import urllib
 
 
@@ -46,6 +48,16 @@ class Player (gobject.GObject):
     it possible to create widgets that can immediately access the current
     state of the player, without needing one or more round trips to get that
     information from the daemon.
+
+    Each update received from the daemon is applied all at once, and is
+    followed by a single state-changed signal carrying the set of property
+    names that changed.  Widgets that depend on several properties should
+    prefer that signal over connecting to each individual notify signal.
+
+    Given a state saved earlier by cached_state, the player starts out with
+    that state and doesn't talk to the daemon until attach is called, so
+    that widgets can show it while the daemon is still starting.  The live
+    state then replaces it, with only the properties that differ notified.
     """
 
 
@@ -177,8 +189,14 @@ class Player (gobject.GObject):
 
     from panflute.util import log
 
+    POSITION_INTERVAL = 1000
+
+
+    # Properties not worth remembering between runs.
+    UNCACHED = ["art", "art-file", "volume"]
+
 
-    def __init__ (self):
+    def __init__ (self, cached_state = None):
         gobject.GObject.__init__ (self)
 
         self.__props = {
@@ -204,9 +222,45 @@ class Player (gobject.GObject):
         }
 
         self.__queue = Queue.Queue (-1)
+        self.__art_key = None
+        self.__metadata = {}
         self.__art_thread = ArtLoaderThread (self, self.__queue)
         self.__art_thread.start ()
+        self.__art_trace = (None, None)
         self.__features = []
+        self.__player = None
+        self.__dbus_handlers = []
+        self.__position_watchers = 0
+
+        # The daemon's state version as of the last signal applied, if it
+        # reports one.
+        self.__version = None
+        self.__metadata_version = None
+        self.__snapshot_pending = False
+
+        if cached_state is None:
+            self.attach ()
+        else:
+            self.__restore (cached_state)
+
+
+    @property
+    def attached (self):
+        """
+        Check whether the player is talking to the daemon yet.
+        """
+
+        return self.__player is not None
+
+
+    def attach (self):
+        """
+        Start talking to the daemon, replacing any cached state with the
+        live state as soon as it's received.
+        """
+
+        if self.__player is not None:
+            return
 
         bus = dbus.SessionBus ()
         proxy = bus.get_object ("org.mpris.panflute", "/Player")
@@ -217,9 +271,118 @@ class Player (gobject.GObject):
             self.__player.connect_to_signal ("CapsChange", self.__caps_change_cb),
             self.__player.connect_to_signal ("StatusChange", self.__status_change_cb),
             self.__player.connect_to_signal ("TrackChange", self.__track_change_cb),
+            self.__player_ex.connect_to_signal ("MetadataChanged", self.__metadata_changed_cb),
             self.__player_ex.connect_to_signal ("PositionChange", self.__position_change_cb),
             self.__player_ex.connect_to_signal ("FeatureAdded", self.__feature_added_cb)
         ]
+        if panflute.trace.tracing ():
+            self.__dbus_handlers.append (
+                self.__player_ex.connect_to_signal ("TraceContext", self.__trace_context_cb))
+
+        if self.__position_watchers > 0:
+            self.__subscribe_position ()
+
+        self.__request_snapshot ()
+
+
+    def __request_snapshot (self):
+        """
+        Ask the daemon for its entire state.  Signals that arrive before the
+        reply are already reflected in it, so they're ignored until then.
+        """
+
+        self.__snapshot_pending = True
+        self.__requested = time.time ()
+        self.__player_ex.GetSnapshot (reply_handler = self.__get_snapshot_cb,
+                                      error_handler = self.__get_snapshot_error_cb)
+
+
+    def __count_signal (self):
+        """
+        Count a signal that advances the daemon's state version, returning
+        whether it still needs to be applied.
+        """
+
+        if self.__snapshot_pending:
+            return False
+        if self.__version is not None:
+            self.__version += 1
+        return True
+
+
+    def __restore (self, cached_state):
+        """
+        Take on a state saved by an earlier run, without notifying anyone.
+        """
+
+        for (name, value) in cached_state.iteritems ():
+            if name in self.__props:
+                self.__props[name] = value
+        self.__features = list (cached_state.get ("features", []))
+        self.__metadata = dict (cached_state.get ("metadata", {}))
+
+        # Show the thumbnail until the full art for the same song is loaded.
+        self.__art_key = cached_state.get ("art-key", None)
+        if self.__art_key is not None and not self.__art_key.endswith (" -"):
+            self.__queue.put (self.__art_key)
+
+
+    def cached_state (self):
+        """
+        Get the state of the player in a form that can be saved as JSON and
+        passed to the constructor of a later player.
+        """
+
+        state = dict ((name, value) for (name, value) in self.__props.iteritems ()
+                                    if name not in self.UNCACHED)
+        state["features"] = list (self.__features)
+        state["metadata"] = dict ((key, value) for (key, value) in self.__metadata.iteritems ()
+                                               if isinstance (value, (basestring, int, long, float)))
+        state["art-key"] = self.__art_key
+        return state
+
+
+    def __get_snapshot_cb (self, snapshot):
+        """
+        Initialize every property from a single snapshot of the daemon's
+        state.
+        """
+
+        self.log.debug ("Initial state received after {0:.0f} ms".format (
+            (time.time () - self.__requested) * 1000))
+        panflute.trace.startup_mark ("GetSnapshot reply")
+
+        self.__snapshot_pending = False
+        self.__version = snapshot.get ("version", None)
+        self.__metadata_version = self.__version
+        old_song = self.__song_identity ()
+
+        self.__metadata = dict (snapshot["metadata"])
+        values = {}
+        values.update (self.__caps_values (snapshot["caps"]))
+        values.update (self.__status_values (snapshot["status"]))
+        values.update (self.__track_values (self.__metadata))
+        values["elapsed"] = snapshot["position"]
+        if "VolumeGet" in snapshot["features"]:
+            values["volume"] = snapshot["volume"]
+        self._update_properties (values)
+
+        if self.__song_identity () != old_song:
+            self.emit ("song-changed")
+
+        for feature in snapshot["features"]:
+            self.__add_feature (feature)
+
+
+    def __get_snapshot_error_cb (self, error):
+        """
+        Fall back to fetching each part of the state separately, in case the
+        daemon predates GetSnapshot.
+        """
+
+        self.log.info ("GetSnapshot failed, fetching state piecemeal: {0}".format (error))
+        self.__snapshot_pending = False
+        self.__version = None
 
         self.__player.GetCaps (reply_handler = self.__caps_change_cb,
                                error_handler = self.log.warn)
@@ -249,8 +412,9 @@ class Player (gobject.GObject):
     def do_set_property (self, property, value):
         if property.name == "volume":
             self.__props["volume"] = value
-            self.__player.VolumeSet (value, reply_handler = lambda: None,
-                                            error_handler = self.log.warn)
+            if self.__player is not None:
+                self.__player.VolumeSet (value, reply_handler = lambda: None,
+                                                error_handler = self.log.warn)
 
 
     def _set_property (self, name, value):
@@ -262,9 +426,33 @@ class Player (gobject.GObject):
         it prevents outsiders from trying to set properties.
         """
 
-        if self.__props[name] != value:
-            self.__props[name] = value
-            self.notify (name)
+        self._update_properties ({name: value})
+
+
+    def _update_properties (self, values):
+        """
+        Set the values of several properties as a single update.
+
+        Notify signals are held back until every value has been applied, and
+        a single state-changed signal then reports the names of all the
+        properties that actually changed, so widgets interested in more than
+        one property can refresh themselves just once.
+        """
+
+        changed = set ()
+
+        self.freeze_notify ()
+        try:
+            for name, value in values.iteritems ():
+                if self.__props[name] != value:
+                    self.__props[name] = value
+                    self.notify (name)
+                    changed.add (name)
+        finally:
+            self.thaw_notify ()
+
+        if len (changed) > 0:
+            self.emit ("state-changed", frozenset (changed))
 
 
     def __get_features_cb (self, features):
@@ -281,11 +469,22 @@ class Player (gobject.GObject):
         Add a newly detected feature to those known to exist.
         """
 
-        self.__features.append (feature)
+        if not self.__count_signal ():
+            return
+        self.__add_feature (feature)
         if feature == "VolumeGet":
             self.__player.VolumeGet (reply_handler = self.__volume_get_cb,
                                      error_handler = self.log.warn)
-        self.emit ("feature-added", feature)
+
+
+    def __add_feature (self, feature):
+        """
+        Record a feature as being supported.
+        """
+
+        if feature not in self.__features:
+            self.__features.append (feature)
+            self.emit ("feature-added", feature)
 
 
     def supports (self, feature):
@@ -301,10 +500,21 @@ class Player (gobject.GObject):
         Update the capabilities properties with the current caps.
         """
 
-        self._set_property ("can-pause", (caps & panflute.mpris.CAN_PAUSE) != 0)
-        self._set_property ("can-go-next", (caps & panflute.mpris.CAN_GO_NEXT) != 0)
-        self._set_property ("can-go-previous", (caps & panflute.mpris.CAN_GO_PREV) != 0)
-        self._set_property ("can-seek", (caps & panflute.mpris.CAN_SEEK) != 0)
+        if self.__count_signal ():
+            self._update_properties (self.__caps_values (caps))
+
+
+    def __caps_values (self, caps):
+        """
+        Determine the values of the capabilities properties.
+        """
+
+        return {
+            "can-pause":       (caps & panflute.mpris.CAN_PAUSE) != 0,
+            "can-go-next":     (caps & panflute.mpris.CAN_GO_NEXT) != 0,
+            "can-go-previous": (caps & panflute.mpris.CAN_GO_PREV) != 0,
+            "can-seek":        (caps & panflute.mpris.CAN_SEEK) != 0
+        }
 
 
     def __status_change_cb (self, status):
@@ -312,35 +522,116 @@ class Player (gobject.GObject):
         Update the status properties with the current status.
         """
 
-        self._set_property ("state", status[panflute.mpris.STATUS_STATE])
+        if not self.__count_signal ():
+            return
+        with panflute.trace.span ("applet StatusChange", panflute.trace.take_pending ()):
+            self._update_properties (self.__status_values (status))
+
+
+    def __status_values (self, status):
+        """
+        Determine the values of the status properties.
+        """
+
+        return {"state": status[panflute.mpris.STATUS_STATE]}
 
 
     def __track_change_cb (self, metadata):
+        """
+        Update the properties with the latest metadata, unless the daemon
+        also reports just what changed via MetadataChanged.
+        """
+
+        if self.__count_signal () and not self.supports ("MetadataChanged"):
+            self.__apply_metadata (dict (metadata))
+
+
+    def __metadata_changed_cb (self, changed, removed, new_track, version):
+        """
+        Patch the latest metadata with the fields that changed.
+
+        The version is that of the TrackChange just before it.  A delta no
+        newer than the metadata already applied is skipped.  One that
+        doesn't match the version counted so far means a signal was
+        missed, so the whole state is fetched again instead.
+        """
+
+        if self.__snapshot_pending or not self.supports ("MetadataChanged"):
+            return
+
+        if self.__version is not None:
+            if version <= self.__metadata_version:
+                self.log.debug ("Skipping stale MetadataChanged {0}".format (version))
+                return
+            elif version != self.__version:
+                self.log.info ("Expected state version {0} but got {1}; refreshing".format (self.__version, version))
+                self.__request_snapshot ()
+                return
+            self.__metadata_version = version
+
+        metadata = dict (self.__metadata)
+        for key in removed:
+            metadata.pop (key, None)
+        metadata.update (changed)
+        self.__apply_metadata (metadata)
+
+
+    def __apply_metadata (self, metadata):
         """
         Update the properties with the latest metadata.
         """
 
-        old_title = self.props.title
-        old_artist = self.props.artist
-        old_album = self.props.album
+        correlation = panflute.trace.take_pending ()
+        with panflute.trace.span ("applet TrackChange", correlation):
+            old_song = self.__song_identity ()
+            self.__metadata = metadata
+            values = self.__track_values (metadata)
+            if "art" in values:
+                self.__art_trace = (correlation, panflute.trace.monotonic ())
+            self._update_properties (values)
+            if self.__song_identity () != old_song:
+                self.emit ("song-changed")
 
-        self._set_property ("location", metadata.get ("location", None))
-        self._set_property ("title", metadata.get ("title", None))
-        self._set_property ("artist", metadata.get ("artist", None) or None)
-        self._set_property ("album", metadata.get ("album", None) or None)
-        self._set_property ("track-number", metadata.get ("tracknumber", None) or None)
-        self._set_property ("genre", metadata.get ("genre", None) or None)
-        self._set_property ("duration", metadata.get ("mtime", 0))
-        self._set_property ("year", metadata.get ("year", 0))
-        self._set_property ("rating", metadata.get ("rating", 0))
-        self._set_property ("rating-scale", metadata.get ("panflute rating scale", 0))
 
-        self._set_property ("art-file", None)
-        self._set_property ("art", None)
-        self.__queue.put ("{0} {1}".format (metadata.get ("location", "-"), metadata.get ("arturl", "-")))
+    def __track_values (self, metadata):
+        """
+        Determine the values of the metadata properties, and start loading
+        new art if it's needed.
+        """
 
-        if self.props.title != old_title or self.props.artist != old_artist or self.props.album != old_album:
-            self.emit ("song-changed")
+        values = {
+            "location":     metadata.get ("location", None),
+            "title":        metadata.get ("title", None),
+            "artist":       metadata.get ("artist", None) or None,
+            "album":        metadata.get ("album", None) or None,
+            "track-number": metadata.get ("tracknumber", None) or None,
+            "genre":        metadata.get ("genre", None) or None,
+            "duration":     metadata.get ("mtime", 0),
+            "year":         metadata.get ("year", 0),
+            "rating":       metadata.get ("rating", 0),
+            "rating-scale": metadata.get ("panflute rating scale", 0)
+        }
+
+        # Only throw away the current art if it's actually out of date;
+        # otherwise a rating change would make the art flicker while the
+        # same image gets loaded all over again.
+
+        art_key = "{0} {1}".format (metadata.get ("location", "-"), metadata.get ("arturl", "-"))
+        if art_key != self.__art_key:
+            self.__art_key = art_key
+            values["art-file"] = None
+            values["art"] = None
+            self.__queue.put (art_key)
+
+        return values
+
+
+    def __song_identity (self):
+        """
+        Get the values that determine whether a different song is playing.
+        """
+
+        return (self.props.title, self.props.artist, self.props.album)
 
 
     def __position_change_cb (self, position):
@@ -351,6 +642,43 @@ class Player (gobject.GObject):
         self._set_property ("elapsed", position)
 
 
+    def watch_position (self):
+        """
+        Note that something showing the elapsed time is on screen, so the
+        daemon should keep it up to date.
+        """
+
+        self.__position_watchers += 1
+        if self.__position_watchers == 1 and self.__player is not None:
+            self.__subscribe_position ()
+            # It went stale while nobody was looking.
+            self.__player.PositionGet (reply_handler = self.__position_change_cb,
+                                       error_handler = self.log.warn)
+
+
+    def unwatch_position (self):
+        """
+        Note that something showing the elapsed time is no longer on screen.
+        Once nothing is, the daemon stops sending position updates.
+        """
+
+        if self.__position_watchers > 0:
+            self.__position_watchers -= 1
+            if self.__position_watchers == 0 and self.__player is not None:
+                self.__player_ex.UnsubscribePosition (reply_handler = lambda: None,
+                                                      error_handler = self.log.debug)
+
+
+    def __subscribe_position (self):
+        """
+        Ask the daemon for position updates.
+        """
+
+        self.__player_ex.SubscribePosition (self.POSITION_INTERVAL,
+                                            reply_handler = lambda: None,
+                                            error_handler = self.log.warn)
+
+
     def __volume_get_cb (self, volume):
         """
         Update the volume with the current value.
@@ -359,6 +687,45 @@ class Player (gobject.GObject):
         self._set_property ("volume", volume)
 
 
+    def _show_art (self, name, pixbuf):
+        """
+        Show newly loaded art.  Called by the art loader thread, but in the
+        main thread.
+        """
+
+        (correlation, start) = self.__art_trace
+        self.__art_trace = (None, None)
+        panflute.trace.hop ("applet art loaded", correlation, start)
+        self._update_properties ({"art-file": name, "art": pixbuf})
+
+
+    def __trace_context_cb (self, correlation):
+        """
+        Note the correlation id of the command whose effect is being
+        signalled next.
+        """
+
+        panflute.trace.hop ("applet TraceContext", correlation)
+        panflute.trace.set_pending (correlation)
+
+
+    def __trace_command (self, name):
+        """
+        Tag the command about to be sent with a new correlation id if events
+        are being traced, returning the reply handler to use for it.
+        """
+
+        if not panflute.trace.tracing ():
+            return lambda: None
+
+        correlation = panflute.trace.new_correlation ()
+        start = panflute.trace.monotonic ()
+        self.__player_ex.TraceCommand (correlation,
+                                       reply_handler = lambda: None,
+                                       error_handler = self.log.debug)
+        return lambda: panflute.trace.hop ("applet {0}".format (name), correlation, start)
+
+
     def pause (self):
         """
         Play or pause playback.
@@ -369,6 +736,10 @@ class Player (gobject.GObject):
         start playing in response to a Pause if playback is stopped).
         """
 
+        if self.__player is None:
+            # Still only showing the cached state.
+            return
+
         if self.props.state == panflute.mpris.STATE_PLAYING:
             if self.props.can_pause:
                 method = self.__player.Pause
@@ -379,7 +750,7 @@ class Player (gobject.GObject):
         else:
             method = self.__player.Play
 
-        method (reply_handler = lambda: None,
+        method (reply_handler = self.__trace_command ("PlayPause"),
                 error_handler = self.log.warn)
 
 
@@ -388,7 +759,10 @@ class Player (gobject.GObject):
         Unconditionally stop playback.
         """
 
-        self.__player.Stop (reply_handler = lambda: None,
+        if self.__player is None:
+            return
+
+        self.__player.Stop (reply_handler = self.__trace_command ("Stop"),
                             error_handler = self.log.warn)
 
 
@@ -397,7 +771,10 @@ class Player (gobject.GObject):
         Advance to the next song.
         """
 
-        self.__player.Next (reply_handler = lambda: None,
+        if self.__player is None:
+            return
+
+        self.__player.Next (reply_handler = self.__trace_command ("Next"),
                             error_handler = self.log.warn)
 
 
@@ -406,7 +783,10 @@ class Player (gobject.GObject):
         Go back to the previous song.
         """
 
-        self.__player.Prev (reply_handler = lambda: None,
+        if self.__player is None:
+            return
+
+        self.__player.Prev (reply_handler = self.__trace_command ("Prev"),
                             error_handler = self.log.warn)
 
 
@@ -415,6 +795,9 @@ class Player (gobject.GObject):
         Rate the current song.
         """
 
+        if self.__player is None:
+            return
+
         self.__player_ex.SetMetadata ("rating", rating,
                                       reply_handler = lambda: None,
                                       error_handler = self.log.warn)
@@ -425,6 +808,9 @@ class Player (gobject.GObject):
         Seek to a position within the current song.
         """
 
+        if self.__player is None:
+            return
+
         self.__player.PositionSet (int (position),
                                    reply_handler = lambda: None,
                                    error_handler = self.log.warn)
@@ -432,10 +818,14 @@ class Player (gobject.GObject):
 
     def shutdown (self):
         """
-        Shut down the album art thread cleanly.
+        Shut down the album art thread cleanly, and stop asking for position
+        updates.
         """
 
         if self.__art_thread is not None:
+            if self.__player is not None and self.__position_watchers > 0:
+                self.__player_ex.UnsubscribePosition (reply_handler = lambda: None,
+                                                      error_handler = self.log.debug)
             self.__queue.put ("")
             self.__art_thread = None
 
@@ -449,6 +839,10 @@ gobject.signal_new ("feature-added", Player,
                     gobject.SIGNAL_RUN_LAST,
                     gobject.TYPE_NONE,
                     (gobject.TYPE_STRING,))
+gobject.signal_new ("state-changed", Player,
+                    gobject.SIGNAL_RUN_LAST,
+                    gobject.TYPE_NONE,
+                    (gobject.TYPE_PYOBJECT,))
 
 
 class ArtLoaderThread (threading.Thread):
@@ -518,8 +912,7 @@ class ArtLoaderThread (threading.Thread):
 
         if self.__player.props.location == location:
             self.log.debug ("Showing art from file {0} for song {1}".format (name, location))
-            self.__player._set_property ("art-file", name)
-            self.__player._set_property ("art", pixbuf)
+            self.__player._show_art (name, pixbuf)
         else:
             self.log.debug ("Discarding art; different song is now playing")
         return False
@@ -67,6 +67,10 @@ class Connector (panflute.daemon.connector.PollingConnector):
         return Player (self.__thread, **kwargs)
 
 
+    def queue_depths (self):
+        return {"DCOP": self.__thread.queue_depth ()}
+
+
 class WorkerThread (threading.Thread):
     """
     Thread used to perform DCOP initialization and function calls, with the
@@ -102,6 +106,17 @@ class WorkerThread (threading.Thread):
             self.__queue.put ((func, args, callback))
 
 
+    def queue_depth (self):
+        """
+        Get the number of DCOP calls waiting to be made.
+        """
+
+        if self.__queue is not None:
+            return self.__queue.qsize ()
+        else:
+            return 0
+
+
     def immediate (self, obj_name, func_name, *args):
         """
         Execute a DCOP call in the current thread.
@@ -287,6 +302,7 @@ class Player (panflute.daemon.mpris.Player):
         Poll Amarok 1.4 for various status information.
         """
 
+        self.stats.poll_tick ()
         self.__thread.enqueue ("player", "isPlaying",
                                callback = self.__is_playing_cb)
 
@@ -108,7 +108,7 @@ class Player (panflute.daemon.mpris.Player):
                                             error_handler = self.log.warn)
 
         self.__handlers = [
-            self.__engine.connect_to_signal ("EventChanged", self.__event_changed_cb)
+            self.connect_backend_signal (self.__engine, "EventChanged", self.__event_changed_cb)
         ]
 
         self.cached_caps.go_next = True
@@ -59,13 +59,13 @@ class Player (panflute.daemon.passthrough.Player):
         tracklist = dbus.Interface (proxy, panflute.mpris.INTERFACE)
 
         self.__extra_handlers = [
-            tracklist.connect_to_signal ("TrackChange", self.do_TrackChange),
-            tracklist.connect_to_signal ("StatusChange", self.do_StatusChange),
-            tracklist.connect_to_signal ("CapsChange", self.do_CapsChange)
+            self.connect_backend_signal (tracklist, "TrackChange", self.do_TrackChange),
+            self.connect_backend_signal (tracklist, "StatusChange", self.do_StatusChange),
+            self.connect_backend_signal (tracklist, "CapsChange", self.do_CapsChange)
         ]
 
 
-    def remote_from_connection (self):
+    def remove_from_connection (self):
         for handler in self.__extra_handlers:
             handler.remove ()
         self.__extra_handlers = []
@@ -23,6 +23,8 @@ Classes for managing connections to music players.
 
 from __future__ import absolute_import
 
+import panflute.daemon.stats
+
 import dbus
 import dbus.exceptions
 import mateconf
@@ -41,6 +43,9 @@ class Connector (gobject.GObject):
     player, and indicate via a GObject property when one is available.  Upon
     request, they also create the instances of MPRIS interface objects to
     expose via D-Bus.
+
+    The stats attribute counts the work done for the player, and should be
+    shared with the MPRIS objects created for it.
     """
 
     __gproperties__ = {
@@ -79,6 +84,8 @@ class Connector (gobject.GObject):
             "icon-name": ""
         }
 
+        self.stats = panflute.daemon.stats.Counters ()
+
 
     def launch (self):
         """
@@ -138,6 +145,15 @@ class Connector (gobject.GObject):
         raise NotImplementedError
 
 
+    def queue_depths (self):
+        """
+        Get the number of requests waiting in each of the connector's queues,
+        for connectors that hand work off to other threads.
+        """
+
+        return {}
+
+
     def stop_polling (self):
         """
         Stop actively polling for a connection, if polling is needed.
@@ -237,6 +253,8 @@ class DBusConnector (Connector):
         setting the "connected" flag accordingly.
         """
 
+        self.stats.received ("NameOwnerChanged")
+
         # Treat ownership transfers as though the old owner quit and then
         # a new owner appeared.
         if new_owner != "":
@@ -325,6 +343,7 @@ class PollingConnector (Connector):
         Poll for a connection.
         """
 
+        self.stats.poll_tick ()
         self.try_connect ()
         return True
 
@@ -352,6 +371,7 @@ class MultiConnector (Connector):
         self.__active = None
 
         for child in children:
+            child.stats = self.stats
             child.connect ("notify::connected", self.__notify_connected_cb)
         self.__scan ()
 
@@ -385,6 +405,13 @@ class MultiConnector (Connector):
         return self.__active.player (**kwargs)
 
 
+    def queue_depths (self):
+        depths = {}
+        for child in self.__children:
+            depths.update (child.queue_depths ())
+        return depths
+
+
     def stop_polling (self):
         for child in self.__children:
             child.stop_polling ()
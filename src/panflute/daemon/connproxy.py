@@ -23,11 +23,15 @@ Classes for exposing Connector objects via D-Bus.
 
 from __future__ import absolute_import
 
+import panflute.daemon.stats
+
+import dbus
 import dbus.service
 
 
 CONNECTOR_INTERFACE = "org.kuliniewicz.Panflute.Connector"
 MANAGER_INTERFACE = "org.kuliniewicz.Panflute.Manager"
+STATS_INTERFACE = "org.kuliniewicz.Panflute.Stats"
 
 
 class ConnectorProxy (dbus.service.Object):
@@ -123,6 +127,9 @@ class ManagerProxy (dbus.service.Object):
     """
     The MPRIS object that exposes methods that fetch information about all the
     connectors.  By default, it will appear at /connectors.
+
+    The same object also offers the counters kept for each connector, via
+    a separate interface.
     """
 
     def __init__ (self, manager, **kwargs):
@@ -162,6 +169,58 @@ class ManagerProxy (dbus.service.Object):
         self.__manager.expose_by_name (name)
 
 
+    @dbus.service.method (dbus_interface = MANAGER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "a{sv}")
+    def GetStalls (self):
+        """
+        Get statistics on how often and for how long the daemon's main loop
+        has stalled, or nothing if the watchdog is turned off.
+
+        "counts" is a histogram of stall durations, with "bounds" giving the
+        upper bound in ms of each bucket except the last, which has none.
+        "recent" lists the time, duration in ms and culprit of the latest
+        stalls to exceed the logging "threshold".
+        """
+
+        watchdog = self.__manager.watchdog
+        if watchdog is None:
+            return dbus.Dictionary ({}, signature = "sv")
+
+        return dbus.Dictionary ({
+            "threshold": dbus.UInt32 (watchdog.threshold),
+            "bounds":    dbus.Array (watchdog.BUCKETS, signature = "u"),
+            "counts":    dbus.Array (watchdog.counts, signature = "u"),
+            "longest":   dbus.UInt32 (watchdog.longest),
+            "recent":    dbus.Array (watchdog.recent, signature = "(dus)")
+        }, signature = "sv")
+
+
+    @dbus.service.method (dbus_interface = MANAGER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "",
+                          sender_keyword = "sender")
+    def Hold (self, sender = None):
+        """
+        Keep the daemon running, even with no player to expose, until the
+        caller calls Release or leaves the bus.
+        """
+
+        self.__manager.hold (sender)
+
+
+    @dbus.service.method (dbus_interface = MANAGER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "",
+                          sender_keyword = "sender")
+    def Release (self, sender = None):
+        """
+        Let the daemon exit once idle, as far as the caller is concerned.
+        """
+
+        self.__manager.release (sender)
+
+
     @dbus.service.signal (dbus_interface = MANAGER_INTERFACE,
                           signature = "")
     def PreferredChanged (self):
@@ -170,3 +229,100 @@ class ManagerProxy (dbus.service.Object):
         """
 
         pass
+
+
+    @dbus.service.method (dbus_interface = STATS_INTERFACE,
+                          in_signature = "",
+                          out_signature = "a{sa{sv}}")
+    def Snapshot (self):
+        """
+        Get the current value of every counter, for each connector.
+
+        "calls" maps each MPRIS method to a histogram of how long the backend
+        took to carry it out, with "latency_bounds" giving the upper bound in
+        ms of each bucket except the last, which has none.  The cache
+        counters count updates to the cached "metadata", "status", "caps"
+        and polled "position", which are hits if nothing had changed.
+        "queue_depths" is the current number of requests waiting for each
+        of the connector's worker threads, if it has any.  "warm_size" is how
+        much the daemon's resident memory grew by, in kB, when the MPRIS
+        objects kept warm for the connector were created, or 0 if there are
+        none; "standby_wakeups" counts the polls and signals those objects
+        handled while they weren't the ones exposed.
+        """
+
+        result = {}
+        for (name, conn) in self.__manager.connectors.iteritems ():
+            stats = conn.stats
+            calls = dict ((method, dbus.Array (histogram, signature = "u"))
+                          for (method, histogram) in stats.calls.iteritems ())
+            result[name] = dbus.Dictionary ({
+                "latency_bounds":   dbus.Array (stats.LATENCY_BUCKETS, signature = "u"),
+                "calls":            dbus.Dictionary (calls, signature = "sau"),
+                "signals_received": dbus.Dictionary (stats.signals_received, signature = "su"),
+                "signals_emitted":  dbus.Dictionary (stats.signals_emitted, signature = "su"),
+                "poll_ticks":       dbus.UInt32 (stats.poll_ticks),
+                "cache_hits":       dbus.Dictionary (stats.cache_hits, signature = "su"),
+                "cache_misses":     dbus.Dictionary (stats.cache_misses, signature = "su"),
+                "reconnects":       dbus.UInt32 (stats.reconnects),
+                "warm_size":        dbus.UInt32 (stats.warm_size // 1024),
+                "standby_wakeups":  dbus.UInt32 (stats.standby_wakeups),
+                "queue_depths":     dbus.Dictionary (conn.queue_depths (), signature = "su")
+            }, signature = "sv")
+        return dbus.Dictionary (result, signature = "sa{sv}")
+
+
+    @dbus.service.method (dbus_interface = STATS_INTERFACE,
+                          in_signature = "",
+                          out_signature = "a{sv}")
+    def Resources (self):
+        """
+        Get how much the daemon has allocated: "rss" in kB, open "fds",
+        signal "matches" on the session bus, and live Python "objects" by
+        type.  Intended for spotting leaks, not for polling constantly,
+        since counting the objects means walking all of them.
+        """
+
+        res = panflute.daemon.stats.resources ()
+        return dbus.Dictionary ({
+            "rss":     dbus.UInt32 (res["rss"]),
+            "fds":     dbus.UInt32 (res["fds"]),
+            "matches": dbus.UInt32 (res["matches"]),
+            "objects": dbus.Dictionary (res["objects"], signature = "su")
+        }, signature = "sv")
+
+
+    @dbus.service.method (dbus_interface = STATS_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def StartProfiling (self):
+        """
+        Start profiling the daemon, if it isn't already being profiled.
+        """
+
+        self.__manager.profiler.start ()
+
+
+    @dbus.service.method (dbus_interface = STATS_INTERFACE,
+                          in_signature = "",
+                          out_signature = "s")
+    def StopProfiling (self):
+        """
+        Stop profiling the daemon, returning the name of the file the
+        profile was written to, or an empty string if it wasn't being
+        profiled.
+        """
+
+        return self.__manager.profiler.stop () or ""
+
+
+    @dbus.service.method (dbus_interface = STATS_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Reset (self):
+        """
+        Set every connector's counters back to zero.
+        """
+
+        for conn in self.__manager.connectors.values ():
+            conn.stats.reset ()
@@ -181,6 +181,7 @@ class Player (panflute.daemon.mpris.Player):
         of the status-of-everything string as it is.
         """
 
+        self.stats.poll_tick ()
         self.__exaile.query (reply_handler = self.__query_cb,
                              error_handler = self.log.warn)
         return True
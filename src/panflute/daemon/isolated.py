@@ -0,0 +1,793 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Host for running a connector in a separate process.
+
+Some players can only be talked to in ways that block: synchronous socket
+calls, spawning subprocesses, slow library initialization, or D-Bus calls
+into a player that has stopped responding.  A connector run through this
+module lives in a child process with a main loop of its own, so when it
+blocks, only the child stalls.
+
+The daemon and the child talk over a pair of pipes, one JSON-encoded list
+per line, the first element of which says what kind of message it is.  The
+child reports every change to the player's state, and the daemon answers
+clients out of its copy of that state without ever waiting on the child.
+Commands are passed along without waiting for them to be carried out.
+
+If the child exits or stops answering pings, it gets killed and restarted,
+waiting longer each time it fails again soon after being started.
+
+Running this module as a program starts the child side for the connector
+in the named panflute.daemon module.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.daemon.connector
+import panflute.daemon.mpris
+import panflute.mpris
+
+import dbus.mainloop.glib
+import errno
+import fcntl
+import gobject
+import importlib
+import json
+import logging
+import os
+import os.path
+import signal
+import subprocess
+import sys
+import time
+
+
+class Channel (object):
+    """
+    One end of the pair of pipes between the daemon and a child.
+
+    Neither reading nor writing ever blocks.  Messages the pipe won't take
+    yet are kept until it will, up to a limit past which the other end is
+    assumed to be hopelessly stuck.
+    """
+
+    from panflute.util import log
+
+    MAX_BACKLOG = 1024 * 1024
+
+
+    def __init__ (self, read_fd, write_fd, message_cb, closed_cb):
+        self.__read_fd = read_fd
+        self.__write_fd = write_fd
+        self.__message_cb = message_cb
+        self.__closed_cb = closed_cb
+        self.__incoming = ""
+        self.__outgoing = ""
+        self.__write_source = None
+
+        for fd in [read_fd, write_fd]:
+            flags = fcntl.fcntl (fd, fcntl.F_GETFL)
+            fcntl.fcntl (fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self.__read_source = gobject.io_add_watch (read_fd, gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR,
+                                                   self.__readable_cb)
+
+
+    def send (self, kind, *args):
+        """
+        Send a message to the other end, if it's still there.
+        """
+
+        if self.__read_source is None:
+            return
+
+        self.__outgoing += json.dumps ([kind] + list (args), separators = (",", ":")) + "\n"
+        if len (self.__outgoing) > self.MAX_BACKLOG:
+            self.log.warn ("Other end isn't reading its messages")
+            self.__shut ()
+        elif self.__write_source is None and self.__flush ():
+            self.__write_source = gobject.io_add_watch (self.__write_fd, gobject.IO_OUT | gobject.IO_HUP | gobject.IO_ERR,
+                                                        self.__writable_cb)
+
+
+    def close (self):
+        """
+        Stop watching the pipes.  Closing the file descriptors themselves is
+        left to whoever opened them.
+        """
+
+        if self.__read_source is not None:
+            gobject.source_remove (self.__read_source)
+            self.__read_source = None
+        if self.__write_source is not None:
+            gobject.source_remove (self.__write_source)
+            self.__write_source = None
+
+
+    def __shut (self):
+        """
+        Give up on the other end.
+        """
+
+        if self.__read_source is not None:
+            self.close ()
+            self.__closed_cb ()
+
+
+    def __flush (self):
+        """
+        Write as much of the backlog as the pipe will take, returning whether
+        any of it is left.
+        """
+
+        try:
+            written = os.write (self.__write_fd, self.__outgoing)
+            self.__outgoing = self.__outgoing[written:]
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                self.__shut ()
+                return False
+        return self.__outgoing != ""
+
+
+    def __writable_cb (self, fd, condition):
+        """
+        Write more of the backlog, now that there's room for it.
+        """
+
+        if self.__flush ():
+            return True
+        else:
+            self.__write_source = None
+            return False
+
+
+    def __readable_cb (self, fd, condition):
+        """
+        Read whatever has arrived and hand over each complete message.
+        """
+
+        try:
+            data = os.read (fd, 4096)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return True
+            data = ""
+
+        if data == "":
+            self.__shut ()
+            return False
+
+        lines = (self.__incoming + data).split ("\n")
+        self.__incoming = lines.pop ()
+        for line in lines:
+            try:
+                message = json.loads (line)
+            except ValueError, e:
+                self.log.warn ("Garbled message \"{0}\": {1}".format (line, e))
+                continue
+            self.__message_cb (*message)
+            if self.__read_source is None:
+                return False
+        return True
+
+
+##############################################################################
+
+
+class Connector (panflute.daemon.connector.Connector):
+    """
+    Connector standing in for one run in a child process.
+
+    While the child reports the player as connected, the mirrored state of
+    its Player object is kept in the state attribute, for the daemon-side
+    Player objects to start from.
+    """
+
+    from panflute.util import log
+
+    PING_INTERVAL = 2000
+    HANG_TIMEOUT = 10000
+
+    MIN_RESTART_DELAY = 1000
+    MAX_RESTART_DELAY = 60000
+    STABLE_TIME = 60000
+
+
+    def __init__ (self, module_name, internal_name, display_name):
+        panflute.daemon.connector.Connector.__init__ (self, internal_name, display_name)
+        self.__module_name = module_name
+        self.__should_poll = False
+        self.__players = []
+        self.state = None
+
+        self.__child = None
+        self.__channel = None
+        self.__ping_source = None
+        self.__restart_source = None
+        self.__restart_delay = self.MIN_RESTART_DELAY
+        self.__started = 0
+        self.__last_pong = 0
+
+        self.__spawn ()
+
+
+    def launch (self):
+        if self.__channel is not None:
+            self.__channel.send ("launch")
+            return True
+        else:
+            return panflute.daemon.connector.Connector.launch (self)
+
+
+    def root (self, **kwargs):
+        return Root (self, **kwargs)
+
+
+    def track_list (self, **kwargs):
+        # Nothing in the daemon does more than the defaults, and the methods
+        # that return a value can't be answered without waiting on the child.
+        return panflute.daemon.mpris.TrackList (**kwargs)
+
+
+    def player (self, **kwargs):
+        return Player (self, **kwargs)
+
+
+    def stop_polling (self):
+        self.__should_poll = False
+        if self.__channel is not None:
+            self.__channel.send ("polling", False)
+
+
+    def resume_polling (self):
+        self.__should_poll = True
+        if self.__channel is not None:
+            self.__channel.send ("polling", True)
+
+
+    def add_player (self, player):
+        """
+        Have a daemon-side Player object told about every change the child
+        reports.
+        """
+
+        self.__players.append (player)
+
+
+    def remove_player (self, player):
+        """
+        Stop telling a Player object about changes.
+        """
+
+        if player in self.__players:
+            self.__players.remove (player)
+
+
+    def call (self, target, method, *args):
+        """
+        Call a method on the child's "root" or "player" object, without
+        waiting for it to finish.
+        """
+
+        if self.__channel is not None:
+            self.__channel.send ("call", target, method, *args)
+
+
+    def query (self, what):
+        """
+        Ask the child to report the current "position" or "volume".
+        """
+
+        if self.__channel is not None:
+            self.__channel.send ("query", what)
+
+
+    def __spawn (self):
+        """
+        Start the child process.
+        """
+
+        self.__restart_source = None
+        self.log.debug ("Starting the {0} backend".format (self.props.internal_name))
+
+        # The child has to be able to import panflute from wherever this copy
+        # of it came from.
+        env = dict (os.environ)
+        top = os.path.dirname (os.path.dirname (os.path.dirname (os.path.abspath (__file__))))
+        path = [top]
+        if "PYTHONPATH" in env:
+            path.append (env["PYTHONPATH"])
+        env["PYTHONPATH"] = os.pathsep.join (path)
+
+        level = logging.getLogger ("panflute").getEffectiveLevel ()
+        self.__child = subprocess.Popen ([sys.executable, "-m", __name__, self.__module_name, str (level)],
+                                         stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                                         close_fds = True, env = env)
+        self.__channel = Channel (self.__child.stdout.fileno (), self.__child.stdin.fileno (),
+                                  self.__message_cb, self.__closed_cb)
+
+        self.__started = time.time ()
+        self.__last_pong = self.__started
+        self.__ping_source = gobject.timeout_add (self.PING_INTERVAL, self.__ping_cb)
+
+        if self.__should_poll:
+            self.__channel.send ("polling", True)
+
+
+    def __stop_child (self):
+        """
+        Kill the child process, if it isn't dead already.
+        """
+
+        if self.__ping_source is not None:
+            gobject.source_remove (self.__ping_source)
+            self.__ping_source = None
+
+        self.__channel.close ()
+        self.__channel = None
+
+        try:
+            self.__child.kill ()
+        except OSError:
+            pass
+        self.__child.wait ()
+        self.__child.stdin.close ()
+        self.__child.stdout.close ()
+        self.__child = None
+
+
+    def __child_lost (self):
+        """
+        Clean up after the child exits or hangs, and start a new one once it
+        has had time to recover from whatever went wrong.
+        """
+
+        self.__stop_child ()
+        if self.props.connected:
+            self.props.connected = False
+        self.state = None
+
+        if (time.time () - self.__started) * 1000 >= self.STABLE_TIME:
+            self.__restart_delay = self.MIN_RESTART_DELAY
+
+        self.log.info ("Restarting the {0} backend in {1} ms".format (self.props.internal_name,
+                                                                      self.__restart_delay))
+        self.__restart_source = gobject.timeout_add (self.__restart_delay, self.__restart_cb)
+        self.__restart_delay = min (self.__restart_delay * 2, self.MAX_RESTART_DELAY)
+
+
+    def __restart_cb (self):
+        """
+        Start the replacement child.
+        """
+
+        self.__spawn ()
+        return False
+
+
+    def __closed_cb (self):
+        """
+        Called when the child goes away on its own.
+        """
+
+        self.log.warn ("The {0} backend exited".format (self.props.internal_name))
+        self.__child_lost ()
+
+
+    def __ping_cb (self):
+        """
+        Make sure the child is still answering, and ping it again.
+        """
+
+        if (time.time () - self.__last_pong) * 1000 > self.HANG_TIMEOUT:
+            self.log.warn ("The {0} backend stopped responding".format (self.props.internal_name))
+            self.__ping_source = None
+            self.__child_lost ()
+            return False
+
+        self.__channel.send ("ping")
+        return True
+
+
+    def __message_cb (self, kind, *args):
+        """
+        Handle a message from the child.
+        """
+
+        if kind == "pong":
+            self.__last_pong = time.time ()
+        elif kind == "hello":
+            self.props.icon_name = args[0]
+        elif kind == "state":
+            # The child only sends this when it has just created its MPRIS
+            # objects, so anything mirroring the old ones has to start over.
+            self.state = args[0]
+            for player in self.__players:
+                player.reset (self.state)
+        elif kind == "connected":
+            if not args[0]:
+                self.state = None
+            if args[0] != self.props.connected and (self.state is not None or not args[0]):
+                self.props.connected = args[0]
+        elif self.state is not None:
+            self.__forward (kind, args[0])
+
+
+    def __forward (self, kind, value):
+        """
+        Record a change to the player's state and tell the Player objects.
+        """
+
+        (key, method) = {
+            "track":    ("metadata", "track_changed"),
+            "status":   ("status",   "status_changed"),
+            "caps":     ("caps",     "caps_changed"),
+            "volume":   ("volume",   "volume_changed"),
+            "position": ("position", "position_changed"),
+            "feature":  (None,       "feature_added")
+        }[kind]
+
+        if key is not None:
+            self.state[key] = value
+        elif value not in self.state["features"]:
+            self.state["features"].append (value)
+
+        for player in self.__players:
+            getattr (player, method) (value)
+
+
+gobject.type_register (Connector)
+
+
+##############################################################################
+
+
+class Root (panflute.daemon.mpris.Root):
+    """
+    Root MPRIS object for a connector run in a child process.
+    """
+
+    def __init__ (self, connector, **kwargs):
+        panflute.daemon.mpris.Root.__init__ (self, connector.props.display_name, **kwargs)
+        self.__conn = connector
+
+
+    def do_Quit (self):
+        self.__conn.call ("root", "Quit")
+
+
+##############################################################################
+
+
+class Player (panflute.daemon.mpris.Player):
+    """
+    Player MPRIS object mirroring the one in a child process.
+
+    The position is extrapolated from the last one the child reported,
+    asking it for a fresh one every time it's read, so that polling keeps
+    the estimate from drifting.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, connector, **kwargs):
+        panflute.daemon.mpris.Player.__init__ (self, **kwargs)
+        self.__conn = connector
+        self.reset (connector.state)
+        connector.add_player (self)
+
+
+    def remove_from_connection (self):
+        self.__conn.remove_player (self)
+        panflute.daemon.mpris.Player.remove_from_connection (self)
+
+
+    def do_Next (self):
+        self.__conn.call ("player", "Next")
+
+
+    def do_Prev (self):
+        self.__conn.call ("player", "Prev")
+
+
+    def do_Pause (self):
+        self.__conn.call ("player", "Pause")
+
+
+    def do_Stop (self):
+        self.__conn.call ("player", "Stop")
+
+
+    def do_Play (self):
+        self.__conn.call ("player", "Play")
+
+
+    def do_Repeat (self, repeat):
+        self.__conn.call ("player", "Repeat", repeat)
+
+
+    def do_SetMetadata (self, name, value):
+        self.__conn.call ("player", "SetMetadata", name, value)
+
+
+    def do_VolumeSet (self, volume):
+        self.__volume = volume
+        self.__conn.call ("player", "VolumeSet", volume)
+
+
+    def do_VolumeGet (self):
+        self.__conn.query ("volume")
+        return self.__volume
+
+
+    def do_PositionSet (self, position):
+        self.__sample_position (position)
+        self.__conn.call ("player", "PositionSet", position)
+
+
+    def do_PositionGet (self):
+        self.__conn.query ("position")
+        return self.__current_position ()
+
+
+    ##########################################################################
+    #
+    # Changes reported by the child
+    #
+    ##########################################################################
+
+
+    def reset (self, state):
+        """
+        Take on the entire state of the child's Player object.
+        """
+
+        for feature in state["features"]:
+            self.feature_added (feature)
+        self.__volume = state["volume"]
+        self.__sample_position (state["position"])
+
+        self.cached_caps.all = state["caps"]
+        self.status_changed (state["status"])
+        self.cached_metadata = state["metadata"]
+
+
+    def track_changed (self, metadata):
+        if not panflute.daemon.mpris.is_same_track (self.cached_metadata, metadata):
+            self.__sample_position (0)
+        self.cached_metadata = metadata
+
+
+    def status_changed (self, status):
+        # Restart extrapolation from where playback was when it stopped or
+        # started moving.
+        self.__sample_position (self.__current_position ())
+        self.cached_status = status
+
+        if status[panflute.mpris.STATUS_STATE] == panflute.mpris.STATE_PLAYING:
+            self.start_polling_for_time ()
+        else:
+            self.stop_polling_for_time ()
+
+
+    def caps_changed (self, caps):
+        self.cached_caps.all = caps
+
+
+    def volume_changed (self, volume):
+        self.__volume = volume
+
+
+    def position_changed (self, position):
+        self.__sample_position (position)
+
+
+    def feature_added (self, feature):
+        if not self.do_Supports (feature):
+            self.register_feature (feature)
+
+
+    ##########################################################################
+    #
+    # Internals
+    #
+    ##########################################################################
+
+
+    def __sample_position (self, position):
+        """
+        Note where playback was just now.
+        """
+
+        self.__position = position
+        self.__position_time = time.time ()
+
+
+    def __current_position (self):
+        """
+        Estimate where playback is now.
+        """
+
+        if self.cached_status.state != panflute.mpris.STATE_PLAYING:
+            return self.__position
+
+        position = self.__position + int ((time.time () - self.__position_time) * 1000)
+        length = self.cached_metadata.get ("mtime", 0)
+        if length > 0:
+            position = min (position, length)
+        return position
+
+
+##############################################################################
+
+
+class Host (object):
+    """
+    The child side: runs the real connector, reports everything that
+    happens to it, and carries out what the daemon asks for.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, conn, read_fd, write_fd, mainloop):
+        self.__conn = conn
+        self.__mainloop = mainloop
+        self.__root = None
+        self.__player = None
+
+        self.__channel = Channel (read_fd, write_fd, self.__message_cb, self.__closed_cb)
+        self.__channel.send ("hello", conn.props.icon_name)
+
+        conn.connect ("notify::connected", self.__notify_connected_cb)
+        if conn.props.connected:
+            self.__notify_connected_cb (conn, None)
+
+
+    def __notify_connected_cb (self, conn, pspec):
+        """
+        Create or destroy the MPRIS objects as the player comes and goes,
+        sending their initial state before saying the player is there.
+        """
+
+        if self.__player is not None:
+            self.__player.remove_watcher (self)
+            self.__player.remove_from_connection ()
+            self.__root.remove_from_connection ()
+            self.__player = None
+            self.__root = None
+
+        if conn.props.connected:
+            self.__root = conn.root ()
+            self.__player = conn.player ()
+            self.__player.add_watcher (self)
+
+            snapshot = self.__player.GetSnapshot ()
+            self.__channel.send ("state", dict ((key, snapshot[key]) for key in
+                                                ["caps", "status", "metadata", "volume", "position", "features"]))
+
+        self.__channel.send ("connected", conn.props.connected)
+
+
+    def __closed_cb (self):
+        """
+        The daemon has gone away, so there's nothing left to do.
+        """
+
+        self.__mainloop.quit ()
+
+
+    def __message_cb (self, kind, *args):
+        """
+        Handle a message from the daemon.
+        """
+
+        if kind == "ping":
+            self.__channel.send ("pong")
+        elif kind == "polling":
+            if args[0]:
+                self.__conn.resume_polling ()
+            else:
+                self.__conn.stop_polling ()
+        elif kind == "launch":
+            self.__conn.launch ()
+        elif kind == "call":
+            target = {"root": self.__root, "player": self.__player}[args[0]]
+            if target is not None:
+                try:
+                    getattr (target, args[1]) (*args[2:])
+                except Exception, e:
+                    self.log.warn ("{0} failed: {1}".format (args[1], e))
+        elif kind == "query" and self.__player is not None:
+            if args[0] == "position":
+                self.__channel.send ("position", self.__player.PositionGet ())
+            elif args[0] == "volume" and self.__player.Supports ("VolumeGet"):
+                self.__channel.send ("volume", self.__player.VolumeGet ())
+
+
+    ##########################################################################
+    #
+    # Watching the Player
+    #
+    ##########################################################################
+
+
+    def track_changed (self, metadata):
+        self.__channel.send ("track", metadata)
+
+
+    def status_changed (self, status):
+        self.__channel.send ("status", status)
+
+
+    def caps_changed (self, caps):
+        self.__channel.send ("caps", caps)
+
+
+    def volume_changed (self, volume):
+        self.__channel.send ("volume", volume)
+
+
+    def position_changed (self, position):
+        self.__channel.send ("position", position)
+
+
+    def seeked (self, position):
+        self.__channel.send ("position", position)
+
+
+    def feature_added (self, feature):
+        self.__channel.send ("feature", feature)
+
+
+##############################################################################
+
+
+def main (module_name, log_level):
+    """
+    Run the child side for the connector in a panflute.daemon module.
+    """
+
+    logging.basicConfig (stream = sys.stderr,
+                         level = log_level,
+                         format = "%(levelname)s [%(name)s] %(message)s")
+
+    # The daemon decides when the child should exit.
+    signal.signal (signal.SIGINT, signal.SIG_IGN)
+
+    dbus.mainloop.glib.DBusGMainLoop (set_as_default = True)
+    gobject.threads_init ()
+
+    # Anything the connector or its subprocesses print has to go somewhere
+    # other than the middle of a message.
+    write_fd = os.dup (1)
+    os.dup2 (2, 1)
+
+    module = importlib.import_module ("panflute.daemon.{0}".format (module_name))
+    mainloop = gobject.MainLoop ()
+    Host (module.Connector (), 0, write_fd, mainloop)
+    mainloop.run ()
+
+
+if __name__ == "__main__":
+    main (sys.argv[1], int (sys.argv[2]))
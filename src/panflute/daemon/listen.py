@@ -163,6 +163,7 @@ class Player (panflute.daemon.mpris.Player):
         Poll for assorted information.
         """
 
+        self.stats.poll_tick ()
         self.__player.playing (reply_handler = self.__playing_cb,
                                error_handler = self.log.warn)
 
@@ -26,27 +26,23 @@ translating the player's native RPC interface to MPRIS.
 
 from __future__ import absolute_import
 
-import panflute.daemon.amarok
-import panflute.daemon.audacious
-import panflute.daemon.banshee
-import panflute.daemon.clementine
 import panflute.daemon.connproxy
-import panflute.daemon.decibel
-import panflute.daemon.exaile
-import panflute.daemon.guayadeque
-import panflute.daemon.listen
-import panflute.daemon.muine
-import panflute.daemon.pithos
-import panflute.daemon.qmmp
-import panflute.daemon.quodlibet
-import panflute.daemon.rhythmbox
-import panflute.daemon.songbird
-import panflute.daemon.vlc
+import panflute.daemon.isolated
+import panflute.daemon.mpris2
+import panflute.profiler
+import panflute.trace
+import panflute.util
+import panflute.watchdog
 
 import dbus
 import dbus.service
+import gobject
+import importlib
+import json
 import mateconf
+import os.path
 import sys
+import time
 
 
 class Manager (object):
@@ -56,67 +52,138 @@ class Manager (object):
 
     from panflute.util import log
 
-
-    def __init__ (self):
+    # Every supported player: the panflute.daemon module implementing it,
+    # whether that module depends on something that might not be installed,
+    # and the internal and display names of its connector.  The names are
+    # needed up front for players run in a separate process.
+
+    PLAYERS = [
+        ("rhythmbox",  False, "rhythmbox",  "Rhythmbox"),
+        ("banshee",    False, "banshee",    "Banshee"),
+        ("amarok",     False, "amarok",     "Amarok"),
+        ("audacious",  False, "audacious",  "Audacious"),
+        ("clementine", False, "clementine", "Clementine"),
+        ("decibel",    False, "decibel",    "Decibel"),
+        ("exaile",     False, "exaile",     "Exaile"),
+        ("guayadeque", False, "guayadeque", "Guayadeque"),
+        ("listen",     False, "listen",     "Listen"),
+        ("muine",      False, "muine",      "Muine"),
+        ("pithos",     False, "pithos",     "Pithos"),
+        ("qmmp",       False, "qmmp",       "Qmmp"),
+        ("quodlibet",  False, "quod_libet", "Quod Libet"),
+        ("songbird",   False, "songbird",   "Songbird"),
+        ("vlc",        False, "vlc",        "VLC"),
+        ("moc",        True,  "moc",        "MOC"),
+        ("mpd",        True,  "mpd",        "MPD"),
+        ("xmms",       True,  "xmms",       "XMMS"),
+        ("xmms2",      True,  "xmms2",      "XMMS2")
+    ]
+
+
+    # How long to wait after a change before saving the state, in seconds.
+    SAVE_DELAY = 10
+
+
+    def __init__ (self, idle_exit_cb = None):
         self.connectors = {}
         self.__proxies = {}
+        self.__holders = {}
+        self.__idle_exit_cb = idle_exit_cb
+        self.__idle_source = None
+        self.__save_source = None
+        self.__state = load_state ()
+        if not isinstance (self.__state.get ("snapshots"), dict):
+            self.__state["snapshots"] = {}
+
+        with panflute.trace.startup_phase ("bus name"):
+            bus = dbus.SessionBus ()
+            self.__panflute_bus_name = dbus.service.BusName ("org.kuliniewicz.Panflute", bus)
+
+        with panflute.trace.startup_phase ("MateConf"):
+            client = mateconf.client_get_default ()
+            client.add_dir ("/apps/panflute/daemon", mateconf.CLIENT_PRELOAD_NONE)
+            self.__export_all = client.get_bool ("/apps/panflute/daemon/export_all_players")
+            self.__idle_exit = client.get_int ("/apps/panflute/daemon/idle_exit")
+            isolated = client.get_list ("/apps/panflute/daemon/isolated_players", mateconf.VALUE_STRING)
+
+            threshold = client.get_int ("/apps/panflute/daemon/stall_threshold")
+            if threshold > 0:
+                self.watchdog = panflute.watchdog.Watchdog (threshold)
+            else:
+                self.watchdog = None
+
+        self.profiler = panflute.profiler.Profiler ("daemon")
+        self.profiler.toggle_on_signal ()
+
+        # Connectors depending on optional libraries are slow to import and
+        # rarely used, so they're only loaded once the main loop is running
+        # and the daemon can already answer its first callers.
+
+        deferred = []
+        for (module_name, optional, internal_name, display_name) in self.PLAYERS:
+            if optional and internal_name not in isolated:
+                deferred.append ((module_name, internal_name, display_name))
+            else:
+                self.__load_connector (module_name, optional, internal_name, display_name, internal_name in isolated)
 
-        bus = dbus.SessionBus ()
-        self.__panflute_bus_name = dbus.service.BusName ("org.kuliniewicz.Panflute", bus)
-
-        self.__register_connector (panflute.daemon.rhythmbox.Connector ())
-        self.__register_connector (panflute.daemon.banshee.Connector ())
-        self.__register_connector (panflute.daemon.amarok.Connector ())
-        self.__register_connector (panflute.daemon.audacious.Connector ())
-        self.__register_connector (panflute.daemon.clementine.Connector ())
-        self.__register_connector (panflute.daemon.decibel.Connector ())
-        self.__register_connector (panflute.daemon.exaile.Connector ())
-        self.__register_connector (panflute.daemon.guayadeque.Connector ())
-        self.__register_connector (panflute.daemon.listen.Connector ())
-        self.__register_connector (panflute.daemon.muine.Connector ())
-        self.__register_connector (panflute.daemon.pithos.Connector ())
-        self.__register_connector (panflute.daemon.qmmp.Connector ())
-        self.__register_connector (panflute.daemon.quodlibet.Connector ())
-        self.__register_connector (panflute.daemon.songbird.Connector ())
-        self.__register_connector (panflute.daemon.vlc.Connector ())
+        self.__manager_proxy = panflute.daemon.connproxy.ManagerProxy (self, bus_name = self.__panflute_bus_name)
 
-        try:
-            import panflute.daemon.moc as moc
-            self.__register_connector (moc.Connector ())
-        except Exception, e:
-            self.log.info ("Failed to load MOC connector: {0}".format (e))
+        with panflute.trace.startup_phase ("preferred player"):
+            client.notify_add ("/apps/panflute/daemon/preferred_player", self.__preferred_player_changed_cb)
+            preferred = client.get_string ("/apps/panflute/daemon/preferred_player")
+            if preferred not in [internal_name for (module_name, internal_name, display_name) in deferred]:
+                self.__expose_preferred (preferred)
 
-        try:
-            import panflute.daemon.mpd as mpd
-            self.__register_connector (mpd.Connector ())
-        except Exception, e:
-            self.log.info ("Failed to load MPD connector: {0}".format (e))
+        self.__live = None
+        self.__media_player2 = None
+        self.__warm = {}
 
-        try:
-            import panflute.daemon.xmms as xmms
-            self.__register_connector (xmms.Connector ())
-        except Exception, e:
-            self.log.info ("Failed to load XMMS connector: {0}".format (e))
+        with panflute.trace.startup_phase ("scan for connected"):
+            self.__scan_for_connected ()
 
-        try:
-            import panflute.daemon.xmms2 as xmms2
-            self.__register_connector (xmms2.Connector ())
-        except Exception, e:
-            self.log.info ("Failed to load XMMS2 connector: {0}".format (e))
+        if len (deferred) > 0:
+            gobject.idle_add (self.__load_deferred_cb, deferred)
+        self.__check_idle ()
 
-        self.__manager_proxy = panflute.daemon.connproxy.ManagerProxy (self, bus_name = self.__panflute_bus_name)
 
-        client = mateconf.client_get_default ()
-        client.add_dir ("/apps/panflute/daemon", mateconf.CLIENT_PRELOAD_NONE)
-        client.notify_add ("/apps/panflute/daemon/preferred_player", self.__preferred_player_changed_cb)
-        self.__expose_preferred (client.get_string ("/apps/panflute/daemon/preferred_player"))
+    def __load_connector (self, module_name, optional, internal_name, display_name, isolated):
+        """
+        Create and register the connector for a player.  Failing to load an
+        optional one isn't an error.
+        """
 
-        self.__live = None
-        self.__root = None
-        self.__track_list = None
-        self.__player = None
+        with panflute.trace.startup_phase ("{0} connector".format (display_name)):
+            if isolated:
+                self.log.debug ("running {0} in a separate process".format (internal_name))
+                conn = panflute.daemon.isolated.Connector (module_name, internal_name, display_name)
+            elif optional:
+                try:
+                    conn = importlib.import_module ("panflute.daemon.{0}".format (module_name)).Connector ()
+                except Exception, e:
+                    self.log.info ("Failed to load {0} connector: {1}".format (display_name, e))
+                    return
+            else:
+                conn = importlib.import_module ("panflute.daemon.{0}".format (module_name)).Connector ()
+            self.__register_connector (conn)
+
+
+    def __load_deferred_cb (self, deferred):
+        """
+        Load the connectors put off until the main loop started, then expose
+        the preferred player if it was one of them, and anything that's
+        already connected.
+        """
 
-        self.__scan_for_connected ()
+        for (module_name, internal_name, display_name) in deferred:
+            self.__load_connector (module_name, True, internal_name, display_name, False)
+
+        if not self.__proxies.has_key ("preferred"):
+            client = mateconf.client_get_default ()
+            self.__expose_preferred (client.get_string ("/apps/panflute/daemon/preferred_player"))
+        if self.__live is None:
+            self.__scan_for_connected ()
+
+        return False
 
 
     def __register_connector (self, conn):
@@ -130,6 +197,8 @@ class Manager (object):
 
         conn.resume_polling ()
         conn.connect ("notify::connected", self.__notify_connected_cb)
+        if conn.props.connected:
+            conn.stats.connected ()
 
 
     def __preferred_player_changed_cb (self, client, id, entry, unused):
@@ -163,17 +232,119 @@ class Manager (object):
 
 
 
+    def hold (self, client):
+        """
+        Keep the daemon from exiting while idle for as long as the client,
+        a unique bus name, stays on the bus or until it lets go.
+        """
+
+        if client not in self.__holders:
+            self.log.debug ("held by {0}".format (client))
+            bus = dbus.SessionBus ()
+            proxy = bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+            match = dbus.Interface (proxy, "org.freedesktop.DBus").connect_to_signal (
+                        "NameOwnerChanged", self.__holder_owner_changed_cb, arg0 = client)
+            self.__holders[client] = match
+        self.__check_idle ()
+
+
+    def release (self, client):
+        """
+        Stop letting a client keep the daemon from exiting.
+        """
+
+        match = self.__holders.pop (client, None)
+        if match is not None:
+            self.log.debug ("released by {0}".format (client))
+            match.remove ()
+        self.__check_idle ()
+
+
+    def __holder_owner_changed_cb (self, name, old_owner, new_owner):
+        """
+        Let go of a client that left the bus without releasing the daemon.
+        """
+
+        if new_owner == "":
+            self.release (name)
+
+
+    def __check_idle (self):
+        """
+        Start counting down to exiting if nothing is exposed and no client is
+        holding on to the daemon, or stop counting down if that changed.
+        """
+
+        idle = self.__live is None and len (self.__holders) == 0
+        if idle and self.__idle_source is None and self.__idle_exit > 0 and self.__idle_exit_cb is not None:
+            self.log.debug ("idle; exiting in {0} s unless something happens".format (self.__idle_exit))
+            self.__idle_source = gobject.timeout_add_seconds (self.__idle_exit, self.__idle_exit_timeout_cb)
+        elif not idle and self.__idle_source is not None:
+            gobject.source_remove (self.__idle_source)
+            self.__idle_source = None
+
+
+    def __idle_exit_timeout_cb (self):
+        """
+        Save what's worth remembering and exit, since nothing has needed the
+        daemon for a while.  D-Bus activation starts it again when something
+        does.
+        """
+
+        self.__idle_source = None
+        self.log.info ("Exiting after {0} s idle".format (self.__idle_exit))
+        if self.__save_source is not None:
+            gobject.source_remove (self.__save_source)
+        self.__save_cb ()
+        self.__idle_exit_cb ()
+        return False
+
+
+    def __schedule_save (self):
+        """
+        Save the state a little while from now, so that a burst of changes
+        only leads to one write.
+        """
+
+        if self.__save_source is None:
+            self.__save_source = gobject.timeout_add_seconds (self.SAVE_DELAY, self.__save_cb)
+
+
+    def __save_cb (self):
+        """
+        Save the state, including a fresh snapshot of every warm player
+        whose state is its own and not just what was restored.
+        """
+
+        self.__save_source = None
+        for (name, warm) in self.__warm.iteritems ():
+            if not warm.player.provisional:
+                self.__state["snapshots"][name] = warm.player.snapshot ()
+        try:
+            save_state (self.__state)
+        except IOError, e:
+            self.log.warn ("Couldn't save state: {0}".format (e))
+        return False
+
+
     def __scan_for_connected (self):
         """
-        Scan through the list of possible connections and expose the first one
-        that actually is connected right now.
+        Scan through the list of possible connections, warming up every one
+        that is connected and exposing the first one found.
         """
 
         self.log.debug ("scanning for connected players")
-        for conn in self.connectors.values ():
+
+        # Go back to whatever was exposed when the daemon last exited, if
+        # it's still around.
+        last_live = self.__state.get ("last_live")
+        conns = sorted (self.connectors.values (), key = lambda conn: conn.props.internal_name != last_live)
+
+        for conn in conns:
             if conn.props.connected:
-                self.__expose (conn)
-                break
+                self.__warm_up (conn)
+                if self.__live is None:
+                    self.__expose (conn)
 
 
     def expose_by_name (self, name):
@@ -185,8 +356,45 @@ class Manager (object):
             conn = self.connectors[name]
             if conn.props.connected:
                 self.log.debug ("explicitly exposing {0}".format (name))
+                start = time.time ()
                 self.__withdraw ()
                 self.__expose (conn)
+                self.log.debug ("switched to {0} in {1:.1f} ms".format (name, (time.time () - start) * 1000))
+
+
+    def __warm_up (self, conn):
+        """
+        Create the MPRIS objects for a connected player, if they don't already
+        exist, and park them where clients won't be looking for them.
+        """
+
+        name = conn.props.internal_name
+        if name not in self.__warm:
+            start = time.time ()
+            rss = panflute.util.get_resident_size ()
+            self.__warm[name] = WarmPlayer (conn, self.__export_all, self.__state["snapshots"].get (name))
+            self.__warm[name].player.add_watcher (SnapshotWatcher (self.__schedule_save))
+            growth = panflute.util.get_resident_size () - rss
+            conn.stats.warmed (growth)
+            self.log.debug ("warmed up {0} in {1:.1f} ms, resident size grew by {2} KiB".format (
+                name, (time.time () - start) * 1000, growth // 1024))
+        return self.__warm[name]
+
+
+    def __cool_down (self, conn):
+        """
+        Destroy the MPRIS objects for a player that is no longer connected.
+        """
+
+        name = conn.props.internal_name
+        if name in self.__warm:
+            self.log.debug ("cooling down {0}".format (name))
+            warm = self.__warm.pop (name)
+            if not warm.player.provisional:
+                self.__state["snapshots"][name] = warm.player.snapshot ()
+                self.__schedule_save ()
+            warm.destroy ()
+            conn.stats.cooled ()
 
 
     def __expose (self, conn):
@@ -196,63 +404,63 @@ class Manager (object):
 
         assert (conn.props.connected)
         assert (self.__live is None)
-        assert (self.__root is None)
-        assert (self.__track_list is None)
-        assert (self.__player is None)
+        assert (self.__media_player2 is None)
 
         self.log.debug ("exposing {0}".format (conn.props.internal_name))
 
         for other_conn in self.connectors.values ():
             other_conn.stop_polling ()
 
+        warm = self.__warm_up (conn)
+
         # By only acquiring the bus name here, org.mpris.panflute will only
-        # exist if a player is available.  Explcitly requesting the bus name
-        # is needed if this isn't the first time we've created the BusName
-        # object; otherwise the dbus library won't request it automatically.
+        # exist if a player is available.
 
-        bus = dbus.SessionBus ()
-        bus_name = dbus.service.BusName ("org.mpris.panflute", bus)
-        bus.request_name ("org.mpris.panflute")
+        warm.bind_live ()
         self.__live = conn
 
-        self.__player = conn.player (object_path = "/Player", bus_name = bus_name)
-        self.__track_list = conn.track_list (object_path = "/TrackList", bus_name = bus_name)
-        self.__root = conn.root (object_path = "/", bus_name = bus_name)
+        bus = dbus.SessionBus ()
+        mpris2_bus_name = dbus.service.BusName (panflute.daemon.mpris2.BUS_NAME, bus)
+        self.__media_player2 = panflute.daemon.mpris2.MediaPlayer2 (conn.props.display_name,
+                                                                    warm.root, warm.track_list, warm.player,
+                                                                    bus_name = mpris2_bus_name)
+
+        self.__state["last_live"] = conn.props.internal_name
+        self.__check_idle ()
 
 
     def __withdraw (self):
         """
-        Stop exposing anything via Panflute's D-Bus interface.
+        Stop exposing anything via Panflute's D-Bus interface.  The objects
+        for the player stay around, ready to be exposed again.
         """
 
         assert (self.__live is not None)
-        assert (self.__root is not None)
-        assert (self.__track_list is not None)
-        assert (self.__player is not None)
-
-        self.log.debug ("withdrawing {0}".format (self.__live.props.internal_name))
+        assert (self.__media_player2 is not None)
 
-        self.__root.remove_from_connection ()
-        self.__root = None
+        name = self.__live.props.internal_name
+        self.log.debug ("withdrawing {0}".format (name))
 
-        self.__track_list.remove_from_connection ()
-        self.__track_list = None
-
-        self.__player.remove_from_connection ()
-        self.__player = None
+        self.__media_player2.remove_from_connection ()
+        self.__media_player2 = None
+        dbus.SessionBus ().release_name (panflute.daemon.mpris2.BUS_NAME)
 
+        if name in self.__warm:
+            self.__warm[name].bind_standby ()
         self.__live = None
-        dbus.SessionBus ().release_name ("org.mpris.panflute")
 
         for conn in self.connectors.values ():
             conn.resume_polling ()
 
+        self.__check_idle ()
+
 
     def __notify_connected_cb (self, conn, pspec):
         """
         Called whenever the "connected" property of a connector changes.
 
         This method maintains the following invariants:
+         * Every connected connector has its MPRIS objects ready to go.
          * As long as a connector is connected, something is being exposed.
          * Once something is exposed, it stays exposed until the connection to
            its backend is lost.
@@ -260,8 +468,197 @@ class Manager (object):
 
         self.log.debug ("{0} status is now {1}".format (conn.props.internal_name, conn.props.connected))
 
-        if self.__live is None and conn.props.connected:
-            self.__expose (conn)
-        elif self.__live is conn and not conn.props.connected:
-            self.__withdraw ()
-            self.__scan_for_connected ()
+        if conn.props.connected:
+            conn.stats.connected ()
+            self.__warm_up (conn)
+            if self.__live is None:
+                self.__expose (conn)
+        else:
+            if self.__live is conn:
+                self.__withdraw ()
+            self.__cool_down (conn)
+            if self.__live is None:
+                self.__scan_for_connected ()
+
+
+##############################################################################
+
+
+class WarmPlayer (object):
+    """
+    The MPRIS objects for one connected player.
+
+    Creating these objects means fetching the player's initial state and
+    subscribing to its signals, which can take a while.  Keeping them around
+    for every connected player means switching players only needs the
+    objects to be moved to the paths clients look at.  While not exposed,
+    they live under /standby/{internal-name} instead.
+
+    If there's a snapshot of the player's state from the last time it was
+    around, the objects start out with that state, which is replaced as the
+    player reports its actual state.
+
+    If every player is being exported, each one gets its own connection to
+    the bus instead, where it permanently sits at the usual paths under the
+    name org.mpris.panflute.{internal-name}.  Exposing it then only means
+    handing it the org.mpris.panflute name as well.
+    """
+
+    LIVE_NAME = "org.mpris.panflute"
+    OWN_NAME = "org.mpris.panflute.{0}"
+
+    LIVE_PATHS = {
+        "root":       "/",
+        "track_list": "/TrackList",
+        "player":     "/Player"
+    }
+
+    STANDBY_PATHS = {
+        "root":       "/standby/{0}/Root",
+        "track_list": "/standby/{0}/TrackList",
+        "player":     "/standby/{0}/Player"
+    }
+
+
+    def __init__ (self, conn, export, snapshot = None):
+        name = conn.props.internal_name
+        self.__export = export
+
+        if export:
+            self.__bus = dbus.SessionBus (private = True)
+            self.__standby_paths = self.LIVE_PATHS
+        else:
+            self.__bus = dbus.SessionBus ()
+            self.__standby_paths = dict ((key, path.format (name)) for (key, path) in self.STANDBY_PATHS.iteritems ())
+
+        self.player = conn.player (conn = self.__bus, object_path = self.__standby_paths["player"],
+                                   stats = conn.stats, snapshot = snapshot)
+        self.track_list = conn.track_list (conn = self.__bus, object_path = self.__standby_paths["track_list"])
+        self.root = conn.root (conn = self.__bus, object_path = self.__standby_paths["root"])
+
+        if export:
+            self.__bus.request_name (self.OWN_NAME.format (name))
+
+
+    def bind_live (self):
+        """
+        Make the objects the ones clients of org.mpris.panflute talk to.
+        """
+
+        if not self.__export:
+            self.__move (self.LIVE_PATHS)
+        self.__bus.request_name (self.LIVE_NAME)
+        self.player.stats.standby = False
+
+
+    def bind_standby (self):
+        """
+        Stop being the objects clients of org.mpris.panflute talk to.
+        """
+
+        self.__bus.release_name (self.LIVE_NAME)
+        if not self.__export:
+            # Clients can't tell these objects apart from whichever ones are
+            # exposed next, so they'd never unsubscribe.
+            self.player.drop_position_subscribers ()
+            self.__move (self.__standby_paths)
+        self.player.stats.standby = True
+
+
+    def destroy (self):
+        """
+        Tear the objects down for good.
+        """
+
+        self.root.remove_from_connection ()
+        self.track_list.remove_from_connection ()
+        self.player.remove_from_connection ()
+        if self.__export:
+            self.__bus.close ()
+
+
+    def __move (self, paths):
+        """
+        Re-export each object at a new path, without disturbing anything
+        else about it.
+        """
+
+        for key in ["player", "track_list", "root"]:
+            obj = getattr (self, key)
+            dbus.service.Object.remove_from_connection (obj)
+            obj.add_to_connection (self.__bus, paths[key])
+
+
+##############################################################################
+
+
+class SnapshotWatcher (object):
+    """
+    Watcher for a Player that calls a function whenever something that goes
+    into its snapshot changes.
+    """
+
+    def __init__ (self, changed_cb):
+        self.__changed_cb = changed_cb
+
+
+    def track_changed (self, metadata):
+        self.__changed_cb ()
+
+
+    def status_changed (self, status):
+        self.__changed_cb ()
+
+
+    def caps_changed (self, caps):
+        self.__changed_cb ()
+
+
+    def feature_added (self, feature):
+        self.__changed_cb ()
+
+
+    def volume_changed (self, volume):
+        pass
+
+
+    def position_changed (self, position):
+        pass
+
+
+    def seeked (self, position):
+        pass
+
+
+##############################################################################
+
+
+STATE_FILE = "daemon-state.json"
+
+
+def load_state ():
+    """
+    Read back what the daemon saved when it last exited, or nothing if it
+    didn't.
+    """
+
+    filename = os.path.join (panflute.util.get_xdg_data_home_directory (), STATE_FILE)
+    try:
+        with open (filename, "r") as input:
+            state = json.load (input)
+        if isinstance (state, dict):
+            return state
+    except (IOError, ValueError):
+        pass
+    return {}
+
+
+def save_state (state):
+    """
+    Save what the daemon should pick up where it left off with when it's
+    started again.
+    """
+
+    filename = os.path.join (panflute.util.get_xdg_data_home_directory (), STATE_FILE)
+    with open (filename, "w") as output:
+        json.dump (state, output)
@@ -48,6 +48,8 @@ class Connector (panflute.daemon.connector.Connector):
 
     def __init__ (self):
         panflute.daemon.connector.Connector.__init__ (self, "moc", "MOC")
+        self.__player = None
+        self.connect ("notify::connected", self.__notify_connected_cb)
 
         wm = pyinotify.WatchManager ()
         mask = pyinotify.IN_CREATE | pyinotify.IN_DELETE
@@ -71,7 +73,15 @@ class Connector (panflute.daemon.connector.Connector):
 
 
     def player (self, **kwargs):
-        return Player (**kwargs)
+        self.__player = Player (**kwargs)
+        return self.__player
+
+
+    def queue_depths (self):
+        if self.__player is not None:
+            return {"MOC Command": self.__player.queue_depth ()}
+        else:
+            return {}
 
 
     def launch (self):
@@ -79,6 +89,16 @@ class Connector (panflute.daemon.connector.Connector):
         return True
 
 
+    def __notify_connected_cb (self, conn, pspec):
+        """
+        Forget the player once MOC goes away, so that its command queue is no
+        longer reported.
+        """
+
+        if not self.props.connected:
+            self.__player = None
+
+
 class NotifyListener (pyinotify.ProcessEvent):
     """
     Listen for creation or deletion of the MOC socket to detect when MOC is
@@ -154,6 +174,14 @@ class Player (panflute.daemon.mpris.Player):
         self.cached_caps.play = True
 
 
+    def queue_depth (self):
+        """
+        Get the number of commands waiting to be run.
+        """
+
+        return self.__command_thread.queue_depth ()
+
+
     def remove_from_connection (self):
         self.__command_thread.enqueue ("")
         if self.__poll_source is not None:
@@ -198,6 +226,7 @@ class Player (panflute.daemon.mpris.Player):
         Poll for MOC's current status.
         """
 
+        self.stats.poll_tick ()
         self.__command_thread.enqueue ("-i")
         return True
 
@@ -296,6 +325,14 @@ class CommandThread (threading.Thread):
         self.__queue.put (arg_string)
 
 
+    def queue_depth (self):
+        """
+        Get the number of commands waiting to be run.
+        """
+
+        return self.__queue.qsize ()
+
+
     def run (self):
         while True:
             try:
@@ -38,12 +38,18 @@ offered through the same objects, but a different interface.
 
 from __future__ import absolute_import
 
+import panflute.daemon.stats
 import panflute.defs
 import panflute.mpris
+import panflute.trace
 
+import dbus
 import dbus.service
 import gobject
+import os.path
 import sys
+import time
+import urllib
 
 
 PANFLUTE_INTERFACE = "org.kuliniewicz.Panflute"
@@ -241,20 +247,68 @@ class Player (dbus.service.Object):
     appropriate signals, and the default implementations of the corresponding
     Get functions will read from the cache.  Subclasses are free to disregard
     the cache and implement the functionality themselves if they wish.
+
+    The work done is counted in the stats attribute, which is a
+    panflute.daemon.stats.Counters that can be shared with the connector by
+    passing it as the stats keyword argument.
+
+    Passing the result of an earlier snapshot () as the snapshot keyword
+    argument fills the cache with that state to begin with.  The state is
+    provisional until the subclass has written each part of the cache, and
+    is then reconciled with what the subclass wrote, so only what actually
+    differs gets signalled.
     """
 
     from panflute.util import log
 
+    MIN_POSITION_INTERVAL = 250
+    MAX_POSITION_INTERVAL = 1000
+
+    # How long restored state can go without the backend confirming it
+    # before it's given up on.
+    PROVISIONAL_TIMEOUT = 5000
+
+    # The getter for each part of the cache, by the kind of cache_written.
+    CACHE_GETTERS = {
+        "metadata": "GetMetadata",
+        "status":   "GetStatus",
+        "caps":     "GetCaps"
+    }
+
+    # The signal that reports the effect of each command, for TraceContext.
+    TRACED_SIGNALS = {
+        "Next":  "TrackChange",
+        "Prev":  "TrackChange",
+        "Play":  "StatusChange",
+        "Pause": "StatusChange",
+        "Stop":  "StatusChange"
+    }
+
 
     def __init__ (self, **kwargs):
+        self.stats = kwargs.pop ("stats", None) or panflute.daemon.stats.Counters ()
+        snapshot = kwargs.pop ("snapshot", None)
         dbus.service.Object.__init__ (self, **kwargs)
 
         # Built-in features are always available.
-        self.__features = ["GetFeatures", "Supports",
-                           "CapsChange", "StatusChange", "TrackChange", "PositionChange"]
+        self.__features = ["GetFeatures", "Supports", "GetSnapshot",
+                           "SubscribePosition", "UnsubscribePosition",
+                           "CapsChange", "StatusChange", "TrackChange", "PositionChange",
+                           "MetadataChanged", "Reconciled"]
+        self.__builtin_features = list (self.__features)
 
+        self.__wants_time = False
         self.__polling = False
+        self.__last_polled = None
+        self.__last_volume = panflute.mpris.VOLUME_MIN
+        self.__last_position = 0
         self.__poll_source = None
+        self.__poll_interval = self.MAX_POSITION_INTERVAL
+        self.__subscribers = {}
+        self.__reported_metadata = {}
+        self.__watchers = []
+        self.__version = 0
+        self.__traced_signal = None
 
         self.__cached_status = CachedStatus (self,
                                              panflute.mpris.STATE_STOPPED,
@@ -264,11 +318,65 @@ class Player (dbus.service.Object):
         self.__cached_metadata = CachedMetadata (self)
         self.__cached_caps = CachedCaps (self, panflute.mpris.CAN_DO_NOTHING)
 
+        self.__provisional = set ()
+        self.__provisional_features = []
+        self.__provisional_source = None
+        if snapshot is not None:
+            self.__restore (snapshot)
+
+
+    def connect_backend_signal (self, proxy, signal, callback):
+        """
+        Connect to a signal from the backend's D-Bus interface, counting each
+        time it arrives.  Returns the signal match, as connect_to_signal does.
+        """
+
+        return proxy.connect_to_signal (signal, self.stats.counted (signal, callback))
+
+
     def remove_from_connection (self):
+        if self.__provisional_source is not None:
+            gobject.source_remove (self.__provisional_source)
+            self.__provisional_source = None
         self.stop_polling_for_time ()
+        self.drop_position_subscribers ()
         dbus.service.Object.remove_from_connection (self)
 
 
+    def __call_backend (self, method, *args):
+        """
+        Call the do_* method implementing a D-Bus method, counting how long
+        it took.  Methods the subclass leaves to be served straight out of the
+        cache never reach the backend, so they are left out of the counts.
+        """
+
+        start = time.time ()
+        correlation = panflute.trace.pending ()
+        if correlation is not None and method in self.TRACED_SIGNALS:
+            self.__traced_signal = self.TRACED_SIGNALS[method]
+        with panflute.trace.span ("daemon {0}".format (method), correlation):
+            result = getattr (self, "do_" + method) (*args)
+        if not self.__is_default ("do_" + method):
+            self.stats.call (method, (time.time () - start) * 1000)
+        if len (self.__provisional) > 0:
+            for (kind, getter) in self.CACHE_GETTERS.iteritems ():
+                if method == getter:
+                    self.backend_reported (kind, result)
+        return result
+
+
+    def drop_position_subscribers (self):
+        """
+        Forget every position subscription, such as when the object is about
+        to stop being the one clients are talking to.
+        """
+
+        for (interval, match) in self.__subscribers.values ():
+            match.remove ()
+        self.__subscribers = {}
+        self.__update_time_polling ()
+
+
     # Next method
 
     @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE,
@@ -276,7 +384,7 @@ class Player (dbus.service.Object):
                           out_signature = "")
     def Next (self):
         self.log.debug ("Next")
-        self.do_Next ()
+        self.__call_backend ("Next")
 
     def do_Next (self):
         pass
@@ -289,7 +397,7 @@ class Player (dbus.service.Object):
                           out_signature = "")
     def Prev (self):
         self.log.debug ("Prev")
-        self.do_Prev ()
+        self.__call_backend ("Prev")
 
     def do_Prev (self):
         pass
@@ -302,7 +410,7 @@ class Player (dbus.service.Object):
                           out_signature = "")
     def Pause (self):
         self.log.debug ("Pause")
-        self.do_Pause ()
+        self.__call_backend ("Pause")
 
     def do_Pause (self):
         pass
@@ -315,7 +423,7 @@ class Player (dbus.service.Object):
                           out_signature = "")
     def Stop (self):
         self.log.debug ("Stop")
-        self.do_Stop ()
+        self.__call_backend ("Stop")
 
     def do_Stop (self):
         pass
@@ -328,7 +436,7 @@ class Player (dbus.service.Object):
                           out_signature = "")
     def Play (self):
         self.log.debug ("Play")
-        self.do_Play ()
+        self.__call_backend ("Play")
 
     def do_Play (self):
         pass
@@ -341,7 +449,7 @@ class Player (dbus.service.Object):
                           out_signature = "")
     def Repeat (self, repeat):
         self.log.debug ("Repeat {0}".format (repeat))
-        self.do_Repeat (repeat)
+        self.__call_backend ("Repeat", repeat)
 
     def do_Repeat (self, repeat):
         pass
@@ -354,7 +462,7 @@ class Player (dbus.service.Object):
                           out_signature = "(iiii)")
     def GetStatus (self):
         self.log.debug ("GetStatus")
-        status = self.do_GetStatus ()
+        status = self.__call_backend ("GetStatus")
         self.__assert_valid_status (status)
         return status
 
@@ -384,7 +492,7 @@ class Player (dbus.service.Object):
                           out_signature = "a{sv}")
     def GetMetadata (self):
         self.log.debug ("GetMetadata")
-        return self.do_GetMetadata ()
+        return self.__call_backend ("GetMetadata")
 
     def do_GetMetadata (self):
         return self.__cached_metadata
@@ -405,7 +513,7 @@ class Player (dbus.service.Object):
         """
 
         self.log.debug ("SetMetadata")
-        self.do_SetMetadata (name, value)
+        self.__call_backend ("SetMetadata", name, value)
 
     def do_SetMetadata (self, name, value):
         pass
@@ -418,7 +526,7 @@ class Player (dbus.service.Object):
                           out_signature = "i")
     def GetCaps (self):
         self.log.debug ("GetCaps")
-        caps = self.do_GetCaps ()
+        caps = self.__call_backend ("GetCaps")
         self.__assert_valid_caps (caps)
         return caps
 
@@ -443,7 +551,9 @@ class Player (dbus.service.Object):
         if volume < panflute.mpris.VOLUME_MIN or volume > panflute.mpris.VOLUME_MAX:
             raise ValueError ("volume must be between {0} and {1}".format (panflute.mpris.VOLUME_MIN,
                                                                            panflute.mpris.VOLUME_MAX))
-        self.do_VolumeSet (volume)
+        self.__call_backend ("VolumeSet", volume)
+        self.__last_volume = volume
+        self.__notify_watchers ("volume_changed", volume)
 
     def do_VolumeSet (self, volume):
         pass
@@ -456,8 +566,9 @@ class Player (dbus.service.Object):
                           out_signature = "i")
     def VolumeGet (self):
         self.log.debug ("VolumeGet")
-        volume = self.do_VolumeGet ()
+        volume = self.__call_backend ("VolumeGet")
         assert volume >= panflute.mpris.VOLUME_MIN and volume <= panflute.mpris.VOLUME_MAX
+        self.__last_volume = volume
         return volume
 
     def do_VolumeGet (self):
@@ -473,7 +584,9 @@ class Player (dbus.service.Object):
         self.log.debug ("PositionSet {0}".format (position))
         if position < 0:
             raise ValueError ("position must be >= 0")
-        self.do_PositionSet (position)
+        self.__call_backend ("PositionSet", position)
+        self.__last_position = position
+        self.__notify_watchers ("seeked", position)
 
     def do_PositionSet (self, position):
         pass
@@ -486,8 +599,9 @@ class Player (dbus.service.Object):
                           out_signature = "i")
     def PositionGet (self):
         self.log.debug ("PositionGet")
-        position = self.do_PositionGet ()
+        position = self.__call_backend ("PositionGet")
         assert position >= 0
+        self.__last_position = position
         return position
 
     def do_PositionGet (self):
@@ -510,6 +624,153 @@ class Player (dbus.service.Object):
         return self.__features
 
 
+    # GetSnapshot extension method
+    # Returns the entire state of the player in a single reply, so that
+    # clients can initialize themselves with one round trip instead of one
+    # per value.  The "version" entry increases every time a state change
+    # signal is sent; a client that sees a version other than the one it
+    # expects has missed a signal and should take a fresh snapshot.
+    # If the "provisional" entry is true, the state is what the daemon
+    # remembered from the last time the player was around, and is yet to be
+    # confirmed by the player itself; see Reconciled.
+
+    @dbus.service.method (dbus_interface = PANFLUTE_INTERFACE,
+                          in_signature = "",
+                          out_signature = "a{sv}")
+    def GetSnapshot (self):
+        self.log.debug ("GetSnapshot")
+        return self.do_GetSnapshot ()
+
+    def do_GetSnapshot (self):
+        """
+        By default, build the snapshot out of the individual Get methods,
+        which mostly read from the cache anyway.  While the state is
+        provisional, it's read straight from the cache instead, along with
+        the last volume and position heard of, so that nothing waits on a
+        player that's still starting up.
+        """
+
+        provisional = len (self.__provisional) > 0
+        features = self.GetFeatures ()
+
+        if provisional:
+            caps = self.__cached_caps.all
+            status = self.__cached_status.tuple
+            metadata = self.__cached_metadata
+            position = self.__last_position
+            volume = self.__last_volume
+            features = features + [feature for feature in self.__provisional_features if feature not in features]
+        else:
+            caps = self.GetCaps ()
+            status = self.GetStatus ()
+            metadata = self.GetMetadata ()
+            position = self.PositionGet ()
+            if "VolumeGet" in features:
+                volume = self.VolumeGet ()
+            else:
+                volume = panflute.mpris.VOLUME_MIN
+
+        return dbus.Dictionary ({
+            "caps":        dbus.Int32 (caps),
+            "status":      dbus.Struct (status, signature = "iiii"),
+            "metadata":    dbus.Dictionary (metadata, signature = "sv"),
+            "position":    dbus.Int32 (position),
+            "timestamp":   dbus.Int64 (int (time.time () * 1000)),
+            "volume":      dbus.Int32 (volume),
+            "features":    dbus.Array (features, signature = "s"),
+            "version":     dbus.UInt64 (self.__version),
+            "provisional": dbus.Boolean (provisional)
+        }, signature = "sv")
+
+
+    # TraceCommand extension method
+    # Tags the next command with a correlation id, so that when event
+    # tracing is enabled (see panflute.trace), the daemon's part in carrying
+    # it out can be matched up with the client's.  The id is passed back in
+    # TraceContext just before the signal reporting the command's effect.
+
+    @dbus.service.method (dbus_interface = PANFLUTE_INTERFACE,
+                          in_signature = "s",
+                          out_signature = "")
+    def TraceCommand (self, correlation):
+        self.log.debug ("TraceCommand {0}".format (correlation))
+        panflute.trace.set_pending (correlation)
+
+
+    # TraceContext extension signal
+    # Sent just before a TrackChange or StatusChange caused by a command
+    # tagged by TraceCommand, carrying the command's correlation id.
+
+    @dbus.service.signal (dbus_interface = PANFLUTE_INTERFACE,
+                          signature = "s")
+    def TraceContext (self, correlation):
+        self.log.debug ("sending TraceContext {0}".format (correlation))
+
+    def __send_trace_context (self, signal):
+        """
+        Pass the correlation id of the command being waited on, if any,
+        along with a signal that's about to be sent.
+        """
+
+        if signal == self.__traced_signal:
+            self.__traced_signal = None
+            correlation = panflute.trace.take_pending ()
+            if correlation is not None:
+                panflute.trace.hop ("daemon {0}".format (signal), correlation)
+                self.TraceContext (correlation)
+        else:
+            # Note it, but leave the id for the signal actually expected.
+            panflute.trace.hop ("daemon {0}".format (signal), panflute.trace.pending ())
+
+
+    @property
+    def state_version (self):
+        """
+        Get the current state version, as reported by GetSnapshot.
+        """
+
+        return self.__version
+
+
+    def __bump_state_version (self):
+        """
+        Note that the state being reported to clients has changed.
+        """
+
+        self.__version += 1
+
+
+    def add_watcher (self, watcher):
+        """
+        Register an object to be told about every change reported to
+        clients.  The watcher must provide track_changed, status_changed,
+        caps_changed, volume_changed, position_changed, seeked and
+        feature_added methods, each taking the new value.
+        """
+
+        self.__watchers.append (watcher)
+
+
+    def remove_watcher (self, watcher):
+        """
+        Stop telling a watcher about changes.
+        """
+
+        self.__watchers.remove (watcher)
+
+
+    def __notify_watchers (self, method, value):
+        """
+        Pass a change along to every watcher.
+        """
+
+        for watcher in self.__watchers:
+            try:
+                getattr (watcher, method) (value)
+            except Exception, e:
+                self.log.warn ("Watcher {0} failed in {1}: {2}".format (watcher, method, e))
+
+
     def register_feature (self, feature):
         """
         Register a feature to be returned by GetFeatures and Supports.  All
@@ -545,6 +806,9 @@ class Player (dbus.service.Object):
                           signature = "s")
     def FeatureAdded (self, feature):
         self.log.debug ("sending FeatureAdded {0}".format (feature))
+        self.stats.emitted ("FeatureAdded")
+        self.__bump_state_version ()
+        self.__notify_watchers ("feature_added", feature)
 
     def do_FeatureAdded (self, feature):
         self.FeatureAdded (feature)
@@ -556,9 +820,66 @@ class Player (dbus.service.Object):
                           signature = "a{sv}")
     def TrackChange (self, metadata):
         self.log.debug ("sending TrackChange {0}".format (metadata))
+        self.stats.emitted ("TrackChange")
+        self.__bump_state_version ()
+        self.__notify_watchers ("track_changed", metadata)
 
     def do_TrackChange (self, metadata):
+        self.backend_reported ("metadata", metadata, True)
+        self.__send_trace_context ("TrackChange")
         self.TrackChange (metadata)
+        self.__report_metadata_delta (metadata)
+
+
+    # MetadataChanged extension signal
+    # Sent along with every TrackChange, but carrying only the fields that
+    # were added or changed and the names of the fields that were removed.
+    # new_track distinguishes a different song starting from fields of the
+    # same song being updated (e.g. a new rating or a radio stream's title).
+    # version is the state version as of the matching TrackChange.
+
+    @dbus.service.signal (dbus_interface = PANFLUTE_INTERFACE,
+                          signature = "a{sv}asbt")
+    def MetadataChanged (self, changed, removed, new_track, version):
+        self.log.debug ("sending MetadataChanged {0} {1} {2} {3}".format (changed, removed, new_track, version))
+        self.stats.emitted ("MetadataChanged")
+
+    def do_MetadataChanged (self, changed, removed, new_track, version):
+        self.MetadataChanged (changed, removed, new_track, version)
+
+
+    def __report_metadata_delta (self, metadata):
+        """
+        Work out what changed since the metadata last reported, and send
+        MetadataChanged if anything did.
+        """
+
+        old = self.__reported_metadata
+        changed = dict ((key, value) for (key, value) in metadata.iteritems ()
+                                     if key not in old or old[key] != value)
+        removed = [key for key in old if key not in metadata]
+        self.__reported_metadata = dict (metadata)
+
+        if len (changed) > 0 or len (removed) > 0:
+            self.do_MetadataChanged (changed, removed, not is_same_track (old, metadata), self.__version)
+
+
+    # Reconciled extension signal
+    # Sent once state restored from when the player was last around (see
+    # GetSnapshot) has been checked against the player itself.  Any values
+    # that turned out to differ have already been sent in the usual change
+    # signals, so only a client that relied on the provisional list of
+    # features needs to do anything.  version is the state version as of
+    # the reconciliation.
+
+    @dbus.service.signal (dbus_interface = PANFLUTE_INTERFACE,
+                          signature = "t")
+    def Reconciled (self, version):
+        self.log.debug ("sending Reconciled {0}".format (version))
+        self.stats.emitted ("Reconciled")
+
+    def do_Reconciled (self, version):
+        self.Reconciled (version)
 
 
     # StatusChange signal
@@ -567,9 +888,14 @@ class Player (dbus.service.Object):
                           signature = "(iiii)")
     def StatusChange (self, status):
         self.log.debug ("sending StatusChange {0}".format (status))
+        self.stats.emitted ("StatusChange")
         self.__assert_valid_status (status)
+        self.__bump_state_version ()
+        self.__notify_watchers ("status_changed", status)
 
     def do_StatusChange (self, status):
+        self.backend_reported ("status", status, True)
+        self.__send_trace_context ("StatusChange")
         self.StatusChange (status)
 
 
@@ -579,9 +905,13 @@ class Player (dbus.service.Object):
                           signature = "i")
     def CapsChange (self, caps):
         self.log.debug ("sending CapsChange {0}".format (hex (caps)))
+        self.stats.emitted ("CapsChange")
         self.__assert_valid_caps (caps)
+        self.__bump_state_version ()
+        self.__notify_watchers ("caps_changed", caps)
 
     def do_CapsChange (self, caps):
+        self.backend_reported ("caps", caps, True)
         self.CapsChange (caps)
 
 
@@ -596,12 +926,77 @@ class Player (dbus.service.Object):
         won't be sent 1,000 times a second.  However, it ought to be sent
         roughly once a second, to allow clients to update an elapsed-time
         display without having to implement their own polling loop.
+
+        The signal is only sent while at least one client has asked for it
+        via SubscribePosition.
         """
         self.log.debug ("sending PositionChange {0}".format (position))
+        self.stats.emitted ("PositionChange")
         assert position >= 0
 
     def do_PositionChange (self, position):
-        self.PositionChange (position)
+        self.__last_position = position
+        self.__notify_watchers ("position_changed", position)
+        if len (self.__subscribers) > 0:
+            self.PositionChange (position)
+
+
+    # SubscribePosition extension method
+    # Asks for PositionChange to be sent at least every interval_ms
+    # milliseconds while something is playing.  The subscription lasts until
+    # the client unsubscribes or disconnects from the bus; subscribing again
+    # just changes the requested interval.
+
+    @dbus.service.method (dbus_interface = PANFLUTE_INTERFACE,
+                          in_signature = "u",
+                          out_signature = "",
+                          sender_keyword = "sender")
+    def SubscribePosition (self, interval_ms, sender = None):
+        self.log.debug ("SubscribePosition {0} {1}".format (interval_ms, sender))
+        interval_ms = min (max (interval_ms, self.MIN_POSITION_INTERVAL), self.MAX_POSITION_INTERVAL)
+
+        if sender in self.__subscribers:
+            (old_interval, match) = self.__subscribers[sender]
+        else:
+            bus = dbus.SessionBus ()
+            proxy = bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+            match = dbus.Interface (proxy, "org.freedesktop.DBus").connect_to_signal (
+                        "NameOwnerChanged", self.__subscriber_owner_changed_cb, arg0 = sender)
+
+        self.__subscribers[sender] = (interval_ms, match)
+        self.__update_time_polling ()
+
+
+    # UnsubscribePosition extension method
+
+    @dbus.service.method (dbus_interface = PANFLUTE_INTERFACE,
+                          in_signature = "",
+                          out_signature = "",
+                          sender_keyword = "sender")
+    def UnsubscribePosition (self, sender = None):
+        self.log.debug ("UnsubscribePosition {0}".format (sender))
+        self.__remove_subscriber (sender)
+
+
+    def __subscriber_owner_changed_cb (self, name, old_owner, new_owner):
+        """
+        Drop the subscription of a client that has left the bus.
+        """
+
+        if new_owner == "":
+            self.log.debug ("position subscriber {0} went away".format (name))
+            self.__remove_subscriber (name)
+
+
+    def __remove_subscriber (self, name):
+        """
+        Cancel a client's position subscription, if it has one.
+        """
+
+        if name in self.__subscribers:
+            (interval, match) = self.__subscribers.pop (name)
+            match.remove ()
+            self.__update_time_polling ()
 
 
     # status cache
@@ -625,6 +1020,7 @@ class Player (dbus.service.Object):
                                          status[panflute.mpris.STATUS_ORDER],
                                          status[panflute.mpris.STATUS_NEXT],
                                          status[panflute.mpris.STATUS_FUTURE])
+        self.cache_written ("status", self.__cached_status.tuple == new_status.tuple)
         if self.__cached_status.tuple != new_status.tuple:
             self.__cached_status = new_status
             self.do_StatusChange (new_status.tuple)
@@ -648,6 +1044,7 @@ class Player (dbus.service.Object):
         """
 
         new_metadata = CachedMetadata (self, metadata)
+        self.cache_written ("metadata", self.__cached_metadata == new_metadata)
         if self.__cached_metadata != new_metadata:
             self.__cached_metadata = new_metadata
             self.do_TrackChange (new_metadata)
@@ -665,16 +1062,193 @@ class Player (dbus.service.Object):
         return self.__cached_caps
 
 
+    # warm starts
+
+    @property
+    def provisional (self):
+        """
+        Check whether any of the cached state is still the restored state
+        waiting to be confirmed by the player.
+        """
+
+        return len (self.__provisional) > 0
+
+
+    def snapshot (self):
+        """
+        Get the cached state in a form that can be saved as JSON and later
+        passed back as the snapshot keyword argument to the constructor.
+        """
+
+        metadata = dict ((key, value) for (key, value) in self.__cached_metadata.iteritems ()
+                                      if isinstance (value, (basestring, int, long, float)))
+        return {"metadata": metadata,
+                "status":   list (self.__cached_status.tuple),
+                "caps":     self.__cached_caps.all,
+                "volume":   self.__last_volume,
+                "features": [feature for feature in self.__features if feature not in self.__builtin_features]}
+
+
+    def cache_written (self, kind, hit):
+        """
+        Note that the player just reported a value for part of the cache,
+        whether or not it matched what was already there.
+        """
+
+        self.stats.cache (kind, hit)
+        if kind in self.__provisional:
+            self.__provisional.discard (kind)
+            if len (self.__provisional) == 0:
+                # Wait for the change being made, if any, to be announced.
+                if self.__provisional_source is not None:
+                    gobject.source_remove (self.__provisional_source)
+                self.__provisional_source = gobject.idle_add (self.__end_provisional)
+
+
+    def backend_reported (self, kind, value, announced = False):
+        """
+        Note the player's own answer for part of the state that isn't served
+        out of the cache, such as by a passthrough.  While that part is still
+        the restored state, the answer confirms it, taking the restored
+        value's place in the cache.  Unless the answer has already been
+        announced, a change signal is sent if it differs.
+        """
+
+        if kind not in self.__provisional or self.__serves_from_cache (kind):
+            return
+
+        if not announced:
+            if kind == "metadata":
+                self.cached_metadata = value
+            elif kind == "status":
+                self.cached_status = value
+            else:
+                self.cached_caps.all = value
+        else:
+            if kind == "metadata":
+                new_metadata = CachedMetadata (self, value)
+                hit = (self.__cached_metadata == new_metadata)
+                self.__cached_metadata = new_metadata
+            elif kind == "status":
+                new_status = CachedStatus (self, *value)
+                hit = (self.__cached_status.tuple == new_status.tuple)
+                self.__cached_status = new_status
+            else:
+                new_caps = CachedCaps (self, value)
+                hit = (self.__cached_caps.all == new_caps.all)
+                self.__cached_caps = new_caps
+            self.cache_written (kind, hit)
+
+
+    def __serves_from_cache (self, kind):
+        """
+        Check whether the subclass leaves the getter for part of the state
+        to serve it straight out of the cache.
+        """
+
+        return self.__is_default ("do_" + self.CACHE_GETTERS[kind])
+
+
+    def __is_default (self, name):
+        """
+        Check whether the subclass leaves a do_* method as Player defines it.
+        """
+
+        default = getattr (Player, name, None)
+        return default is not None and getattr (type (self), name).__func__ is default.__func__
+
+
+    def __restore (self, snapshot):
+        """
+        Fill the cache with the state saved from an earlier run, without
+        announcing it.  Until the player confirms each part, the state is
+        only provisional.
+        """
+
+        try:
+            metadata = dict (snapshot["metadata"])
+            arturl = metadata.get ("arturl", "")
+            if arturl.startswith ("file://") and not os.path.exists (urllib.url2pathname (arturl[len ("file://"):])):
+                del metadata["arturl"]
+
+            status = CachedStatus (self, *snapshot["status"])
+            caps = CachedCaps (self, snapshot["caps"])
+            metadata = CachedMetadata (self, metadata)
+            features = [unicode (feature) for feature in snapshot["features"]]
+            volume = int (snapshot.get ("volume", panflute.mpris.VOLUME_MIN))
+        except Exception, e:
+            self.log.warn ("Ignoring unusable snapshot: {0}".format (e))
+            return
+
+        self.__cached_status = status
+        self.__cached_caps = caps
+        self.__cached_metadata = metadata
+        self.__reported_metadata = dict (metadata)
+        self.__provisional_features = features
+        self.__last_volume = max (panflute.mpris.VOLUME_MIN, min (panflute.mpris.VOLUME_MAX, volume))
+
+        self.__provisional = set (["metadata", "status", "caps"])
+        self.__provisional_source = gobject.timeout_add (self.PROVISIONAL_TIMEOUT, self.__provisional_timeout_cb)
+
+
+    def __provisional_timeout_cb (self):
+        """
+        Stop waiting for the player to confirm the rest of the restored
+        state.  Anything it didn't report is put back the way it would have
+        been without the snapshot, or, for values that aren't read from the
+        cache, replaced with what the player says now.
+        """
+
+        unconfirmed = self.__provisional
+        self.__provisional = set ()
+        self.log.debug ("giving up on confirming restored {0}".format (", ".join (sorted (unconfirmed))))
+
+        if "metadata" in unconfirmed:
+            if self.__serves_from_cache ("metadata"):
+                self.cached_metadata = {}
+            else:
+                self.cached_metadata = self.GetMetadata ()
+        if "status" in unconfirmed:
+            if self.__serves_from_cache ("status"):
+                self.cached_status = (panflute.mpris.STATE_STOPPED,
+                                      panflute.mpris.ORDER_LINEAR,
+                                      panflute.mpris.NEXT_NEXT,
+                                      panflute.mpris.FUTURE_CONTINUE)
+            else:
+                self.cached_status = self.GetStatus ()
+        if "caps" in unconfirmed:
+            if self.__serves_from_cache ("caps"):
+                self.cached_caps.all = panflute.mpris.CAN_DO_NOTHING
+            else:
+                self.cached_caps.all = self.GetCaps ()
+
+        return self.__end_provisional ()
+
+
+    def __end_provisional (self):
+        """
+        Treat the cached state as the player's own from now on.
+        """
+
+        self.__provisional_source = None
+        self.__provisional_features = []
+        self.log.debug ("restored state reconciled")
+        self.do_Reconciled (self.__version)
+        return False
+
+
     # polling for elapsed time updates
 
     def start_polling_for_time (self):
         """
         Begin polling for elapsed time updates.
+
+        Polling only actually happens while some client is subscribed to
+        position changes.
         """
 
-        if not self.__polling:
-            self.__polling = True
-            self.__poll_for_time ()
+        self.__wants_time = True
+        self.__update_time_polling ()
 
 
     def stop_polling_for_time (self):
@@ -682,7 +1256,38 @@ class Player (dbus.service.Object):
         Stop polling for elapsed time updates.
         """
 
-        self.__polling = False
+        self.__wants_time = False
+        self.__update_time_polling ()
+
+
+    def __update_time_polling (self):
+        """
+        Start or stop polling depending on whether the player is playing and
+        anyone is listening, and poll as often as the most demanding
+        subscriber asks.
+        """
+
+        should_poll = self.__wants_time and len (self.__subscribers) > 0
+
+        if should_poll:
+            interval = min (interval for (interval, match) in self.__subscribers.values ())
+            if not self.__polling or interval < self.__poll_interval:
+                self.__poll_interval = interval
+                self.__polling = True
+                self.__cancel_poll ()
+                self.__poll_for_time ()
+            else:
+                self.__poll_interval = interval
+        else:
+            self.__polling = False
+            self.__cancel_poll ()
+
+
+    def __cancel_poll (self):
+        """
+        Remove the pending poll, if any.
+        """
+
         if self.__poll_source is not None:
             gobject.source_remove (self.__poll_source)
             self.__poll_source = None
@@ -691,16 +1296,21 @@ class Player (dbus.service.Object):
     def __poll_for_time (self):
         """
         Call the PositionGet method directly, report it, and queue another
-        call to this function when the next second is expected to tick.
+        call to this function when the next interval is expected to tick.
         """
 
+        self.__poll_source = None
+        self.stats.poll_tick ()
         elapsed = self.PositionGet ()
+        self.stats.cache ("position", elapsed == self.__last_polled)
+        self.__last_polled = elapsed
         self.do_PositionChange (elapsed)
 
         if self.__polling:
-            # Poll when the next second tick is expected, but don't poll more
+            # Poll when the next tick is expected, but don't poll more
             # frequently than four times a second.
-            delay = max (250, 1000 - (elapsed % 1000))
+            interval = self.__poll_interval
+            delay = max (self.MIN_POSITION_INTERVAL, interval - (elapsed % interval))
             self.__poll_source = gobject.timeout_add (delay, self.__poll_for_time)
 
         return False
@@ -709,6 +1319,19 @@ class Player (dbus.service.Object):
 ##############################################################################
 
 
+def is_same_track (old, new):
+    """
+    Determine whether two sets of metadata describe the same song.  The
+    location is what identifies a song if there is one; a radio stream keeps
+    its location even as the title of what's being played changes.
+    """
+
+    if "location" in old or "location" in new:
+        return old.get ("location", None) == new.get ("location", None)
+    else:
+        return all (old.get (key, None) == new.get (key, None) for key in ["title", "artist", "album"])
+
+
 def sanitize_string (value):
     """
     Convert a string, silently replacing empty strings with None so they
@@ -796,7 +1419,10 @@ class CachedMetadata (dict):
         elif self.get (key, None) != clean_value:
             dict.__setitem__ (self, key, clean_value)
             if self.__player is not None:
+                self.__player.cache_written ("metadata", False)
                 self.__player.do_TrackChange (self)
+        elif self.__player is not None:
+            self.__player.cache_written ("metadata", True)
 
 
     def __delitem__ (self, key):
@@ -807,7 +1433,10 @@ class CachedMetadata (dict):
         if self.has_key (key):
             dict.__delitem__ (self, key)
             if self.__player is not None:
-                self.__player.do_TrackChange ()
+                self.__player.cache_written ("metadata", False)
+                self.__player.do_TrackChange (self)
+        elif self.__player is not None:
+            self.__player.cache_written ("metadata", True)
 
 
 ##############################################################################
@@ -855,6 +1484,8 @@ class CachedStatus (object):
         """
 
         assert new_state >= panflute.mpris.STATE_MIN and new_state <= panflute.mpris.STATE_MAX
+        if self.__player is not None:
+            self.__player.cache_written ("status", self.__state == new_state)
         if self.__state != new_state:
             self.__state = new_state
             if self.__player is not None:
@@ -877,6 +1508,8 @@ class CachedStatus (object):
         """
 
         assert new_order >= panflute.mpris.ORDER_MIN and new_order <= panflute.mpris.ORDER_MAX
+        if self.__player is not None:
+            self.__player.cache_written ("status", self.__order == new_order)
         if self.__order != new_order:
             self.__order = new_order
             if self.__player is not None:
@@ -899,6 +1532,8 @@ class CachedStatus (object):
         """
 
         assert new_next >= panflute.mpris.NEXT_MIN and new_next <= panflute.mpris.NEXT_MAX
+        if self.__player is not None:
+            self.__player.cache_written ("status", self.__next == new_next)
         if self.__next != new_next:
             self.__next = new_next
             if self.__player is not None:
@@ -921,6 +1556,8 @@ class CachedStatus (object):
         """
 
         assert new_future >= panflute.mpris.FUTURE_MIN and new_future <= panflute.mpris.FUTURE_MAX
+        if self.__player is not None:
+            self.__player.cache_written ("status", self.__future == new_future)
         if self.__future != new_future:
             self.__future = new_future
             if self.__player is not None:
@@ -991,6 +1628,8 @@ class CachedCaps (object):
         """
 
         assert (caps & ~panflute.mpris.CAPABILITY_MASK) == 0
+        if self.__player is not None:
+            self.__player.cache_written ("caps", self.__caps == caps)
         if self.__caps != caps:
             self.__caps = caps
             if self.__player is not None:
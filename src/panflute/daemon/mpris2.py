@@ -0,0 +1,581 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+MPRIS 2 front-end for the objects exposed via MPRIS 1.
+
+Rather than talking to the music player itself, the MediaPlayer2 object
+watches the MPRIS 1 Player object for changes and keeps its own copy of
+the state, so that property reads never have to wait on the player.
+Property changes are collected and sent as a single PropertiesChanged
+signal once the main loop goes idle.
+
+See http://www.mpris.org/2.0/spec/ for full documentation of the
+interfaces being implemented here.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.daemon.mpris
+import panflute.mpris
+
+import dbus
+import dbus.exceptions
+import dbus.service
+import gobject
+import time
+
+
+BUS_NAME = "org.mpris.MediaPlayer2.panflute"
+OBJECT_PATH = "/org/mpris/MediaPlayer2"
+
+ROOT_INTERFACE = "org.mpris.MediaPlayer2"
+PLAYER_INTERFACE = "org.mpris.MediaPlayer2.Player"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+TRACK_PATH = "/org/kuliniewicz/Panflute/Track/{0}"
+NO_TRACK = "/org/mpris/MediaPlayer2/TrackList/NoTrack"
+
+# Metadata fields whose MPRIS 1 and MPRIS 2 names differ only in naming.
+
+STRING_FIELDS = {
+    "title":        "xesam:title",
+    "album":        "xesam:album",
+    "location":     "xesam:url",
+    "arturl":       "mpris:artUrl",
+    "mb track id":  "xesam:musicBrainzTrackID",
+    "mb album id":  "xesam:musicBrainzAlbumID",
+    "asin":         "xesam:asin"
+}
+
+LIST_FIELDS = {
+    "artist":          "xesam:artist",
+    "genre":           "xesam:genre",
+    "comment":         "xesam:comment",
+    "mb album artist": "xesam:albumArtist",
+    "mb artist id":    "xesam:musicBrainzArtistID"
+}
+
+
+class MediaPlayer2 (dbus.service.Object):
+    """
+    The MPRIS 2 object located at /org/mpris/MediaPlayer2, providing both
+    the org.mpris.MediaPlayer2 and org.mpris.MediaPlayer2.Player interfaces
+    for an already-created set of MPRIS 1 objects.
+    """
+
+    from panflute.util import log
+
+    # A position report further than this from where playback was expected
+    # to be means the user seeked from within the player itself.
+    SEEK_TOLERANCE = 2000
+
+
+    def __init__ (self, identity, root, track_list, player, **kwargs):
+        if not kwargs.has_key ("object_path"):
+            kwargs["object_path"] = OBJECT_PATH
+        dbus.service.Object.__init__ (self, **kwargs)
+
+        self.__identity = identity
+        self.__root = root
+        self.__track_list = track_list
+        self.__player = player
+
+        self.__pending = {}
+        self.__flush_source = None
+        self.__track_number = 0
+
+        snapshot = player.GetSnapshot ()
+        self.__caps = snapshot["caps"]
+        self.__status = tuple (snapshot["status"])
+        self.__metadata = dict (snapshot["metadata"])
+        self.__volume = snapshot["volume"]
+        self.__sample_position (snapshot["position"])
+
+        player.add_watcher (self)
+
+
+    def remove_from_connection (self):
+        self.__player.remove_watcher (self)
+        if self.__flush_source is not None:
+            gobject.source_remove (self.__flush_source)
+            self.__flush_source = None
+        dbus.service.Object.remove_from_connection (self)
+
+
+    ##########################################################################
+    #
+    # org.mpris.MediaPlayer2
+    #
+    ##########################################################################
+
+
+    @dbus.service.method (dbus_interface = ROOT_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Raise (self):
+        self.log.debug ("Raise")
+
+
+    @dbus.service.method (dbus_interface = ROOT_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Quit (self):
+        self.log.debug ("Quit")
+        self.__root.Quit ()
+
+
+    ##########################################################################
+    #
+    # org.mpris.MediaPlayer2.Player
+    #
+    ##########################################################################
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Next (self):
+        self.log.debug ("Next")
+        self.__player.Next ()
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Previous (self):
+        self.log.debug ("Previous")
+        self.__player.Prev ()
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Pause (self):
+        self.log.debug ("Pause")
+        if self.__status[panflute.mpris.STATUS_STATE] == panflute.mpris.STATE_PLAYING:
+            self.__player.Pause ()
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def PlayPause (self):
+        self.log.debug ("PlayPause")
+        if self.__status[panflute.mpris.STATUS_STATE] == panflute.mpris.STATE_STOPPED:
+            self.__player.Play ()
+        else:
+            self.__player.Pause ()
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Stop (self):
+        self.log.debug ("Stop")
+        self.__player.Stop ()
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "",
+                          out_signature = "")
+    def Play (self):
+        self.log.debug ("Play")
+        state = self.__status[panflute.mpris.STATUS_STATE]
+        if state == panflute.mpris.STATE_PAUSED:
+            self.__player.Pause ()
+        elif state == panflute.mpris.STATE_STOPPED:
+            self.__player.Play ()
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "x",
+                          out_signature = "")
+    def Seek (self, offset):
+        self.log.debug ("Seek {0}".format (offset))
+        position = self.__current_position () + offset // 1000
+        length = self.__metadata.get ("mtime", 0)
+        if length > 0 and position > length:
+            self.__player.Next ()
+        else:
+            self.__player.PositionSet (max (0, position))
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "ox",
+                          out_signature = "")
+    def SetPosition (self, track_id, position):
+        self.log.debug ("SetPosition {0} {1}".format (track_id, position))
+        length = self.__metadata.get ("mtime", 0)
+        if track_id == self.__track_id () and position >= 0 and (length == 0 or position // 1000 <= length):
+            self.__player.PositionSet (position // 1000)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE,
+                          in_signature = "s",
+                          out_signature = "")
+    def OpenUri (self, uri):
+        self.log.debug ("OpenUri {0}".format (uri))
+        self.__track_list.AddTrack (uri, True)
+
+
+    @dbus.service.signal (dbus_interface = PLAYER_INTERFACE,
+                          signature = "x")
+    def Seeked (self, position):
+        self.log.debug ("sending Seeked {0}".format (position))
+
+
+    ##########################################################################
+    #
+    # org.freedesktop.DBus.Properties
+    #
+    ##########################################################################
+
+
+    @dbus.service.method (dbus_interface = PROPERTIES_INTERFACE,
+                          in_signature = "ss",
+                          out_signature = "v")
+    def Get (self, interface, name):
+        self.log.debug ("Get {0} {1}".format (interface, name))
+
+        if interface == PLAYER_INTERFACE and name == "Position" and self.__player.Supports ("PositionGet"):
+            # Clients are told not to cache the position, so an explicit
+            # request for it is worth asking the player about.
+            self.__check_position (self.__player.PositionGet ())
+
+        properties = self.__properties (interface)
+        if name not in properties:
+            raise dbus.exceptions.DBusException ("No property {0} on {1}".format (name, interface),
+                                                 name = "org.freedesktop.DBus.Error.InvalidArgs")
+        return properties[name]
+
+
+    @dbus.service.method (dbus_interface = PROPERTIES_INTERFACE,
+                          in_signature = "s",
+                          out_signature = "a{sv}")
+    def GetAll (self, interface):
+        self.log.debug ("GetAll {0}".format (interface))
+        return self.__properties (interface)
+
+
+    @dbus.service.method (dbus_interface = PROPERTIES_INTERFACE,
+                          in_signature = "ssv",
+                          out_signature = "")
+    def Set (self, interface, name, value):
+        self.log.debug ("Set {0} {1} {2}".format (interface, name, value))
+
+        if interface != PLAYER_INTERFACE:
+            raise dbus.exceptions.DBusException ("No writable property {0} on {1}".format (name, interface),
+                                                 name = "org.freedesktop.DBus.Error.InvalidArgs")
+
+        if name == "Volume":
+            volume = int (round (max (0.0, min (1.0, value)) * panflute.mpris.VOLUME_MAX))
+            self.__player.VolumeSet (volume)
+        elif name == "Shuffle":
+            self.__track_list.SetRandom (bool (value))
+        elif name == "LoopStatus":
+            self.__player.Repeat (value == "Track")
+            self.__track_list.SetLoop (value == "Playlist")
+        else:
+            raise dbus.exceptions.DBusException ("No writable property {0} on {1}".format (name, interface),
+                                                 name = "org.freedesktop.DBus.Error.InvalidArgs")
+
+
+    @dbus.service.signal (dbus_interface = PROPERTIES_INTERFACE,
+                          signature = "sa{sv}as")
+    def PropertiesChanged (self, interface, changed, invalidated):
+        self.log.debug ("sending PropertiesChanged {0} {1}".format (interface, changed.keys ()))
+
+
+    ##########################################################################
+    #
+    # Watching the MPRIS 1 Player
+    #
+    ##########################################################################
+
+
+    def track_changed (self, metadata):
+        """
+        Note the new metadata, starting a new track ID and position if a
+        different song is now playing.
+        """
+
+        if not panflute.daemon.mpris.is_same_track (self.__metadata, metadata):
+            self.__track_number += 1
+            self.__sample_position (0)
+        self.__metadata = dict (metadata)
+        self.__queue_changes (PLAYER_INTERFACE, ["Metadata"])
+
+
+    def status_changed (self, status):
+        """
+        Note the new playback status.
+        """
+
+        # Restart extrapolation from where playback was when it stopped or
+        # started moving.  Unless playback stopped, which puts it back at
+        # the start, that's worth asking the player about, since it's the
+        # only way to notice a seek made from within a player that isn't
+        # being polled.
+        old = self.__status
+        stopped = panflute.mpris.STATE_STOPPED in [old[panflute.mpris.STATUS_STATE],
+                                                   status[panflute.mpris.STATUS_STATE]]
+        if not stopped and self.__player.Supports ("PositionGet"):
+            self.__check_position (self.__player.PositionGet ())
+        else:
+            self.__sample_position (self.__current_position ())
+
+        self.__status = tuple (status)
+
+        names = []
+        if old[panflute.mpris.STATUS_STATE] != self.__status[panflute.mpris.STATUS_STATE]:
+            names.append ("PlaybackStatus")
+        if old[panflute.mpris.STATUS_ORDER] != self.__status[panflute.mpris.STATUS_ORDER]:
+            names.append ("Shuffle")
+        if old[panflute.mpris.STATUS_NEXT] != self.__status[panflute.mpris.STATUS_NEXT] or \
+           old[panflute.mpris.STATUS_FUTURE] != self.__status[panflute.mpris.STATUS_FUTURE]:
+            names.append ("LoopStatus")
+        self.__queue_changes (PLAYER_INTERFACE, names)
+
+
+    def caps_changed (self, caps):
+        """
+        Note the new capabilities.
+        """
+
+        self.__caps = caps
+        self.__queue_changes (PLAYER_INTERFACE, ["CanGoNext", "CanGoPrevious", "CanPlay",
+                                                 "CanPause", "CanSeek"])
+
+
+    def volume_changed (self, volume):
+        """
+        Note the new volume.
+        """
+
+        self.__volume = volume
+        self.__queue_changes (PLAYER_INTERFACE, ["Volume"])
+
+
+    def position_changed (self, position):
+        """
+        Note the latest position, reporting a seek if it's not where
+        playback was expected to be.
+        """
+
+        self.__check_position (position)
+
+
+    def seeked (self, position):
+        """
+        Report a seek made through Panflute.
+        """
+
+        self.__sample_position (position)
+        self.Seeked (position * 1000)
+
+
+    def feature_added (self, feature):
+        """
+        Nothing exposed over MPRIS 2 depends on the list of features.
+        """
+
+        pass
+
+
+    ##########################################################################
+    #
+    # Internals
+    #
+    ##########################################################################
+
+
+    def __queue_changes (self, interface, names):
+        """
+        Remember that some properties changed, to be reported the next time
+        the main loop is idle.
+        """
+
+        if len (names) > 0:
+            self.__pending.setdefault (interface, set ()).update (names)
+            if self.__flush_source is None:
+                self.__flush_source = gobject.idle_add (self.__flush_changes)
+
+
+    def __flush_changes (self):
+        """
+        Send a single PropertiesChanged for each interface with changes.
+        """
+
+        self.__flush_source = None
+        pending = self.__pending
+        self.__pending = {}
+
+        for interface in pending:
+            properties = self.__properties (interface)
+            changed = dict ((name, properties[name]) for name in pending[interface])
+            self.PropertiesChanged (interface, dbus.Dictionary (changed, signature = "sv"),
+                                    dbus.Array ([], signature = "s"))
+
+        return False
+
+
+    def __properties (self, interface):
+        """
+        Build the current values of every property on an interface.
+        """
+
+        if interface == ROOT_INTERFACE:
+            return dbus.Dictionary ({
+                "CanQuit":             True,
+                "CanRaise":            False,
+                "HasTrackList":        False,
+                "Identity":            self.__identity,
+                "SupportedUriSchemes": dbus.Array ([], signature = "s"),
+                "SupportedMimeTypes":  dbus.Array ([], signature = "s")
+            }, signature = "sv")
+
+        elif interface == PLAYER_INTERFACE:
+            caps = self.__caps
+            return dbus.Dictionary ({
+                "PlaybackStatus": self.__playback_status (),
+                "LoopStatus":     self.__loop_status (),
+                "Rate":           1.0,
+                "Shuffle":        self.__status[panflute.mpris.STATUS_ORDER] == panflute.mpris.ORDER_RANDOM,
+                "Metadata":       self.__translate_metadata (),
+                "Volume":         self.__volume / panflute.mpris.VOLUME_MAX,
+                "Position":       dbus.Int64 (self.__current_position () * 1000),
+                "MinimumRate":    1.0,
+                "MaximumRate":    1.0,
+                "CanGoNext":      (caps & panflute.mpris.CAN_GO_NEXT) != 0,
+                "CanGoPrevious":  (caps & panflute.mpris.CAN_GO_PREV) != 0,
+                "CanPlay":        (caps & panflute.mpris.CAN_PLAY) != 0,
+                "CanPause":       (caps & panflute.mpris.CAN_PAUSE) != 0,
+                "CanSeek":        (caps & panflute.mpris.CAN_SEEK) != 0,
+                "CanControl":     True
+            }, signature = "sv")
+
+        else:
+            raise dbus.exceptions.DBusException ("No such interface {0}".format (interface),
+                                                 name = "org.freedesktop.DBus.Error.InvalidArgs")
+
+
+    def __playback_status (self):
+        """
+        Translate the playback state to MPRIS 2 terms.
+        """
+
+        state = self.__status[panflute.mpris.STATUS_STATE]
+        if state == panflute.mpris.STATE_PLAYING:
+            return "Playing"
+        elif state == panflute.mpris.STATE_PAUSED:
+            return "Paused"
+        else:
+            return "Stopped"
+
+
+    def __loop_status (self):
+        """
+        Translate the repeat settings to MPRIS 2 terms.
+        """
+
+        if self.__status[panflute.mpris.STATUS_NEXT] == panflute.mpris.NEXT_REPEAT:
+            return "Track"
+        elif self.__status[panflute.mpris.STATUS_FUTURE] == panflute.mpris.FUTURE_CONTINUE:
+            return "Playlist"
+        else:
+            return "None"
+
+
+    def __track_id (self):
+        """
+        Get the object path identifying the current song.
+        """
+
+        if len (self.__metadata) > 0:
+            return TRACK_PATH.format (self.__track_number)
+        else:
+            return NO_TRACK
+
+
+    def __translate_metadata (self):
+        """
+        Translate the cached metadata to MPRIS 2 terms.
+        """
+
+        metadata = self.__metadata
+        result = {"mpris:trackid": dbus.ObjectPath (self.__track_id ())}
+
+        for key in STRING_FIELDS:
+            if key in metadata:
+                result[STRING_FIELDS[key]] = dbus.String (metadata[key])
+        for key in LIST_FIELDS:
+            if key in metadata:
+                result[LIST_FIELDS[key]] = dbus.Array ([metadata[key]], signature = "s")
+
+        if metadata.get ("mtime", 0) > 0:
+            result["mpris:length"] = dbus.Int64 (metadata["mtime"] * 1000)
+        if "tracknumber" in metadata:
+            try:
+                result["xesam:trackNumber"] = dbus.Int32 (int (metadata["tracknumber"].split ("/")[0]))
+            except ValueError:
+                pass
+        if "year" in metadata:
+            result["xesam:contentCreated"] = dbus.String ("{0:04d}".format (metadata["year"]))
+        if "rating" in metadata and metadata.get ("panflute rating scale", 0) > 0:
+            result["xesam:userRating"] = dbus.Double (metadata["rating"] / metadata["panflute rating scale"])
+
+        return dbus.Dictionary (result, signature = "sv")
+
+
+    def __sample_position (self, position):
+        """
+        Remember where playback was at this moment.
+        """
+
+        self.__position = position
+        self.__position_time = time.time ()
+
+
+    def __check_position (self, position):
+        """
+        Remember where the player says playback is, reporting a seek if it's
+        not where playback was expected to be.
+        """
+
+        expected = self.__current_position ()
+        self.__sample_position (position)
+        if abs (position - expected) > self.SEEK_TOLERANCE:
+            self.Seeked (position * 1000)
+
+
+    def __current_position (self):
+        """
+        Estimate the current position from the last one seen, without asking
+        the player.
+        """
+
+        if self.__status[panflute.mpris.STATUS_STATE] == panflute.mpris.STATE_PLAYING:
+            position = self.__position + int ((time.time () - self.__position_time) * 1000)
+            length = self.__metadata.get ("mtime", 0)
+            if length > 0:
+                position = min (position, length)
+            return position
+        else:
+            return self.__position
@@ -108,8 +108,8 @@ class Player (panflute.daemon.mpris.Player):
         self.cached_caps.all = self.NO_SONG_CAPS
 
         self.__handlers = [
-            self.__player.connect_to_signal ("StateChanged", self.__state_changed_cb),
-            self.__player.connect_to_signal ("SongChanged", self.__song_changed_cb)
+            self.connect_backend_signal (self.__player, "StateChanged", self.__state_changed_cb),
+            self.connect_backend_signal (self.__player, "SongChanged", self.__song_changed_cb)
         ]
 
         self.__player.GetPlaying (reply_handler = self.__state_changed_cb,
@@ -163,9 +163,9 @@ class Player (panflute.daemon.mpris.Player):
         self._player = dbus.Interface (proxy, panflute.mpris.INTERFACE)
 
         self.__handlers = [
-            self._player.connect_to_signal ("TrackChange", self.do_TrackChange),
-            self._player.connect_to_signal ("StatusChange", self.do_StatusChange),
-            self._player.connect_to_signal ("CapsChange", self.do_CapsChange)
+            self._player.connect_to_signal ("TrackChange", self.__track_change_cb),
+            self._player.connect_to_signal ("StatusChange", self.__status_change_cb),
+            self._player.connect_to_signal ("CapsChange", self.__caps_change_cb)
         ]
 
         self._player.GetStatus (reply_handler = self._get_status_cb,
@@ -284,11 +284,39 @@ class Player (panflute.daemon.mpris.Player):
         panflute.daemon.mpris.Player.do_TrackChange (self, metadata)
 
 
+    def __track_change_cb (self, metadata):
+        """
+        Pass along the player's own TrackChange signal.
+        """
+
+        self.stats.received ("TrackChange")
+        self.do_TrackChange (metadata)
+
+
+    def __status_change_cb (self, status):
+        """
+        Pass along the player's own StatusChange signal.
+        """
+
+        self.stats.received ("StatusChange")
+        self.do_StatusChange (status)
+
+
+    def __caps_change_cb (self, caps):
+        """
+        Pass along the player's own CapsChange signal.
+        """
+
+        self.stats.received ("CapsChange")
+        self.do_CapsChange (caps)
+
+
     def _get_status_cb (self, status):
         """
         Set up polling for position changes.
         """
 
+        self.backend_reported ("status", status)
         state = status[panflute.mpris.STATUS_STATE]
         if state == panflute.mpris.STATE_PLAYING:
             self.start_polling_for_time ()
@@ -352,6 +380,7 @@ class Player (panflute.daemon.mpris.Player):
         to decide whether things have changed.
         """
 
+        self.stats.poll_tick ()
         self.log.debug ("polling for radio stream metadata")
         self.cached_metadata = self.GetMetadata ()
         return True
@@ -77,8 +77,8 @@ class Player (panflute.daemon.mpris.Player):
                                panflute.mpris.CAN_PROVIDE_METADATA
 
         self.__handlers = [
-            self.__pithos.connect_to_signal ("PlayStateChanged", self.__play_state_changed_cb),
-            self.__pithos.connect_to_signal ("SongChanged", self.__song_changed_cb)
+            self.connect_backend_signal (self.__pithos, "PlayStateChanged", self.__play_state_changed_cb),
+            self.connect_backend_signal (self.__pithos, "SongChanged", self.__song_changed_cb)
         ]
 
         self.__pithos.IsPlaying (reply_handler = self.__play_state_changed_cb,
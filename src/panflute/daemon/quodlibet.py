@@ -86,10 +86,10 @@ class Player (panflute.daemon.mpris.Player):
         self.__ql = dbus.Interface (proxy, "net.sacredchao.QuodLibet")
 
         self.__handlers = [
-            self.__ql.connect_to_signal ("Paused", self.__paused_cb),
-            self.__ql.connect_to_signal ("Unpaused", self.__unpaused_cb),
-            self.__ql.connect_to_signal ("SongStarted", self.__song_started_cb),
-            self.__ql.connect_to_signal ("SongEnded", self.__song_ended_cb)
+            self.connect_backend_signal (self.__ql, "Paused", self.__paused_cb),
+            self.connect_backend_signal (self.__ql, "Unpaused", self.__unpaused_cb),
+            self.connect_backend_signal (self.__ql, "SongStarted", self.__song_started_cb),
+            self.connect_backend_signal (self.__ql, "SongEnded", self.__song_ended_cb)
         ]
 
         self.cached_caps.all = panflute.mpris.CAN_GO_NEXT | \
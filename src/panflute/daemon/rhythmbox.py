@@ -112,10 +112,10 @@ class Player (panflute.daemon.mpris.Player):
         self.__shell = dbus.Interface (proxy, "org.gnome.Rhythmbox.Shell")
 
         self.__handlers = [
-            self.__player.connect_to_signal ("playingChanged", self.__playing_changed_cb),
-            self.__player.connect_to_signal ("playingUriChanged", self.__uri_changed_cb),
-            self.__player.connect_to_signal ("playingSongPropertyChanged", self.__property_changed_cb),
-            self.__player.connect_to_signal ("elapsedChanged", self.__elapsed_changed_cb)
+            self.connect_backend_signal (self.__player, "playingChanged", self.__playing_changed_cb),
+            self.connect_backend_signal (self.__player, "playingUriChanged", self.__uri_changed_cb),
+            self.connect_backend_signal (self.__player, "playingSongPropertyChanged", self.__property_changed_cb),
+            self.connect_backend_signal (self.__player, "elapsedChanged", self.__elapsed_changed_cb)
         ]
 
         self.__player.getPlaying (reply_handler = self.__playing_changed_cb,
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Counters for how much work the daemon does on behalf of each connector.
+
+Counting something costs no more than a dictionary lookup and an addition,
+so the counters are always on.  They're exposed via D-Bus by the
+ManagerProxy.
+"""
+
+from __future__ import absolute_import
+
+import panflute.trace
+
+import bisect
+import dbus
+import gc
+import os
+
+
+class Counters (object):
+    """
+    Counters for one connector and the MPRIS objects created for it.
+    """
+
+    # Upper bounds, in ms, of each bucket of the latency histograms, except
+    # for the last bucket, which has none.
+    LATENCY_BUCKETS = [1, 5, 10, 50, 100, 500, 1000]
+
+
+    def __init__ (self):
+        self.__ever_connected = False
+
+        # What keeping the connector's MPRIS objects around costs: how much
+        # resident memory, in bytes, creating them took, and whether they're
+        # waiting on standby, where anything that wakes them up is overhead.
+        self.warm_size = 0
+        self.standby = False
+
+        self.reset ()
+
+
+    def reset (self):
+        """
+        Set every counter back to zero.
+        """
+
+        self.calls = {}
+        self.signals_received = {}
+        self.signals_emitted = {}
+        self.poll_ticks = 0
+        self.cache_hits = {}
+        self.cache_misses = {}
+        self.reconnects = 0
+        self.standby_wakeups = 0
+
+
+    def call (self, method, elapsed):
+        """
+        Count a call into the backend that took elapsed ms.
+        """
+
+        histogram = self.calls.get (method)
+        if histogram is None:
+            histogram = self.calls[method] = [0] * (len (self.LATENCY_BUCKETS) + 1)
+        histogram[bisect.bisect_left (self.LATENCY_BUCKETS, elapsed)] += 1
+
+
+    def received (self, signal):
+        """
+        Count a signal received from the backend.
+        """
+
+        self.signals_received[signal] = self.signals_received.get (signal, 0) + 1
+        if self.standby:
+            self.standby_wakeups += 1
+        panflute.trace.hop ("daemon received {0}".format (signal), panflute.trace.pending ())
+
+
+    def counted (self, signal, callback):
+        """
+        Wrap a callback for a signal from the backend so that each call to it
+        is counted.
+        """
+
+        def wrapper (*args, **kwargs):
+            self.received (signal)
+            return callback (*args, **kwargs)
+        return wrapper
+
+
+    def emitted (self, signal):
+        """
+        Count a signal sent to clients.
+        """
+
+        self.signals_emitted[signal] = self.signals_emitted.get (signal, 0) + 1
+
+
+    def poll_tick (self):
+        """
+        Count one round of polling.
+        """
+
+        self.poll_ticks += 1
+        if self.standby:
+            self.standby_wakeups += 1
+
+
+    def cache (self, name, hit):
+        """
+        Count an update to a cached value, which is a hit if the value
+        hadn't actually changed and so nothing needed to be sent.
+        """
+
+        if hit:
+            self.cache_hits[name] = self.cache_hits.get (name, 0) + 1
+        else:
+            self.cache_misses[name] = self.cache_misses.get (name, 0) + 1
+
+
+    def connected (self):
+        """
+        Note that the connector connected, which is a reconnect if it ever
+        did before.
+        """
+
+        if self.__ever_connected:
+            self.reconnects += 1
+        self.__ever_connected = True
+
+
+    def warmed (self, size):
+        """
+        Note that the connector's MPRIS objects were created, growing the
+        daemon's resident memory by size bytes, and start out on standby.
+        """
+
+        self.warm_size = max (0, size)
+        self.standby = True
+
+
+    def cooled (self):
+        """
+        Note that the connector's MPRIS objects were destroyed.
+        """
+
+        self.warm_size = 0
+        self.standby = False
+
+
+def resources ():
+    """
+    Measure what the daemon is holding on to: resident memory in kB, open
+    file descriptors, signal matches registered with the session bus, and
+    live Python objects by type.  Garbage is collected first so only objects
+    that are actually leaking get counted.
+    """
+
+    gc.collect ()
+
+    rss = 0
+    try:
+        with open ("/proc/self/status") as status:
+            for line in status:
+                if line.startswith ("VmRSS:"):
+                    rss = int (line.split ()[1])
+    except IOError:
+        # Not Linux; leave it at zero
+        pass
+
+    try:
+        fds = len (os.listdir ("/proc/self/fd"))
+    except OSError:
+        fds = 0
+
+    # dbus-python keeps every match by object path, interface and member.
+    matches = 0
+    recipients = getattr (dbus.SessionBus (), "_signal_recipients_by_object_path", {})
+    for by_interface in recipients.values ():
+        for by_member in by_interface.values ():
+            for match_list in by_member.values ():
+                matches += len (match_list)
+
+    objects = {}
+    for obj in gc.get_objects ():
+        cls = type (obj)
+        name = "{0}.{1}".format (cls.__module__, cls.__name__)
+        objects[name] = objects.get (name, 0) + 1
+
+    return {"rss": rss, "fds": fds, "matches": matches, "objects": objects}
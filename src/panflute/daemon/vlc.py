@@ -115,6 +115,7 @@ class Player (panflute.daemon.passthrough.Player):
         Poll for things that VLC 1.0.x doesn't reliably signal.
         """
 
+        self.stats.poll_tick ()
         self._player.GetCaps (reply_handler = self.__get_caps_cb,
                               error_handler = self.log.warn)
         self._player.GetStatus (reply_handler = self.__get_status_cb,
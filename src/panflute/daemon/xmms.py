@@ -168,6 +168,7 @@ class Player (panflute.daemon.mpris.Player):
         Poll for assorted status information.
         """
 
+        self.stats.poll_tick ()
         if xmms.control.is_paused ():
             self.cached_status.state = panflute.mpris.STATE_PAUSED
         elif xmms.control.is_playing ():
@@ -138,11 +138,12 @@ class Player (panflute.daemon.mpris.Player):
         self.cached_caps.all = panflute.mpris.CAN_PLAY
 
         self.log.debug ("setting up broadcasts and signals")
-        async.broadcast_playback_status (self.__playback_status_cb)
-        async.broadcast_playlist_current_pos (self.__playlist_current_pos_cb)
-        async.broadcast_playback_current_id (self.__playback_current_id_cb)
-        async.broadcast_medialib_entry_changed (self.__medialib_entry_changed_cb)
-        async.signal_playback_playtime (self.__playback_playtime_cb)
+        async.broadcast_playback_status (self.stats.counted ("playback_status", self.__playback_status_cb))
+        async.broadcast_playlist_current_pos (self.stats.counted ("playlist_current_pos", self.__playlist_current_pos_cb))
+        async.broadcast_playback_current_id (self.stats.counted ("playback_current_id", self.__playback_current_id_cb))
+        async.broadcast_medialib_entry_changed (self.stats.counted ("medialib_entry_changed",
+                                                                    self.__medialib_entry_changed_cb))
+        async.signal_playback_playtime (self.stats.counted ("playback_playtime", self.__playback_playtime_cb))
 
         self.log.debug ("starting basic calls")
         async.playback_status (self.__playback_status_cb)
@@ -23,6 +23,8 @@ The main window for the graphical debugger.
 
 from __future__ import absolute_import
 
+import panflute.debugger.eventlog
+import panflute.debugger.performance
 import panflute.mpris
 
 import dbus
@@ -49,12 +51,14 @@ class Debugger (object):
     LOG_GENERAL = _("General")
     LOG_DBUS    = _("D-Bus")
 
+    POSITION_INTERVAL = 1000
+
 
     def __init__ (self, builder):
         self.__player_store = builder.get_object ("player_store")
-        self.__event_store = builder.get_object ("event_store")
-        self.__initialize_player_tree ()
         self.__initialize_log (builder)
+        self.__performance = panflute.debugger.performance.Performance (self)
+        self.__initialize_player_tree ()
         self.__initialize_dbus (builder)
 
         builder.connect_signals (self)
@@ -64,6 +68,14 @@ class Debugger (object):
         gtk.main_quit ()
 
 
+    def performance_clicked_cb (self, button):
+        """
+        Called when the Performance button is clicked.
+        """
+
+        self.__performance.show ()
+
+
     def __initialize_player_tree (self):
         """
         Put the basic structural elements in the player store.
@@ -90,11 +102,15 @@ class Debugger (object):
 
         features = self.__player_store.append (None, (_("Features"), "", "", 0))
 
+        stalls = self.__player_store.append (None, (_("Main loop stalls"), "", "", 0))
+
         self.__position_path = self.__player_store.get_path (position)
         self.__caps_path = self.__player_store.get_path (caps)
         self.__status_path = self.__player_store.get_path (status)
         self.__track_path = self.__player_store.get_path (track)
         self.__features_path = self.__player_store.get_path (features)
+        self.__stalls_path = self.__player_store.get_path (stalls)
+        self.__last_stall = 0
 
 
     def __initialize_log (self, builder):
@@ -102,9 +118,19 @@ class Debugger (object):
         Set up the event log.
         """
 
+        self.__event_log = panflute.debugger.eventlog.EventLog (builder.get_object ("event_view"))
+
         column = builder.get_object ("timestamp_column")
         renderer = builder.get_object ("timestamp_renderer")
         column.set_cell_data_func (renderer, self.__render_timestamp, None)
+        self.__last_rendered = (None, None)
+
+        self.__filter_categories = [None, [self.LOG_GENERAL], [self.LOG_DBUS]]
+        filter_store = builder.get_object ("filter_store")
+        filter_store.append ((_("All categories"),))
+        filter_store.append ((self.LOG_GENERAL,))
+        filter_store.append ((self.LOG_DBUS,))
+        builder.get_object ("log_filter").set_active (0)
 
         self.log_info (self.LOG_GENERAL, _("Started debugger"))
 
@@ -115,18 +141,33 @@ class Debugger (object):
         """
 
         (raw,) = model.get (iter, self.COL_TIMESTAMP)
-        local = time.localtime (raw)
-        # To translators: Python strftime format string, e.g. 20-Jun-2010 14:24:59
-        text = time.strftime (_("%d-%b-%Y %H:%M:%S"), local)
+        seconds = int (raw)
+
+        # Rows logged in the same second are usually drawn one after another.
+        (last_seconds, text) = self.__last_rendered
+        if seconds != last_seconds:
+            local = time.localtime (seconds)
+            # To translators: Python strftime format string, e.g. 20-Jun-2010 14:24:59
+            text = time.strftime (_("%d-%b-%Y %H:%M:%S"), local)
+            self.__last_rendered = (seconds, text)
+
         cell.props.text = text
 
 
+    def log_filter_changed_cb (self, combo):
+        """
+        Show only the events in the chosen category.
+        """
+
+        self.__event_log.set_filter (self.__filter_categories[combo.get_active ()])
+
+
     def log (self, stock, category, message):
         """
         Add an event to the event log.
         """
 
-        self.__event_store.append ((time.time (), stock, category, message))
+        self.__event_log.append (stock, category, message)
 
 
     def log_info (self, category, message):
@@ -195,7 +236,15 @@ class Debugger (object):
         self.__player.connect_to_signal ("StatusChange", self.__status_change_cb)
         self.__player.connect_to_signal ("TrackChange", self.__track_change_cb)
         self.__player_ex.connect_to_signal ("PositionChange", self.__position_change_cb)
+        self.__player_ex.connect_to_signal ("MetadataChanged", self.__metadata_changed_cb)
+        self.__player_ex.SubscribePosition (self.POSITION_INTERVAL,
+                                            reply_handler = lambda: None,
+                                            error_handler = self.log_dbus_error)
 
+        proxy = bus.get_object ("org.kuliniewicz.Panflute", "/connectors")
+        self.__manager = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Manager")
+
+        self.__performance.connect_proxies (self.__player, self.__player_ex, proxy)
         self.__refresh_button.props.sensitive = True
 
 
@@ -205,8 +254,10 @@ class Debugger (object):
         """
 
         self.__refresh_button.props.sensitive = False
+        self.__performance.disconnect_proxies ()
         self.__player = None
         self.__player_ex = None
+        self.__manager = None
 
 
     def __name_owner_changed_cb (self, name, old_owner, new_owner):
@@ -248,6 +299,31 @@ class Debugger (object):
         Directly fetch the current status information from Panflute.
         """
 
+        self.__player_ex.GetSnapshot (reply_handler = self.__get_snapshot_cb,
+                                      error_handler = self.__get_snapshot_error_cb)
+        self.__manager.GetStalls (reply_handler = self.__get_stalls_cb,
+                                  error_handler = self.log_dbus_error)
+
+
+    def __get_snapshot_cb (self, snapshot):
+        """
+        Update all the directly-fetched values at once.
+        """
+
+        self.log_info (self.LOG_DBUS, _("Received snapshot version {0}").format (snapshot["version"]))
+        self.__get_caps_cb (snapshot["caps"])
+        self.__get_status_cb (snapshot["status"])
+        self.__get_metadata_cb (snapshot["metadata"])
+        self.__position_get_cb (snapshot["position"])
+        self.__get_features_cb (snapshot["features"])
+
+
+    def __get_snapshot_error_cb (self, error):
+        """
+        Fetch each value separately if a snapshot isn't available.
+        """
+
+        self.log_warning (self.LOG_DBUS, _("GetSnapshot failed: {0}").format (error))
         self.__player.GetCaps (reply_handler = self.__get_caps_cb,
                                error_handler = self.log_dbus_error)
         self.__player.GetStatus (reply_handler = self.__get_status_cb,
@@ -375,6 +451,19 @@ class Debugger (object):
         self.__display_track (info, self.COL_SIGNALLED)
 
 
+    def __metadata_changed_cb (self, changed, removed, new_track, version):
+        """
+        Log the fields reported as changed.
+        """
+
+        if new_track:
+            kind = _("new track")
+        else:
+            kind = _("same track")
+        self.log_info (self.LOG_DBUS, _("Received {0} signal ({1}, version {2}): changed {3}, removed {4}").format (
+            "MetadataChanged", kind, version, ", ".join (sorted (changed.keys ())), ", ".join (sorted (removed))))
+
+
     def __display_track (self, info, column):
         """
         Update the track information in one column of the display.
@@ -470,3 +559,35 @@ class Debugger (object):
 
         for feature in features:
             self.__player_store.append (parent, ("", "", feature, 0))
+
+
+    def __get_stalls_cb (self, stalls):
+        """
+        Update the histogram of the daemon's main loop stalls, and log any
+        new ones that were long enough to be reported.
+        """
+
+        node = self.__player_store.get_iter (self.__stalls_path)
+        child = self.__player_store.iter_children (node)
+        if child is not None:
+            while self.__player_store.remove (child):
+                pass    # child gets updated after each call to remove
+
+        if len (stalls) == 0:
+            self.__player_store.set (node, self.COL_DIRECT, _("Watchdog disabled"))
+            return
+
+        self.__player_store.set (node, self.COL_DIRECT, _("Longest {0} ms").format (stalls["longest"]))
+
+        bounds = stalls["bounds"]
+        for (i, count) in enumerate (stalls["counts"]):
+            if i < len (bounds):
+                label = _("Up to {0} ms").format (bounds[i])
+            else:
+                label = _("Over {0} ms").format (bounds[-1])
+            self.__player_store.append (node, (label, "", str (count), 0))
+
+        for (when, duration, culprit) in stalls["recent"]:
+            if when > self.__last_stall:
+                self.log_warning (self.LOG_GENERAL, _("Daemon main loop stalled for {0} ms in {1}").format (duration, culprit))
+                self.__last_stall = when
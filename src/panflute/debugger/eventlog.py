@@ -0,0 +1,316 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+The model behind the debugger's event log.
+
+A busy daemon can send hundreds of signals a second, and logging each as
+its own row in a gtk.ListStore makes the debugger grow without bound and
+the view crawl.  The EventLog only keeps the newest events, folds repeats
+of the same message into one row, and only tells the view about changes a
+few times a second.
+"""
+
+from __future__ import absolute_import
+
+import collections
+from   gettext import gettext as _
+import gobject
+import gtk
+import time
+
+
+class Entry (object):
+    """
+    One row of the log, standing for every time its message was logged
+    since first.
+    """
+
+    __slots__ = ["first", "last", "stock", "category", "message", "count", "row"]
+
+
+    def __init__ (self, when, stock, category, message):
+        self.first = when
+        self.last = when
+        self.stock = stock
+        self.category = category
+        self.message = message
+        self.count = 1
+        self.row = None
+
+
+##############################################################################
+
+
+class EventLog (gtk.GenericTreeModel):
+    """
+    A list model holding the newest CAPACITY entries of the event log.
+
+    A message logged again within COLLAPSE_WINDOW seconds of when it was
+    first logged just bumps the count of the existing entry.  Only entries
+    in the categories being shown are rows of the model.
+
+    New events are queued and added every FLUSH_INTERVAL ms.  If too many
+    arrived in the meantime to be worth telling the view about one at a
+    time, the view is detached while they're added.
+    """
+
+    COL_TIMESTAMP = 0
+    COL_STOCK     = 1
+    COL_CATEGORY  = 2
+    COL_MESSAGE   = 3
+
+    CAPACITY = 2000
+    COLLAPSE_WINDOW = 60
+    FLUSH_INTERVAL = 200
+    RESET_THRESHOLD = 50
+
+
+    def __init__ (self, view):
+        gtk.GenericTreeModel.__init__ (self)
+
+        # Entries are kept alive by the model for as long as they're rows,
+        # so the view's iters can refer to them directly.
+        self.props.leak_references = False
+
+        self.__view = view
+        self.__attached = True
+
+        self.__entries = collections.deque ()
+        self.__rows = collections.deque ()
+        self.__removed = 0
+        self.__repeats = {}
+        self.__categories = None
+
+        self.__pending = []
+        self.__flush_source = None
+
+        view.set_model (self)
+
+
+    def append (self, stock, category, message):
+        """
+        Queue an event to be added to the log.
+        """
+
+        self.__pending.append ((time.time (), stock, category, message))
+        if self.__flush_source is None:
+            self.__flush_source = gobject.timeout_add (self.FLUSH_INTERVAL, self.__flush_cb)
+
+
+    def set_filter (self, categories):
+        """
+        Show only the entries in the given categories, or every entry if
+        categories is None.
+        """
+
+        self.__detach ()
+        self.__categories = categories
+        for entry in self.__entries:
+            entry.row = None
+        self.__rows = collections.deque (entry for entry in self.__entries if self.__visible (entry))
+        self.__removed = 0
+        for (i, entry) in enumerate (self.__rows):
+            entry.row = i
+        self.__attach ()
+
+
+    def __visible (self, entry):
+        """
+        Check whether an entry is in one of the categories being shown.
+        """
+
+        return self.__categories is None or entry.category in self.__categories
+
+
+    def __flush_cb (self):
+        """
+        Add all the queued events to the log.
+        """
+
+        pending = self.__pending
+        self.__pending = []
+        self.__flush_source = None
+
+        if len (pending) > self.RESET_THRESHOLD:
+            self.__detach ()
+        for event in pending:
+            self.__add (*event)
+        self.__attach ()
+
+        return False
+
+
+    def __add (self, when, stock, category, message):
+        """
+        Add one event to the log, either as a new entry or as a repeat of a
+        recent one.
+        """
+
+        key = (stock, category, message)
+        entry = self.__repeats.get (key)
+        if entry is not None and when - entry.first <= self.COLLAPSE_WINDOW:
+            entry.last = when
+            entry.count += 1
+            if entry.row is not None and self.__attached:
+                path = (entry.row - self.__removed,)
+                self.row_changed (path, self.get_iter (path))
+            return
+
+        if len (self.__entries) >= self.CAPACITY:
+            self.__evict ()
+
+        entry = Entry (when, stock, category, message)
+        self.__entries.append (entry)
+        self.__repeats[key] = entry
+
+        if self.__visible (entry):
+            entry.row = self.__removed + len (self.__rows)
+            self.__rows.append (entry)
+            if self.__attached:
+                path = (len (self.__rows) - 1,)
+                self.row_inserted (path, self.get_iter (path))
+
+
+    def __evict (self):
+        """
+        Remove the oldest entry from the log.
+        """
+
+        entry = self.__entries.popleft ()
+        key = (entry.stock, entry.category, entry.message)
+        if self.__repeats.get (key) is entry:
+            del self.__repeats[key]
+
+        if entry.row is not None:
+            self.__rows.popleft ()
+            self.__removed += 1
+            entry.row = None
+            if self.__attached:
+                self.row_deleted ((0,))
+
+
+    def __detach (self):
+        """
+        Disconnect the view so it doesn't hear about each change.
+        """
+
+        if self.__attached:
+            self.__view.set_model (None)
+            self.__attached = False
+
+
+    def __attach (self):
+        """
+        Reconnect the view, which then rereads whatever rows it displays.
+        """
+
+        if not self.__attached:
+            self.__view.set_model (self)
+            self.__attached = True
+
+
+    ##########################################################################
+    #
+    # gtk.GenericTreeModel implementation
+    #
+    ##########################################################################
+
+
+    def on_get_flags (self):
+        return gtk.TREE_MODEL_LIST_ONLY
+
+
+    def on_get_n_columns (self):
+        return 4
+
+
+    def on_get_column_type (self, index):
+        if index == self.COL_TIMESTAMP:
+            return gobject.TYPE_DOUBLE
+        else:
+            return gobject.TYPE_STRING
+
+
+    def on_get_iter (self, path):
+        return self.__nth (path[0])
+
+
+    def on_get_path (self, rowref):
+        return (rowref.row - self.__removed,)
+
+
+    def on_get_value (self, rowref, column):
+        if column == self.COL_TIMESTAMP:
+            return rowref.last
+        elif column == self.COL_STOCK:
+            return rowref.stock
+        elif column == self.COL_CATEGORY:
+            return rowref.category
+        elif rowref.count > 1:
+            # To translators: a message that was logged several times in a row
+            return _("{message} (x{count} in last {seconds} s)").format (message = rowref.message,
+                                                                            count = rowref.count,
+                                                                            seconds = int (rowref.last - rowref.first))
+        else:
+            return rowref.message
+
+
+    def on_iter_next (self, rowref):
+        return self.__nth (rowref.row - self.__removed + 1)
+
+
+    def on_iter_children (self, parent):
+        if parent is None:
+            return self.__nth (0)
+        else:
+            return None
+
+
+    def on_iter_has_child (self, rowref):
+        return False
+
+
+    def on_iter_n_children (self, rowref):
+        if rowref is None:
+            return len (self.__rows)
+        else:
+            return 0
+
+
+    def on_iter_nth_child (self, parent, n):
+        if parent is None:
+            return self.__nth (n)
+        else:
+            return None
+
+
+    def on_iter_parent (self, child):
+        return None
+
+
+    def __nth (self, n):
+        """
+        Get the entry in row n, if there is one.
+        """
+
+        if 0 <= n < len (self.__rows):
+            return self.__rows[n]
+        else:
+            return None
@@ -0,0 +1,414 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+The debugger's performance window.
+
+Everything the debugger can see of the daemon's performance from the
+outside is measured here: how often each signal arrives, how long a command
+takes to be confirmed by a signal, and how big TrackChange signals are.  If
+the daemon keeps its own counters, those are shown too.
+"""
+
+from __future__ import absolute_import
+
+import panflute.defs
+
+import collections
+import csv
+import dbus
+from   gettext import gettext as _
+import gobject
+import gtk
+import os.path
+import time
+
+
+class Performance (object):
+    """
+    The performance window and the measurements behind it.
+    """
+
+    COL_NAME  = 0
+    COL_VALUE = 1
+
+    SIGNALS = ["CapsChange", "StatusChange", "TrackChange", "PositionChange",
+               "MetadataChanged", "FeatureAdded"]
+
+    # How far back signal rates are averaged over, in seconds.
+    RATE_WINDOW = 10
+
+    # How long to wait for the signal confirming a command, in seconds.
+    CONFIRM_TIMEOUT = 5
+
+    # A PositionChange within this many ms of the position asked for
+    # confirms a PositionSet.
+    SEEK_TOLERANCE = 2000
+
+    REFRESH_INTERVAL = 1000
+    MAX_SAMPLES = 10000
+
+
+    def __init__ (self, debugger):
+        builder = gtk.Builder ()
+        builder.add_from_file (os.path.join (panflute.defs.PKG_DATA_DIR, "performance.ui"))
+
+        self.__window = builder.get_object ("performance")
+        self.__store = builder.get_object ("performance_store")
+        self.__command_buttons = [builder.get_object (name) for name in
+                                  ["performance_play", "performance_pause",
+                                   "performance_next", "performance_rewind"]]
+        self.__debugger = debugger
+
+        self.__player = None
+        self.__player_ex = None
+        self.__manager = None
+        self.__matches = []
+        self.__refresh_source = None
+
+        self.__samples = collections.deque (maxlen = self.MAX_SAMPLES)
+        self.__signal_times = dict ((name, collections.deque ()) for name in self.SIGNALS)
+        self.__signal_totals = dict ((name, 0) for name in self.SIGNALS)
+        self.__latencies = {}
+        self.__pending = []
+        self.__payloads = []
+
+        self.__stats = None
+        self.__last_stats = None
+        self.__last_stats_time = None
+        self.__stalls = None
+        self.__last_stall = 0
+
+        self.__set_buttons_sensitive ()
+        builder.connect_signals (self)
+
+
+    def show (self):
+        """
+        Show the window, and start keeping it up to date.
+        """
+
+        self.__window.present ()
+        if self.__refresh_source is None:
+            self.__refresh_source = gobject.timeout_add (self.REFRESH_INTERVAL, self.__refresh_cb)
+            self.__refresh_cb ()
+
+
+    def performance_delete_event_cb (self, window, event):
+        window.hide ()
+        if self.__refresh_source is not None:
+            gobject.source_remove (self.__refresh_source)
+            self.__refresh_source = None
+        return True
+
+
+    def connect_proxies (self, player, player_ex, connectors):
+        """
+        Start watching the signals sent by a newly available daemon.
+        """
+
+        self.__player = player
+        self.__player_ex = player_ex
+        self.__manager = dbus.Interface (connectors, "org.kuliniewicz.Panflute.Manager")
+        self.__stats = dbus.Interface (connectors, "org.kuliniewicz.Panflute.Stats")
+
+        for name in self.SIGNALS:
+            if name in ["CapsChange", "StatusChange", "TrackChange"]:
+                proxy = player
+            else:
+                proxy = player_ex
+            self.__matches.append (proxy.connect_to_signal (name, lambda *args, **kwargs: self.__signal_cb (kwargs["member"], args),
+                                                            member_keyword = "member"))
+
+        self.__last_stats = None
+        self.__set_buttons_sensitive ()
+
+
+    def disconnect_proxies (self):
+        """
+        Stop watching the signals of a daemon that has gone away.
+        """
+
+        for match in self.__matches:
+            match.remove ()
+        self.__matches = []
+
+        self.__player = None
+        self.__player_ex = None
+        self.__manager = None
+        self.__stats = None
+        self.__pending = []
+        self.__set_buttons_sensitive ()
+
+
+    def __set_buttons_sensitive (self):
+        """
+        Only allow commands to be sent while there's a daemon to send them to.
+        """
+
+        for button in self.__command_buttons:
+            button.props.sensitive = (self.__player is not None)
+
+
+    def __sample (self, kind, name, value):
+        """
+        Record a measurement for export.
+        """
+
+        self.__samples.append ((time.time (), kind, name, value))
+
+
+    ##########################################################################
+    #
+    # Observed signals
+    #
+    ##########################################################################
+
+
+    def __signal_cb (self, name, args):
+        """
+        Count a signal, and see if it confirms any pending command.
+        """
+
+        now = time.time ()
+        self.__signal_times[name].append (now)
+        self.__signal_totals[name] += 1
+        self.__sample ("signal", name, 1)
+
+        if name == "TrackChange":
+            size = payload_size (args[0])
+            self.__payloads.append (size)
+            self.__sample ("payload", name, size)
+
+        for command in list (self.__pending):
+            (label, signal, check, start) = command
+            if signal == name and check (*args):
+                self.__pending.remove (command)
+                latency = int ((now - start) * 1000)
+                self.__latencies.setdefault (label, []).append (latency)
+                self.__sample ("latency", label, latency)
+
+
+    ##########################################################################
+    #
+    # Commands
+    #
+    ##########################################################################
+
+
+    def performance_play_clicked_cb (self, button):
+        self.__issue (_("Play until StatusChange"), self.__player.Play, "StatusChange",
+                      lambda status: True)
+
+
+    def performance_pause_clicked_cb (self, button):
+        self.__issue (_("Pause until StatusChange"), self.__player.Pause, "StatusChange",
+                      lambda status: True)
+
+
+    def performance_next_clicked_cb (self, button):
+        self.__issue (_("Next until TrackChange"), self.__player.Next, "TrackChange",
+                      lambda metadata: True)
+
+
+    def performance_rewind_clicked_cb (self, button):
+        self.__issue (_("PositionSet until PositionChange"), lambda **kwargs: self.__player.PositionSet (0, **kwargs),
+                      "PositionChange", lambda position: position < self.SEEK_TOLERANCE)
+
+
+    def __issue (self, label, method, signal, check):
+        """
+        Send a command and wait for the signal, accepted by check, that
+        confirms it took effect.
+        """
+
+        command = (label, signal, check, time.time ())
+        self.__pending = [pending for pending in self.__pending if pending[0] != label]
+        self.__pending.append (command)
+        method (reply_handler = lambda: None,
+                error_handler = self.__debugger.log_dbus_error)
+
+
+    ##########################################################################
+    #
+    # Daemon counters
+    #
+    ##########################################################################
+
+
+    def __get_stats_cb (self, snapshot):
+        """
+        Remember the daemon's counters, and record how fast they're going up.
+        """
+
+        now = time.time ()
+        if self.__last_stats is not None:
+            elapsed = now - self.__last_stats_time
+            for (conn, (emitted, calls, polls)) in totals (snapshot).iteritems ():
+                if conn in self.__last_stats:
+                    (old_emitted, old_calls, old_polls) = self.__last_stats[conn]
+                    self.__sample ("daemon", "{0} signals/s".format (conn), (emitted - old_emitted) / elapsed)
+                    self.__sample ("daemon", "{0} calls/s".format (conn), (calls - old_calls) / elapsed)
+                    self.__sample ("daemon", "{0} polls/s".format (conn), (polls - old_polls) / elapsed)
+
+        self.__last_stats = totals (snapshot)
+        self.__last_stats_time = now
+
+
+    def __get_stats_error_cb (self, error):
+        """
+        Older daemons don't keep counters, so stop asking.
+        """
+
+        self.__debugger.log_warning (self.__debugger.LOG_DBUS, _("Daemon counters unavailable: {0}").format (error))
+        self.__stats = None
+
+
+    def __get_stalls_cb (self, stalls):
+        """
+        Record any main loop stalls reported since the last time.
+        """
+
+        self.__stalls = stalls
+        for (when, duration, culprit) in stalls.get ("recent", []):
+            if when > self.__last_stall:
+                self.__samples.append ((when, "stall", culprit, duration))
+                self.__last_stall = when
+
+
+    ##########################################################################
+    #
+    # Display
+    #
+    ##########################################################################
+
+
+    def __refresh_cb (self):
+        """
+        Ask the daemon for its latest counters and redraw everything.
+        """
+
+        if self.__stats is not None:
+            self.__stats.Snapshot (reply_handler = self.__get_stats_cb,
+                                   error_handler = self.__get_stats_error_cb)
+        if self.__manager is not None:
+            self.__manager.GetStalls (reply_handler = self.__get_stalls_cb,
+                                      error_handler = self.__debugger.log_dbus_error)
+
+        now = time.time ()
+        for (label, signal, check, start) in list (self.__pending):
+            if now - start > self.CONFIRM_TIMEOUT:
+                self.__pending.remove ((label, signal, check, start))
+                self.__debugger.log_warning (self.__debugger.LOG_GENERAL,
+                                             _("No {0} within {1} s").format (signal, self.CONFIRM_TIMEOUT))
+
+        self.__store.clear ()
+
+        node = self.__store.append (None, (_("Signal rates"), _("last {0} s").format (self.RATE_WINDOW)))
+        for name in self.SIGNALS:
+            times = self.__signal_times[name]
+            while len (times) > 0 and times[0] < now - self.RATE_WINDOW:
+                times.popleft ()
+            self.__store.append (node, (name, _("{0:.1f}/s ({1} total)").format (len (times) / float (self.RATE_WINDOW),
+                                                                                 self.__signal_totals[name])))
+
+        node = self.__store.append (None, (_("Command latency"), ""))
+        for label in sorted (self.__latencies):
+            latencies = self.__latencies[label]
+            self.__store.append (node, (label, _("last {0} ms, mean {1} ms, max {2} ms").format (
+                latencies[-1], sum (latencies) // len (latencies), max (latencies))))
+        for (label, signal, check, start) in self.__pending:
+            self.__store.append (node, (label, _("waiting")))
+
+        node = self.__store.append (None, (_("TrackChange payload"), ""))
+        if len (self.__payloads) > 0:
+            self.__store.set (node, self.COL_VALUE, _("last {0} bytes, mean {1}, max {2}").format (
+                self.__payloads[-1], sum (self.__payloads) // len (self.__payloads), max (self.__payloads)))
+
+        node = self.__store.append (None, (_("Main loop stalls"), ""))
+        if self.__stalls is not None and len (self.__stalls) > 0:
+            self.__store.set (node, self.COL_VALUE, _("{0} in total, longest {1} ms").format (
+                sum (self.__stalls["counts"]), self.__stalls["longest"]))
+            for (when, duration, culprit) in self.__stalls["recent"]:
+                self.__store.append (node, (culprit, _("{0} ms").format (duration)))
+
+        node = self.__store.append (None, (_("Daemon counters"), ""))
+        if self.__last_stats is not None:
+            for conn in sorted (self.__last_stats):
+                (emitted, calls, polls) = self.__last_stats[conn]
+                if emitted + calls + polls > 0:
+                    self.__store.append (node, (conn, _("{0} signals sent, {1} backend calls, {2} polls").format (
+                        emitted, calls, polls)))
+        else:
+            self.__store.set (node, self.COL_VALUE, _("unavailable"))
+
+        return True
+
+
+    def performance_export_clicked_cb (self, button):
+        """
+        Save every sample taken so far as CSV.
+        """
+
+        dialog = gtk.FileChooserDialog (_("Export Samples"), self.__window, gtk.FILE_CHOOSER_ACTION_SAVE,
+                                        (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL, gtk.STOCK_SAVE, gtk.RESPONSE_ACCEPT))
+        dialog.set_do_overwrite_confirmation (True)
+        dialog.set_current_name ("panflute-performance.csv")
+
+        if dialog.run () == gtk.RESPONSE_ACCEPT:
+            filename = dialog.get_filename ()
+            try:
+                with open (filename, "wb") as output:
+                    writer = csv.writer (output)
+                    writer.writerow (["time", "kind", "name", "value"])
+                    for (when, kind, name, value) in self.__samples:
+                        writer.writerow (["{0:.3f}".format (when), kind, name.encode ("utf-8"), value])
+                self.__debugger.log_info (self.__debugger.LOG_GENERAL,
+                                          _("Exported {0} samples to {1}").format (len (self.__samples), filename))
+            except IOError, e:
+                self.__debugger.log_error (self.__debugger.LOG_GENERAL, _("Export failed: {0}").format (e))
+
+        dialog.destroy ()
+
+
+##############################################################################
+
+
+def payload_size (metadata):
+    """
+    Approximate how many bytes a metadata dictionary takes up on the wire:
+    the UTF-8 text of each key and value.
+    """
+
+    return sum (len (unicode (key).encode ("utf-8")) + len (unicode (value).encode ("utf-8"))
+                for (key, value) in metadata.iteritems ())
+
+
+def totals (snapshot):
+    """
+    Sum up the signals sent, backend calls and poll ticks for each connector
+    in a Stats snapshot.
+    """
+
+    result = {}
+    for (conn, stats) in snapshot.iteritems ():
+        result[conn] = (sum (stats["signals_emitted"].values ()),
+                        sum (sum (histogram) for histogram in stats["calls"].values ()),
+                        stats["poll_ticks"])
+    return result
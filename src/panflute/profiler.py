@@ -0,0 +1,237 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+
+"""
+Profiler that can be turned on and off while the daemon or applet runs.
+
+CPU spikes in the field -- the scroller animating, a backend being polled,
+album art being decoded -- rarely show up when the process is restarted
+with special flags.  Sending the process SIGUSR1 (or, for the daemon,
+calling StartProfiling on its stats interface) starts profiling, and doing
+it again writes out what was collected.
+
+The main thread, where the main loop runs, is profiled with cProfile.  Any
+other threads, such as the applet's art loader, can't be profiled that way
+once they're running, so their stacks are sampled instead.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.util
+
+import cProfile
+import fcntl
+import gobject
+import os
+import os.path
+import signal
+import sys
+import threading
+import time
+
+
+class Profiler (object):
+    """
+    Profiles the process whenever it's turned on, writing the results to
+    <process>-<timestamp>.prof in Panflute's data directory when turned
+    off.  That file can be read with the pstats module.  Samples of the
+    other threads' stacks go in <process>-<timestamp>.threads, one stack
+    per line followed by how many times it was seen, in the format flame
+    graph tools expect.
+
+    The profiler has to be created in the main thread.
+    """
+
+    from panflute.util import log
+
+    SAMPLE_INTERVAL = 10
+
+
+    def __init__ (self, process_name):
+        self.process_name = process_name
+
+        self.__main_thread = threading.current_thread ().ident
+        self.__profile = None
+        self.__started = None
+        self.__sampler = None
+        self.__samples = {}
+        self.__wakeup = None
+
+
+    @property
+    def running (self):
+        """
+        Whether the process is currently being profiled.
+        """
+
+        return self.__profile is not None
+
+
+    def start (self):
+        """
+        Start profiling, if not already doing so.
+        """
+
+        if self.__profile is not None:
+            return
+
+        self.log.info ("Starting profiler")
+        self.__started = time.time ()
+        self.__samples = {}
+        self.__sampler = Sampler (self.__main_thread, self.SAMPLE_INTERVAL, self.__samples)
+        self.__sampler.start ()
+        self.__profile = cProfile.Profile ()
+        self.__profile.enable ()
+
+
+    def stop (self):
+        """
+        Stop profiling and write out the results, returning the name of the
+        profile file, or None if the profiler wasn't running.
+        """
+
+        if self.__profile is None:
+            return None
+
+        self.__profile.disable ()
+        self.__sampler.stop ()
+
+        stamp = time.strftime ("%Y%m%d-%H%M%S", time.localtime (self.__started))
+        base = os.path.join (panflute.util.get_xdg_data_home_directory (),
+                             "{0}-{1}".format (self.process_name, stamp))
+
+        self.__profile.dump_stats (base + ".prof")
+        if len (self.__samples) > 0:
+            with open (base + ".threads", "w") as output:
+                for (stack, count) in sorted (self.__samples.iteritems ()):
+                    output.write ("{0} {1}\n".format (stack, count))
+
+        self.__profile = None
+        self.__sampler = None
+        self.__samples = {}
+
+        self.log.info ("Profile written to {0}.prof".format (base))
+        return base + ".prof"
+
+
+    def toggle (self):
+        """
+        Start profiling if not already, or stop and write out the results
+        if so.
+        """
+
+        if self.__profile is None:
+            self.start ()
+        else:
+            try:
+                self.stop ()
+            except (IOError, OSError), e:
+                self.log.warn ("Couldn't write profile: {0}".format (e))
+
+
+    def toggle_on_signal (self, signum = signal.SIGUSR1):
+        """
+        Toggle the profiler whenever the process receives a signal.
+        """
+
+        # Python only runs signal handlers when the interpreter gets control
+        # back, which could be a long time coming while the main loop waits.
+        # Having the signal write to a pipe the main loop watches wakes it
+        # up right away.
+
+        if self.__wakeup is None:
+            (read_fd, write_fd) = os.pipe ()
+            for fd in [read_fd, write_fd]:
+                flags = fcntl.fcntl (fd, fcntl.F_GETFL)
+                fcntl.fcntl (fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            signal.set_wakeup_fd (write_fd)
+            gobject.io_add_watch (read_fd, gobject.IO_IN, self.__wakeup_cb)
+            self.__wakeup = (read_fd, write_fd)
+
+        signal.signal (signum, self.__signal_cb)
+
+
+    def __signal_cb (self, signum, frame):
+        """
+        Toggle the profiler from the main loop, rather than from within
+        whatever code the signal interrupted.
+        """
+
+        gobject.idle_add (lambda: self.toggle () and False)
+
+
+    def __wakeup_cb (self, fd, condition):
+        """
+        Empty the wakeup pipe; the signal handler itself has run by now.
+        """
+
+        try:
+            os.read (fd, 512)
+        except OSError:
+            pass
+        return True
+
+
+##############################################################################
+
+
+class Sampler (threading.Thread):
+    """
+    Thread that periodically records what every thread other than the main
+    one is doing, counting how often each stack is seen.
+    """
+
+    def __init__ (self, main_thread, interval, samples):
+        threading.Thread.__init__ (self, name = "Profiler sampler")
+        self.daemon = True
+        self.__main_thread = main_thread
+        self.__interval = interval
+        self.__samples = samples
+        self.__stopped = threading.Event ()
+
+
+    def stop (self):
+        """
+        Stop sampling, waiting for the thread to finish so the samples can
+        be read safely.
+        """
+
+        self.__stopped.set ()
+        self.join ()
+
+
+    def run (self):
+        names = {}
+        while not self.__stopped.wait (self.__interval / 1000):
+            for thread in threading.enumerate ():
+                names[thread.ident] = thread.name
+
+            for (ident, frame) in sys._current_frames ().items ():
+                if ident == self.__main_thread or ident == self.ident:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append ("{0}:{1}".format (os.path.basename (code.co_filename), code.co_name))
+                    frame = frame.f_back
+                stack.append (names.get (ident, str (ident)).replace (" ", "_"))
+                key = ";".join (reversed (stack)).replace (" ", "_")
+                self.__samples[key] = self.__samples.get (key, 0) + 1
@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+
+"""
+Benchmark for how long the daemon takes to come back after exiting.
+
+Each round stops whatever daemon is running, then times a call to the
+Manager interface from the moment it's sent until the reply arrives.  That
+covers D-Bus activation (or starting the daemon by hand), importing
+everything, building the Manager, and the main loop getting to the call.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import panflute.tests.testcase
+
+import dbus
+import os
+import signal
+import subprocess
+import time
+
+
+BUS_NAME = "org.kuliniewicz.Panflute"
+MANAGER_INTERFACE = "org.kuliniewicz.Panflute.Manager"
+
+TIMEOUT = 30
+RETRY_INTERVAL = 0.01
+
+
+class ActivationError (Exception):
+    """
+    The daemon didn't stop or start when it should have.
+    """
+
+    pass
+
+
+##############################################################################
+
+
+class Activation (object):
+    """
+    Times restarting the daemon, either by D-Bus activation or, if command
+    is given, by running that.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, command = None):
+        self.__command = command
+        self.__child = None
+
+        self.__conn = dbus.SessionBus ()
+        proxy = self.__conn.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+        self.__bus = dbus.Interface (proxy, "org.freedesktop.DBus")
+
+
+    def stop_daemon (self):
+        """
+        Stop the daemon if it's running, and wait until it's gone from the
+        bus.
+        """
+
+        if self.__child is not None:
+            self.__child.terminate ()
+            self.__child.wait ()
+            self.__child = None
+        elif self.__bus.NameHasOwner (BUS_NAME):
+            pid = self.__bus.GetConnectionUnixProcessID (BUS_NAME)
+            self.log.debug ("Stopping daemon {0}".format (pid))
+            os.kill (pid, signal.SIGTERM)
+
+        deadline = time.time () + TIMEOUT
+        while self.__bus.NameHasOwner (BUS_NAME):
+            if time.time () > deadline:
+                raise ActivationError ("The daemon didn't exit")
+            time.sleep (RETRY_INTERVAL)
+
+
+    def measure (self):
+        """
+        Restart the daemon once, returning how many seconds it took to
+        answer.
+        """
+
+        self.stop_daemon ()
+
+        start = time.time ()
+        if self.__command is not None:
+            self.__child = subprocess.Popen (self.__command, shell = True)
+
+        while True:
+            try:
+                self.__conn.call_blocking (BUS_NAME, "/connectors", MANAGER_INTERFACE,
+                                           "DescribeConnectors", "", [], timeout = TIMEOUT)
+                return time.time () - start
+            except dbus.DBusException, e:
+                # Started by hand, the daemon won't have the name right away.
+                if self.__command is None or time.time () - start > TIMEOUT:
+                    raise ActivationError ("The daemon didn't start: {0}".format (e))
+                time.sleep (RETRY_INTERVAL)
+
+
+    def run (self, rounds):
+        """
+        Restart the daemon rounds times, returning the sorted times each
+        took, in ms.  The daemon is left running afterwards.
+        """
+
+        times = sorted (self.measure () * 1000 for i in range (rounds))
+        if self.__child is not None:
+            # Let it carry on without us.
+            self.__child = None
+        return times
+
+
+def summarize (times):
+    """
+    Summarize a sorted list of times in ms.
+    """
+
+    percentile = panflute.tests.testcase.percentile
+    return {
+        "min":    times[0],
+        "median": percentile (times, 50),
+        "p90":    percentile (times, 90),
+        "max":    times[-1]
+    }
@@ -70,14 +70,14 @@ class Runner (panflute.tests.mpris.Runner):
         self.mkdir ("~/.kde/share/config")
 
         # Disable Amarok's first-run dialog prompts.
-        with open (os.path.expanduser ("~/.kde/share/config/amarokrc"), "w") as rc:
+        with open (self.expand ("~/.kde/share/config/amarokrc"), "w") as rc:
             print ("[General]", file = rc)
             print ("First Run=false", file = rc)
             print ("[Service_LastFm]", file = rc)
             print ("ignoreWallet=yes", file = rc)
 
         # Likewise, KDE Wallet gets started and has its own first-run dialogs.
-        with open (os.path.expanduser ("~/.kde/share/config/kwalletrc"), "w") as rc:
+        with open (self.expand ("~/.kde/share/config/kwalletrc"), "w") as rc:
             print ("[Wallet]", file = rc)
             print ("Enabled=false", file = rc)
             print ("First Use=false", file = rc)
@@ -59,7 +59,7 @@ class Runner (panflute.tests.runner.Runner):
         self.rmdirs ("~/.config/banshee-1")
         self.mkdir ("~/.config/banshee-1/addin-db-001")
         print ("Banshee config file", file = sys.stderr)
-        with open (os.path.expanduser ("~/.config/banshee-1/addin-db-001/config.xml"), "w") as conf:
+        with open (self.expand ("~/.config/banshee-1/addin-db-001/config.xml"), "w") as conf:
             print ("<Configuration>", file = conf)
             print ("  <AddinStatus>", file = conf)
             print ("    <Addin id=\"Banshee.LibraryWatcher,1.0\" enabled=\"True\"/>", file = conf)
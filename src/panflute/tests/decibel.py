@@ -55,7 +55,7 @@ class Runner (panflute.tests.mpris.Runner):
         # Create enough of a config file to prevent Decibel from opening up
         # a first-time config dialog.
         obj = { '__main___first-time': False }
-        with open (os.path.expanduser ("~/.config/decibel-audio-player/prefs.txt"), "w") as prefs:
+        with open (self.expand ("~/.config/decibel-audio-player/prefs.txt"), "w") as prefs:
             cPickle.dump (obj, prefs)
 
         # Start Decibel
@@ -60,9 +60,9 @@ class Runner (panflute.tests.runner.Runner):
         # Make sure Exaile can find the plugins -- Exaile 0.3.0.x has trouble
         # finding the right directory.
         os.symlink (os.path.join (prefix, "share/exaile/plugins"),
-                    os.path.expanduser ("~/.local/share/exaile/plugins"))
+                    self.expand ("~/.local/share/exaile/plugins"))
 
-        with open (os.path.expanduser ("~/.config/exaile/settings.ini"), "w") as settings:
+        with open (self.expand ("~/.config/exaile/settings.ini"), "w") as settings:
             print ("[plugins]", file = settings)
             print ("enabled = L: ['mpris']", file = settings)
 
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Stand-ins for the players Panflute supports, speaking each one's protocol
+over a shared playback model with adjustable latency and event rate, so the
+daemon can be exercised without any real player installed.
+"""
+
+from __future__ import absolute_import
+
+import panflute.tests.fake.banshee
+import panflute.tests.fake.listen
+import panflute.tests.fake.moc
+import panflute.tests.fake.mpd
+import panflute.tests.fake.mpris
+import panflute.tests.fake.muine
+import panflute.tests.fake.quodlibet
+import panflute.tests.fake.rhythmbox
+
+
+# Players with a protocol of their own.
+NATIVE = { "banshee":   panflute.tests.fake.banshee.Fake,
+           "listen":    panflute.tests.fake.listen.Fake,
+           "moc":       panflute.tests.fake.moc.Fake,
+           "mpd":       panflute.tests.fake.mpd.Fake,
+           "muine":     panflute.tests.fake.muine.Fake,
+           "quodlibet": panflute.tests.fake.quodlibet.Fake,
+           "rhythmbox": panflute.tests.fake.rhythmbox.Fake
+         }
+
+# Players whose MPRIS names Panflute passes through, by the name after
+# "org.mpris.".
+PASSTHROUGH = ["audacious", "clementine", "dap", "exaile", "guayadeque", "qmmp", "vlc"]
+
+ALL = sorted (NATIVE.keys () + PASSTHROUGH)
+
+# The bus name claimed by each fake that uses D-Bus, and the internal name
+# of the daemon's connector for it, where they aren't what you'd guess.
+BUS_NAMES = { "banshee":   "org.bansheeproject.Banshee",
+              "listen":    "org.gnome.Listen",
+              "muine":     "org.gnome.Muine",
+              "quodlibet": "net.sacredchao.QuodLibet",
+              "rhythmbox": "org.gnome.Rhythmbox"
+            }
+BUS_NAMES.update ((name, "org.mpris.{0}".format (name)) for name in PASSTHROUGH)
+
+CONNECTORS = { "dap":       "decibel",
+               "quodlibet": "quod_libet"
+             }
+
+
+def connector_name (name):
+    """
+    Get the internal name of the daemon connector that talks to a fake.
+    """
+
+    return CONNECTORS.get (name, name)
+
+
+def create (name, player, **kwargs):
+    """
+    Start a fake of the named player on top of a playback model.  Keyword
+    arguments not meant for that fake are ignored.
+    """
+
+    if name in NATIVE:
+        if name == "mpd" and kwargs.has_key ("port"):
+            return NATIVE[name] (player, kwargs["port"])
+        else:
+            return NATIVE[name] (player)
+    elif name in PASSTHROUGH:
+        return panflute.tests.fake.mpris.Fake (player, name)
+    else:
+        raise KeyError (name)
@@ -0,0 +1,232 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake Banshee, speaking the D-Bus API of Banshee 1.6.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import dbus
+import dbus.service
+
+
+PLAYBACK_INTERFACE = "org.bansheeproject.Banshee.PlaybackController"
+ENGINE_INTERFACE = "org.bansheeproject.Banshee.PlayerEngine"
+
+REPEAT_NONE = 0
+REPEAT_ALL = 1
+REPEAT_SINGLE = 2
+
+
+class Fake (object):
+    """
+    Claims Banshee's bus name and serves its playback controller and player
+    engine objects.
+    """
+
+    def __init__ (self, player):
+        bus = dbus.SessionBus ()
+        self.__name = dbus.service.BusName ("org.bansheeproject.Banshee", bus)
+        self.__playback = PlaybackController (player, bus)
+        self.__engine = PlayerEngine (player, bus)
+
+
+##############################################################################
+
+
+class PlaybackController (dbus.service.Object):
+    """
+    The /org/bansheeproject/Banshee/PlaybackController object.
+    """
+
+    def __init__ (self, player, bus):
+        dbus.service.Object.__init__ (self, bus, "/org/bansheeproject/Banshee/PlaybackController")
+        self.__player = player
+
+
+    def __repeat_mode (self):
+        if self.__player.repeat:
+            return REPEAT_ALL
+        else:
+            return REPEAT_NONE
+
+
+    @dbus.service.method (dbus_interface = PLAYBACK_INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Next (self, restart, reply, error):
+        self.__player.respond (reply, error, self.__player.next)
+
+
+    @dbus.service.method (dbus_interface = PLAYBACK_INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Previous (self, restart, reply, error):
+        self.__player.respond (reply, error, self.__player.previous)
+
+
+    @dbus.service.method (dbus_interface = PLAYBACK_INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetRepeatMode (self, reply, error):
+        self.__player.respond (reply, error, self.__repeat_mode)
+
+
+    @dbus.service.method (dbus_interface = PLAYBACK_INTERFACE, in_signature = "i", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetRepeatMode (self, mode, reply, error):
+        self.__player.respond (reply, error, self.__player.set_repeat, mode != REPEAT_NONE)
+
+
+    @dbus.service.method (dbus_interface = PLAYBACK_INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetShuffleMode (self, reply, error):
+        self.__player.respond (reply, error, lambda: int (self.__player.shuffle))
+
+
+##############################################################################
+
+
+class PlayerEngine (dbus.service.Object):
+    """
+    The /org/bansheeproject/Banshee/PlayerEngine object.
+    """
+
+    STATES = { panflute.mpris.STATE_PLAYING: "playing",
+               panflute.mpris.STATE_PAUSED:  "paused",
+               panflute.mpris.STATE_STOPPED: "idle"
+             }
+
+
+    def __init__ (self, player, bus):
+        dbus.service.Object.__init__ (self, bus, "/org/bansheeproject/Banshee/PlayerEngine")
+        self.__player = player
+        self.__streaming = False
+
+        player.connect ("state-changed", self.__state_changed_cb)
+        player.connect ("track-changed", self.__track_changed_cb)
+        player.connect ("rating-changed", lambda player: self.EventChanged ("trackinfoupdated", "", 0.0))
+        player.connect ("options-changed", lambda player: self.EventChanged ("statechange", "", 0.0))
+
+
+    def __state_changed_cb (self, player):
+        if player.state == panflute.mpris.STATE_STOPPED:
+            self.__streaming = False
+            self.EventChanged ("endofstream", "", 0.0)
+        elif not self.__streaming:
+            self.__streaming = True
+            self.EventChanged ("startofstream", "", 0.0)
+        self.EventChanged ("statechange", "", 0.0)
+
+
+    def __track_changed_cb (self, player):
+        if self.__streaming:
+            self.EventChanged ("startofstream", "", 0.0)
+
+
+    def __current_track (self):
+        track = self.__player.current ()
+        if track is None or not self.__streaming:
+            return dbus.Dictionary ({}, signature = "sv")
+        return dbus.Dictionary ({"URI":          track["uri"],
+                                 "name":         track["title"],
+                                 "artist":       track["artist"],
+                                 "album":        track["album"],
+                                 "track-number": dbus.Int32 (track["tracknumber"]),
+                                 "length":       dbus.Double (track["duration"]),
+                                 "rating":       dbus.Int32 (track["rating"]),
+                                 "bit-rate":     dbus.Int32 (128)},
+                                signature = "sv")
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def TogglePlaying (self, reply, error):
+        self.__player.respond (reply, error, self.__player.play_pause)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Play (self, reply, error):
+        self.__player.respond (reply, error, self.__player.play)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Close (self, reply, error):
+        self.__player.respond (reply, error, self.__player.stop)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "y", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetRating (self, rating, reply, error):
+        self.__player.respond (reply, error, self.__player.set_rating, int (rating))
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "u",
+                          async_callbacks = ("reply", "error"))
+    def GetPosition (self, reply, error):
+        self.__player.respond (reply, error, self.__player.position)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "u", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetPosition (self, position, reply, error):
+        self.__player.respond (reply, error, self.__player.seek, int (position))
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "q",
+                          async_callbacks = ("reply", "error"))
+    def GetVolume (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.volume)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "q", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetVolume (self, volume, reply, error):
+        self.__player.respond (reply, error, self.__player.set_volume, int (volume))
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "a{sv}",
+                          async_callbacks = ("reply", "error"))
+    def GetCurrentTrack (self, reply, error):
+        self.__player.respond (reply, error, self.__current_track)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def GetCurrentState (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.STATES[self.__player.state])
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def GetCanPause (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__streaming)
+
+
+    @dbus.service.method (dbus_interface = ENGINE_INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def GetCanSeek (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__streaming)
+
+
+    @dbus.service.signal (dbus_interface = ENGINE_INTERFACE, signature = "ssd")
+    def EventChanged (self, event, message, buffering_percent):
+        pass
@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake Listen, speaking the D-Bus API of Listen 0.6.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import dbus
+import dbus.service
+
+
+INTERFACE = "org.gnome.Listen"
+
+
+class Fake (dbus.service.Object):
+    """
+    Claims Listen's bus name and serves its only object.
+
+    Listen sends no signals, so event_rate makes no difference.  Like the
+    real thing, it reports no current song while paused.
+    """
+
+    def __init__ (self, player):
+        bus = dbus.SessionBus ()
+        self.__name = dbus.service.BusName ("org.gnome.Listen", bus)
+        dbus.service.Object.__init__ (self, bus, "/org/gnome/listen")
+        self.__player = player
+
+
+    def __field (self, name):
+        track = self.__player.current ()
+        if track is not None and self.__player.state != panflute.mpris.STATE_STOPPED:
+            return track[name]
+        else:
+            return ""
+
+
+    def __uri (self):
+        if self.__player.state == panflute.mpris.STATE_PLAYING:
+            return self.__field ("uri")
+        else:
+            return ""
+
+
+    def __command (self, func, *args):
+        func (*args)
+        return ""
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def quit (self, reply, error):
+        self.__player.respond (reply, error, self.__command, self.__player.quit)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def play_pause (self, reply, error):
+        self.__player.respond (reply, error, self.__command, self.__player.play_pause)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def next (self, reply, error):
+        self.__player.respond (reply, error, self.__command, self.__player.next)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def previous (self, reply, error):
+        self.__player.respond (reply, error, self.__command, self.__player.previous)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "d", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def volume (self, volume, reply, error):
+        self.__player.respond (reply, error, self.__command, self.__player.set_volume, int (volume * 100))
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def playing (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.state == panflute.mpris.STATE_PLAYING)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def get_uri (self, reply, error):
+        self.__player.respond (reply, error, self.__uri)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "d",
+                          async_callbacks = ("reply", "error"))
+    def current_position (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.position () / 1000)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def get_title (self, reply, error):
+        self.__player.respond (reply, error, self.__field, "title")
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def get_artist (self, reply, error):
+        self.__player.respond (reply, error, self.__field, "artist")
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def get_album (self, reply, error):
+        self.__player.respond (reply, error, self.__field, "album")
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def current_song_length (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__field ("duration") or 0)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def get_cover_path (self, reply, error):
+        self.__player.respond (reply, error, lambda: "")
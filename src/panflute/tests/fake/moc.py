@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake MOC server and client.
+
+Panflute drives MOC by running its command-line client, and watches for
+~/.moc/socket2 to know whether the server is up.  Instead of MOC's binary
+socket protocol, the fake server reads one line of mocp arguments per
+connection and writes back what mocp would print, and client () is what
+runs in place of mocp to pass them along.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import gobject
+import os
+import shlex
+import socket
+import sys
+
+
+SOCKET_PATH = os.path.expanduser ("~/.moc/socket2")
+
+
+def client (args):
+    """
+    Send mocp arguments to the fake server, print the output, and return
+    the exit status mocp would have.
+    """
+
+    sock = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect (SOCKET_PATH)
+    except socket.error, e:
+        print >> sys.stderr, "FATAL_ERROR: The server is not running: {0}".format (e)
+        return 2
+
+    sock.sendall (" ".join (args) + "\n")
+    output = []
+    while True:
+        data = sock.recv (4096)
+        if data == "":
+            break
+        output.append (data)
+    sock.close ()
+
+    sys.stdout.write ("".join (output))
+    return 0
+
+
+##############################################################################
+
+
+class Fake (object):
+    """
+    Listens for fake mocp clients on ~/.moc/socket2, which only exists while
+    the fake is running.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, player):
+        self.__player = player
+
+        directory = os.path.dirname (SOCKET_PATH)
+        if not os.path.isdir (directory):
+            os.makedirs (directory)
+        if os.path.exists (SOCKET_PATH):
+            os.unlink (SOCKET_PATH)
+
+        self.__socket = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.bind (SOCKET_PATH)
+        self.__socket.listen (5)
+        self.__watch = gobject.io_add_watch (self.__socket, gobject.IO_IN, self.__accept_cb)
+
+        player.connect ("quit", self.__quit_cb)
+
+
+    def __quit_cb (self, player):
+        """
+        Take the socket down, which is how Panflute notices MOC has quit.
+        """
+
+        if self.__socket is not None:
+            gobject.source_remove (self.__watch)
+            self.__socket.close ()
+            self.__socket = None
+            os.unlink (SOCKET_PATH)
+
+
+    def __accept_cb (self, source, condition):
+        conn, address = self.__socket.accept ()
+        line = ""
+        while not line.endswith ("\n"):
+            data = conn.recv (4096)
+            if data == "":
+                break
+            line += data
+        self.__player.delay (self.__execute, conn, line)
+        return True
+
+
+    def __execute (self, conn, line):
+        """
+        Carry out a line of mocp arguments, and send back the output.
+        """
+
+        output = []
+        args = shlex.split (line)
+        while len (args) > 0:
+            arg = args.pop (0)
+            if arg == "-i":
+                output.append (self.__info ())
+            elif arg == "-p":
+                self.__player.stop ()
+                self.__player.play ()
+            elif arg == "-s":
+                self.__player.stop ()
+            elif arg == "-G":
+                self.__player.play_pause ()
+            elif arg == "-r":
+                self.__player.previous ()
+            elif arg == "-f":
+                self.__player.next ()
+            elif arg == "-k" and len (args) > 0:
+                seconds = int (args.pop (0))
+                self.__player.seek (self.__player.position () + seconds * 1000)
+            elif arg == "-x":
+                self.__player.quit ()
+            elif arg == "-S":
+                pass
+            else:
+                output.append ("Unknown option {0}\n".format (arg))
+
+        try:
+            conn.sendall ("".join (output))
+        except socket.error, e:
+            self.log.debug ("Send failed: {0}".format (e))
+        conn.close ()
+
+
+    def __info (self):
+        """
+        Build what mocp -i prints.
+        """
+
+        states = { panflute.mpris.STATE_PLAYING: "PLAY",
+                   panflute.mpris.STATE_PAUSED:  "PAUSE",
+                   panflute.mpris.STATE_STOPPED: "STOP"
+                 }
+
+        player = self.__player
+        track = player.current ()
+        if track is None or player.state == panflute.mpris.STATE_STOPPED:
+            return "State: STOP\n"
+
+        elapsed = player.position () // 1000
+        total = track["duration"]
+        lines = ["State: {0}".format (states[player.state]),
+                 "File: {0}".format (track["uri"][len ("file://"):]),
+                 "Title: {0} - {1} ({2})".format (track["artist"], track["title"], track["album"]),
+                 "Artist: {0}".format (track["artist"]),
+                 "SongTitle: {0}".format (track["title"]),
+                 "Album: {0}".format (track["album"]),
+                 "TotalTime: {0:02d}:{1:02d}".format (total // 60, total % 60),
+                 "TimeLeft: {0:02d}:{1:02d}".format ((total - elapsed) // 60, (total - elapsed) % 60),
+                 "TotalSec: {0}".format (total),
+                 "CurrentTime: {0:02d}:{1:02d}".format (elapsed // 60, elapsed % 60),
+                 "CurrentSec: {0}".format (elapsed),
+                 "Bitrate: 128Kbps",
+                 "AvgBitrate: 128Kbps",
+                 "Rate: 44KHz"]
+        return "".join (line + "\n" for line in lines)
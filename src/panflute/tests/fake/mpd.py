@@ -0,0 +1,338 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake MPD server, speaking enough of the MPD protocol over TCP to satisfy
+python-mpd and Panflute's MPD connector.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import gobject
+import shlex
+import socket
+
+
+class Fake (object):
+    """
+    Listens for MPD clients on localhost:port.
+    """
+
+    from panflute.util import log
+
+    VERSION = "0.15.0"
+
+
+    def __init__ (self, player, port = 6600):
+        self.__player = player
+        self.__clients = []
+
+        self.__socket = socket.socket (socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt (socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind (("localhost", port))
+        self.__socket.listen (5)
+        gobject.io_add_watch (self.__socket, gobject.IO_IN, self.__accept_cb)
+
+        player.connect ("state-changed", lambda player: self.__changed ("player"))
+        player.connect ("track-changed", lambda player: self.__changed ("player"))
+        player.connect ("seeked", lambda player: self.__changed ("player"))
+        player.connect ("volume-changed", lambda player: self.__changed ("mixer"))
+        player.connect ("options-changed", lambda player: self.__changed ("options"))
+
+
+    def __accept_cb (self, source, condition):
+        """
+        Greet a newly connected client.
+        """
+
+        conn, address = self.__socket.accept ()
+        self.log.debug ("Client connected from {0}".format (address))
+        self.__clients.append (Client (self, conn))
+        return True
+
+
+    def __changed (self, subsystem):
+        """
+        Wake up any clients idling on a subsystem.
+        """
+
+        for client in self.__clients:
+            client.changed (subsystem)
+
+
+    def delay (self, func, *args):
+        """
+        Call a function after the player's latency.
+        """
+
+        self.__player.delay (func, *args)
+
+
+    def remove_client (self, client):
+        if client in self.__clients:
+            self.__clients.remove (client)
+
+
+    def execute (self, client, line):
+        """
+        Run one command line from a client, and send back the response.
+        """
+
+        try:
+            words = shlex.split (line)
+        except ValueError:
+            client.send ("ACK [2@0] {} bad quoting\n")
+            return
+
+        if len (words) == 0:
+            client.send ("ACK [5@0] {} No command given\n")
+            return
+
+        command, args = words[0], words[1:]
+        handler = getattr (self, "_do_" + command, None)
+        if handler is None:
+            client.send ("ACK [5@0] {{{0}}} unknown command \"{0}\"\n".format (command))
+            return
+
+        try:
+            response = handler (client, *args)
+        except (TypeError, ValueError, IndexError):
+            client.send ("ACK [2@0] {{{0}}} bad arguments\n".format (command))
+            return
+
+        if response is not None:
+            client.send (response + "OK\n")
+
+
+    ##########################################################################
+    #
+    # Commands
+    #
+    ##########################################################################
+
+
+    def _do_ping (self, client):
+        return ""
+
+
+    def _do_close (self, client):
+        client.close ()
+
+
+    def _do_kill (self, client):
+        self.__player.quit ()
+        return ""
+
+
+    def _do_status (self, client):
+        states = { panflute.mpris.STATE_PLAYING: "play",
+                   panflute.mpris.STATE_PAUSED:  "pause",
+                   panflute.mpris.STATE_STOPPED: "stop"
+                 }
+
+        player = self.__player
+        lines = ["volume: {0}".format (player.volume),
+                 "repeat: {0}".format (int (player.repeat)),
+                 "random: {0}".format (int (player.shuffle)),
+                 "playlistlength: {0}".format (len (player.tracks)),
+                 "state: {0}".format (states[player.state])]
+
+        track = player.current ()
+        if track is not None and player.state != panflute.mpris.STATE_STOPPED:
+            elapsed = player.position () / 1000
+            lines.append ("song: {0}".format (player.index))
+            lines.append ("songid: {0}".format (player.index))
+            lines.append ("time: {0}:{1}".format (int (elapsed), track["duration"]))
+            lines.append ("elapsed: {0:.3f}".format (elapsed))
+            lines.append ("bitrate: 128")
+            lines.append ("audio: 44100:16:2")
+
+        return "".join (line + "\n" for line in lines)
+
+
+    def _do_currentsong (self, client):
+        track = self.__player.current ()
+        if track is None:
+            return ""
+        # Tag names are capitalized the same way MPD does.
+        lines = ["file: {0}".format (track["uri"][len ("file:///"):]),
+                 "Time: {0}".format (track["duration"]),
+                 "Artist: {0}".format (track["artist"]),
+                 "Title: {0}".format (track["title"]),
+                 "Album: {0}".format (track["album"]),
+                 "Track: {0}".format (track["tracknumber"]),
+                 "Pos: {0}".format (self.__player.index),
+                 "Id: {0}".format (self.__player.index)]
+        return "".join (line + "\n" for line in lines)
+
+
+    def _do_play (self, client, index = None):
+        if index is not None:
+            self.__player.go_to (int (index))
+        self.__player.play ()
+        return ""
+
+
+    def _do_pause (self, client, pause = None):
+        if pause is None:
+            self.__player.play_pause ()
+        elif int (pause):
+            self.__player.pause ()
+        else:
+            self.__player.play ()
+        return ""
+
+
+    def _do_stop (self, client):
+        self.__player.stop ()
+        return ""
+
+
+    def _do_next (self, client):
+        self.__player.next ()
+        return ""
+
+
+    def _do_previous (self, client):
+        self.__player.previous ()
+        return ""
+
+
+    def _do_seekid (self, client, songid, seconds):
+        songid = int (songid)
+        if songid != self.__player.index:
+            self.__player.go_to (songid)
+        self.__player.seek (int (float (seconds) * 1000))
+        return ""
+
+
+    def _do_setvol (self, client, volume):
+        self.__player.set_volume (int (volume))
+        return ""
+
+
+    def _do_repeat (self, client, repeat):
+        self.__player.set_repeat (bool (int (repeat)))
+        return ""
+
+
+    def _do_random (self, client, shuffle):
+        self.__player.set_shuffle (bool (int (shuffle)))
+        return ""
+
+
+    def _do_idle (self, client, *subsystems):
+        client.idle (subsystems)
+
+
+    def _do_noidle (self, client):
+        client.noidle ()
+
+
+##############################################################################
+
+
+class Client (object):
+    """
+    One connection to the fake server.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, server, conn):
+        self.__server = server
+        self.__conn = conn
+        self.__buffer = ""
+
+        # While idling, the subsystems being waited on (empty for all), and
+        # which of them have changed since.
+        self.__idling = None
+        self.__changes = set ()
+
+        self.__watch = gobject.io_add_watch (conn, gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR, self.__read_cb)
+        self.send ("OK MPD {0}\n".format (Fake.VERSION))
+
+
+    def send (self, text):
+        if self.__conn is not None:
+            try:
+                self.__conn.sendall (text)
+            except socket.error, e:
+                self.log.debug ("Send failed: {0}".format (e))
+                self.close ()
+
+
+    def close (self):
+        if self.__conn is not None:
+            gobject.source_remove (self.__watch)
+            self.__conn.close ()
+            self.__conn = None
+            self.__server.remove_client (self)
+
+
+    def idle (self, subsystems):
+        self.__idling = set (subsystems)
+        self.__changes = set ()
+
+
+    def noidle (self):
+        if self.__idling is not None:
+            self.__finish_idle ()
+
+
+    def changed (self, subsystem):
+        if self.__idling is not None and (len (self.__idling) == 0 or subsystem in self.__idling):
+            self.__changes.add (subsystem)
+            # Let a burst of changes go out in one response, as MPD does.
+            if len (self.__changes) == 1:
+                gobject.idle_add (lambda: self.__idling is not None and self.__finish_idle () and False)
+
+
+    def __finish_idle (self):
+        self.__idling = None
+        self.send ("".join ("changed: {0}\n".format (subsystem) for subsystem in sorted (self.__changes)) + "OK\n")
+        self.__changes = set ()
+
+
+    def __read_cb (self, source, condition):
+        """
+        Read whatever the client sent, and run every complete command.
+        """
+
+        try:
+            data = self.__conn.recv (4096)
+        except socket.error:
+            data = ""
+        if data == "":
+            self.close ()
+            return False
+
+        self.__buffer += data
+        while "\n" in self.__buffer:
+            line, self.__buffer = self.__buffer.split ("\n", 1)
+            if self.__idling is not None and line.strip () != "noidle":
+                # Anything but noidle ends the connection while idling.
+                self.close ()
+                return False
+            self.__server.delay (self.__server.execute, self, line)
+
+        return True
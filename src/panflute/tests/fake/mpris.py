@@ -0,0 +1,330 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake MPRIS 1 player, standing in for any of the players Panflute passes
+through, such as Audacious or VLC.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import dbus
+import dbus.service
+
+
+class Fake (object):
+    """
+    Claims org.mpris.<name> and serves the three MPRIS objects.
+    """
+
+    def __init__ (self, player, name):
+        bus = dbus.SessionBus ()
+        self.__name = dbus.service.BusName ("org.mpris.{0}".format (name), bus)
+        self.__root = Root (player, bus, name)
+        self.__player = Player (player, bus)
+        self.__track_list = TrackList (player, bus)
+
+
+##############################################################################
+
+
+def metadata (track):
+    """
+    Convert a track into MPRIS metadata.
+    """
+
+    if track is None:
+        return dbus.Dictionary ({}, signature = "sv")
+    return dbus.Dictionary ({"location":    track["uri"],
+                             "title":       track["title"],
+                             "artist":      track["artist"],
+                             "album":       track["album"],
+                             "tracknumber": str (track["tracknumber"]),
+                             "time":        dbus.UInt32 (track["duration"]),
+                             "mtime":       dbus.UInt32 (track["duration"] * 1000),
+                             "rating":      dbus.Int32 (track["rating"])},
+                            signature = "sv")
+
+
+##############################################################################
+
+
+class Root (dbus.service.Object):
+    """
+    The / object.
+    """
+
+    def __init__ (self, player, bus, name):
+        dbus.service.Object.__init__ (self, bus, "/")
+        self.__player = player
+        self.__identity = "Fake {0}".format (name)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def Identity (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__identity)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "")
+    def Quit (self):
+        self.__player.quit ()
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "(qq)",
+                          async_callbacks = ("reply", "error"))
+    def MprisVersion (self, reply, error):
+        self.__player.respond (reply, error, lambda: (dbus.UInt16 (1), dbus.UInt16 (0)))
+
+
+##############################################################################
+
+
+class Player (dbus.service.Object):
+    """
+    The /Player object.
+    """
+
+    def __init__ (self, player, bus):
+        dbus.service.Object.__init__ (self, bus, "/Player")
+        self.__player = player
+        self.__caps = self.__get_caps ()
+
+        player.connect ("state-changed", self.__state_changed_cb)
+        player.connect ("options-changed", lambda player: self.StatusChange (self.__get_status ()))
+        player.connect ("track-changed", self.__track_changed_cb)
+        player.connect ("rating-changed", lambda player: self.TrackChange (metadata (player.current ())))
+
+
+    def __get_status (self):
+        if self.__player.shuffle:
+            order = panflute.mpris.ORDER_RANDOM
+        else:
+            order = panflute.mpris.ORDER_LINEAR
+        if self.__player.repeat:
+            future = panflute.mpris.FUTURE_CONTINUE
+        else:
+            future = panflute.mpris.FUTURE_STOP
+        return (self.__player.state, order, panflute.mpris.NEXT_NEXT, future)
+
+
+    def __get_caps (self):
+        caps = panflute.mpris.CAN_PLAY | panflute.mpris.CAN_PROVIDE_METADATA
+        if self.__player.index + 1 < len (self.__player.tracks):
+            caps |= panflute.mpris.CAN_GO_NEXT
+        if self.__player.index > 0:
+            caps |= panflute.mpris.CAN_GO_PREV
+        if self.__player.state != panflute.mpris.STATE_STOPPED:
+            caps |= panflute.mpris.CAN_PAUSE | panflute.mpris.CAN_SEEK
+        return caps
+
+
+    def __update_caps (self):
+        caps = self.__get_caps ()
+        if caps != self.__caps:
+            self.__caps = caps
+            self.CapsChange (caps)
+
+
+    def __state_changed_cb (self, player):
+        self.StatusChange (self.__get_status ())
+        self.__update_caps ()
+
+
+    def __track_changed_cb (self, player):
+        self.TrackChange (metadata (player.current ()))
+        self.__update_caps ()
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Next (self, reply, error):
+        self.__player.respond (reply, error, self.__player.next)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Prev (self, reply, error):
+        self.__player.respond (reply, error, self.__player.previous)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Pause (self, reply, error):
+        self.__player.respond (reply, error, self.__player.play_pause)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Stop (self, reply, error):
+        self.__player.respond (reply, error, self.__player.stop)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Play (self, reply, error):
+        self.__player.respond (reply, error, self.__play)
+
+
+    def __play (self):
+        if self.__player.state == panflute.mpris.STATE_PLAYING:
+            self.__player.seek (0)
+        else:
+            self.__player.play ()
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Repeat (self, repeat, reply, error):
+        self.__player.respond (reply, error, self.__player.set_repeat, bool (repeat))
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "(iiii)",
+                          async_callbacks = ("reply", "error"))
+    def GetStatus (self, reply, error):
+        self.__player.respond (reply, error, self.__get_status)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "a{sv}",
+                          async_callbacks = ("reply", "error"))
+    def GetMetadata (self, reply, error):
+        self.__player.respond (reply, error, lambda: metadata (self.__player.current ()))
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetCaps (self, reply, error):
+        self.__player.respond (reply, error, self.__get_caps)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "i", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def VolumeSet (self, volume, reply, error):
+        self.__player.respond (reply, error, self.__player.set_volume, volume)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def VolumeGet (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.volume)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "i", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def PositionSet (self, position, reply, error):
+        self.__player.respond (reply, error, self.__player.seek, position)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def PositionGet (self, reply, error):
+        self.__player.respond (reply, error, self.__player.position)
+
+
+    @dbus.service.signal (dbus_interface = panflute.mpris.INTERFACE, signature = "a{sv}")
+    def TrackChange (self, metadata):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = panflute.mpris.INTERFACE, signature = "(iiii)")
+    def StatusChange (self, status):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = panflute.mpris.INTERFACE, signature = "i")
+    def CapsChange (self, caps):
+        pass
+
+
+##############################################################################
+
+
+class TrackList (dbus.service.Object):
+    """
+    The /TrackList object.
+    """
+
+    def __init__ (self, player, bus):
+        dbus.service.Object.__init__ (self, bus, "/TrackList")
+        self.__player = player
+
+
+    def __add_track (self, uri, play_immediately):
+        track = {"uri": uri, "title": uri, "artist": "", "album": "",
+                 "tracknumber": len (self.__player.tracks) + 1, "duration": 180, "rating": 0}
+        self.__player.tracks.append (track)
+        self.TrackListChange (len (self.__player.tracks))
+        if play_immediately:
+            self.__player.go_to (len (self.__player.tracks) - 1)
+            self.__player.play ()
+        return 0
+
+
+    def __del_track (self, index):
+        del self.__player.tracks[index]
+        self.TrackListChange (len (self.__player.tracks))
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "i", out_signature = "a{sv}",
+                          async_callbacks = ("reply", "error"))
+    def GetMetadata (self, index, reply, error):
+        self.__player.respond (reply, error, lambda: metadata (self.__player.tracks[index]))
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetCurrentTrack (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.index)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetLength (self, reply, error):
+        self.__player.respond (reply, error, lambda: len (self.__player.tracks))
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "sb", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def AddTrack (self, uri, play_immediately, reply, error):
+        self.__player.respond (reply, error, self.__add_track, uri, play_immediately)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "i", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def DelTrack (self, index, reply, error):
+        self.__player.respond (reply, error, self.__del_track, index)
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetLoop (self, loop, reply, error):
+        self.__player.respond (reply, error, self.__player.set_repeat, bool (loop))
+
+
+    @dbus.service.method (dbus_interface = panflute.mpris.INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetRandom (self, shuffle, reply, error):
+        self.__player.respond (reply, error, self.__player.set_shuffle, bool (shuffle))
+
+
+    @dbus.service.signal (dbus_interface = panflute.mpris.INTERFACE, signature = "i")
+    def TrackListChange (self, length):
+        pass
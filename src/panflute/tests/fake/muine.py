@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake Muine, speaking the D-Bus API of Muine 0.8.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import dbus
+import dbus.service
+
+
+INTERFACE = "org.gnome.Muine.Player"
+
+
+class Fake (dbus.service.Object):
+    """
+    Claims Muine's bus name and serves its only object.
+
+    There is never any album art to write out.
+    """
+
+    def __init__ (self, player):
+        bus = dbus.SessionBus ()
+        self.__name = dbus.service.BusName ("org.gnome.Muine", bus)
+        dbus.service.Object.__init__ (self, bus, "/org/gnome/Muine/Player")
+        self.__player = player
+        self.__song = self.__description ()
+
+        player.connect ("state-changed", self.__state_changed_cb)
+        player.connect ("track-changed", self.__track_changed_cb)
+
+
+    def __playing (self):
+        return self.__player.state == panflute.mpris.STATE_PLAYING
+
+
+    def __description (self):
+        track = self.__player.current ()
+        if track is None or self.__player.state == panflute.mpris.STATE_STOPPED:
+            return ""
+        return "\n".join (["uri: {0}".format (track["uri"][len ("file://"):]),
+                           "title: {0}".format (track["title"]),
+                           "artist: {0}".format (track["artist"]),
+                           "album: {0}".format (track["album"]),
+                           "track_number: {0}".format (track["tracknumber"]),
+                           "duration: {0}".format (track["duration"])])
+
+
+    def __state_changed_cb (self, player):
+        self.StateChanged (self.__playing ())
+        self.__track_changed_cb (player)
+
+
+    def __track_changed_cb (self, player):
+        song = self.__description ()
+        if song != self.__song:
+            self.__song = song
+            self.SongChanged (song)
+
+
+    def __set_playing (self, playing):
+        if playing:
+            self.__player.play ()
+        else:
+            self.__player.pause ()
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "")
+    def Quit (self):
+        self.__player.quit ()
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def GetPlaying (self, reply, error):
+        self.__player.respond (reply, error, self.__playing)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetPlaying (self, playing, reply, error):
+        self.__player.respond (reply, error, self.__set_playing, playing)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def HasNext (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.index + 1 < len (self.__player.tracks))
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Next (self, reply, error):
+        self.__player.respond (reply, error, self.__player.next)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def HasPrevious (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.index > 0)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Previous (self, reply, error):
+        self.__player.respond (reply, error, self.__player.previous)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetPosition (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.position () // 1000)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "i", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetPosition (self, position, reply, error):
+        self.__player.respond (reply, error, self.__player.seek, position * 1000)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "i",
+                          async_callbacks = ("reply", "error"))
+    def GetVolume (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.volume)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "i", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def SetVolume (self, volume, reply, error):
+        self.__player.respond (reply, error, self.__player.set_volume, volume)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def GetCurrentSong (self, reply, error):
+        self.__player.respond (reply, error, self.__description)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "s", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def WriteAlbumCoverToFile (self, filename, reply, error):
+        self.__player.respond (reply, error, lambda: False)
+
+
+    @dbus.service.signal (dbus_interface = INTERFACE, signature = "b")
+    def StateChanged (self, playing):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = INTERFACE, signature = "s")
+    def SongChanged (self, description):
+        pass
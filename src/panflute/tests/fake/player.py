@@ -0,0 +1,271 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+The playback model shared by every fake player.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import gobject
+import time
+
+
+def make_tracks (count, duration = 180, directory = "fake"):
+    """
+    Make up a playlist of count tracks, each duration seconds long, in a
+    directory of their own.
+    """
+
+    return [{"uri":         "file:///{0}/{1:03d}.ogg".format (directory, n),
+             "title":       "Fake Track {0}".format (n),
+             "artist":      "Fake Artist",
+             "album":       "Fake Album",
+             "tracknumber": n,
+             "duration":    duration,
+             "rating":      0}
+            for n in range (1, count + 1)]
+
+
+class Player (gobject.GObject):
+    """
+    A playlist, and where playback is in it.
+
+    Commands change the state at once and emit the matching signal.  While
+    playing, "tick" is emitted event_rate times a second, which protocols
+    that push the elapsed time turn into signals.  The protocols delay each
+    reply by latency ms, via delay or respond.
+    """
+
+    from panflute.util import log
+
+    __gsignals__ = {
+        "state-changed":   (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "track-changed":   (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "seeked":          (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "tick":            (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "volume-changed":  (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "rating-changed":  (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "options-changed": (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
+        "quit":            (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ())
+    }
+
+
+    def __init__ (self, tracks = None, latency = 0, event_rate = 1.0):
+        gobject.GObject.__init__ (self)
+
+        if tracks is None:
+            tracks = make_tracks (10)
+        self.tracks = tracks
+        self.latency = latency
+        self.event_rate = event_rate
+
+        self.state = panflute.mpris.STATE_STOPPED
+        self.index = 0
+        self.volume = 50
+        self.repeat = False
+        self.shuffle = False
+
+        # Where the current track was when playback last started or paused.
+        self.__offset = 0
+        self.__started = None
+        self.__tick_source = None
+
+
+    def delay (self, func, *args):
+        """
+        Call a function latency ms from now, or right away if there is no
+        latency.
+        """
+
+        if self.latency > 0:
+            gobject.timeout_add (self.latency, lambda: func (*args) and False)
+        else:
+            func (*args)
+
+
+    def respond (self, reply, error, func, *args):
+        """
+        Call a function latency ms from now, and pass its result to a D-Bus
+        method's reply callback, or any exception it raises to the error
+        callback.
+        """
+
+        def finish ():
+            try:
+                result = func (*args)
+            except Exception, e:
+                error (e)
+                return
+            if result is None:
+                reply ()
+            else:
+                reply (result)
+
+        self.delay (finish)
+
+
+    def current (self):
+        """
+        Get the current track, or None if the playlist is empty.
+        """
+
+        if 0 <= self.index < len (self.tracks):
+            return self.tracks[self.index]
+        else:
+            return None
+
+
+    def position (self):
+        """
+        Get the elapsed time in the current track, in ms.
+        """
+
+        if self.__started is not None:
+            return self.__offset + int ((time.time () - self.__started) * 1000)
+        else:
+            return self.__offset
+
+
+    ##########################################################################
+    #
+    # Commands
+    #
+    ##########################################################################
+
+
+    def play (self):
+        if self.state != panflute.mpris.STATE_PLAYING and self.current () is not None:
+            self.__started = time.time ()
+            self.__set_state (panflute.mpris.STATE_PLAYING)
+
+
+    def pause (self):
+        if self.state == panflute.mpris.STATE_PLAYING:
+            self.__offset = self.position ()
+            self.__started = None
+            self.__set_state (panflute.mpris.STATE_PAUSED)
+
+
+    def play_pause (self):
+        if self.state == panflute.mpris.STATE_PLAYING:
+            self.pause ()
+        else:
+            self.play ()
+
+
+    def stop (self):
+        if self.state != panflute.mpris.STATE_STOPPED:
+            self.__offset = 0
+            self.__started = None
+            self.__set_state (panflute.mpris.STATE_STOPPED)
+
+
+    def next (self):
+        if self.repeat or self.index + 1 < len (self.tracks):
+            self.go_to ((self.index + 1) % len (self.tracks))
+        else:
+            self.stop ()
+
+
+    def previous (self):
+        if self.position () > 3000 or self.index == 0:
+            self.seek (0)
+        else:
+            self.go_to (self.index - 1)
+
+
+    def go_to (self, index):
+        """
+        Start the track at index in the playlist.
+        """
+
+        self.index = index
+        self.__offset = 0
+        if self.__started is not None:
+            self.__started = time.time ()
+        self.emit ("track-changed")
+
+
+    def seek (self, position):
+        self.__offset = max (0, position)
+        if self.__started is not None:
+            self.__started = time.time ()
+        self.emit ("seeked")
+
+
+    def set_volume (self, volume):
+        self.volume = max (0, min (100, volume))
+        self.emit ("volume-changed")
+
+
+    def set_rating (self, rating):
+        track = self.current ()
+        if track is not None:
+            track["rating"] = rating
+            self.emit ("rating-changed")
+
+
+    def set_repeat (self, repeat):
+        self.repeat = repeat
+        self.emit ("options-changed")
+
+
+    def set_shuffle (self, shuffle):
+        self.shuffle = shuffle
+        self.emit ("options-changed")
+
+
+    def quit (self):
+        self.stop ()
+        self.emit ("quit")
+
+
+    def __set_state (self, state):
+        """
+        Change the playback state, ticking only while playing.
+        """
+
+        self.state = state
+
+        if self.__tick_source is not None:
+            gobject.source_remove (self.__tick_source)
+            self.__tick_source = None
+        if state == panflute.mpris.STATE_PLAYING and self.event_rate > 0:
+            self.__tick_source = gobject.timeout_add (int (1000 / self.event_rate), self.__tick_cb)
+
+        self.emit ("state-changed")
+
+
+    def __tick_cb (self):
+        """
+        Announce the passage of time, and move on when a track ends.
+        """
+
+        track = self.current ()
+        if track is not None and self.position () >= track["duration"] * 1000:
+            self.next ()
+        else:
+            self.emit ("tick")
+        return True
+
+
+gobject.type_register (Player)
@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake Quod Libet, speaking the D-Bus API of Quod Libet 2.2.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import dbus
+import dbus.service
+
+
+INTERFACE = "net.sacredchao.QuodLibet"
+
+
+class Fake (dbus.service.Object):
+    """
+    Claims Quod Libet's bus name and serves its only object.
+
+    Ratings are reported on Quod Libet's internal scale of 0.0 to 1.0,
+    assuming the default of four stars.
+    """
+
+    RATING_SCALE = 4
+
+
+    def __init__ (self, player):
+        bus = dbus.SessionBus ()
+        self.__name = dbus.service.BusName ("net.sacredchao.QuodLibet", bus)
+        dbus.service.Object.__init__ (self, bus, "/net/sacredchao/QuodLibet")
+        self.__player = player
+        self.__song = self.__info ()
+
+        player.connect ("state-changed", self.__state_changed_cb)
+        player.connect ("track-changed", self.__track_changed_cb)
+
+
+    def __info (self):
+        track = self.__player.current ()
+        if track is None or self.__player.state == panflute.mpris.STATE_STOPPED:
+            return dbus.Dictionary ({}, signature = "ss")
+        return dbus.Dictionary ({"title":       track["title"],
+                                 "artist":      track["artist"],
+                                 "album":       track["album"],
+                                 "tracknumber": str (track["tracknumber"]),
+                                 "~#length":    str (track["duration"]),
+                                 "~#rating":    str (track["rating"] / self.RATING_SCALE),
+                                 "~#bitrate":   "128"},
+                                signature = "ss")
+
+
+    def __state_changed_cb (self, player):
+        if player.state == panflute.mpris.STATE_PLAYING:
+            self.Unpaused ()
+        else:
+            self.Paused ()
+        self.__track_changed_cb (player)
+
+
+    def __track_changed_cb (self, player):
+        song = self.__info ()
+        if song != self.__song:
+            if len (self.__song) > 0:
+                self.SongEnded (self.__song, True)
+            self.__song = song
+            if len (song) > 0:
+                self.SongStarted (song)
+
+
+    def __play_pause (self):
+        was_playing = (self.__player.state == panflute.mpris.STATE_PLAYING)
+        self.__player.play_pause ()
+        return was_playing
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Next (self, reply, error):
+        self.__player.respond (reply, error, self.__player.next)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Previous (self, reply, error):
+        self.__player.respond (reply, error, self.__player.previous)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def PlayPause (self, reply, error):
+        self.__player.respond (reply, error, self.__play_pause)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Pause (self, reply, error):
+        self.__player.respond (reply, error, self.__player.pause)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def Play (self, reply, error):
+        self.__player.respond (reply, error, self.__player.play)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "u",
+                          async_callbacks = ("reply", "error"))
+    def GetPosition (self, reply, error):
+        self.__player.respond (reply, error, self.__player.position)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def IsPlaying (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.state == panflute.mpris.STATE_PLAYING)
+
+
+    @dbus.service.method (dbus_interface = INTERFACE, in_signature = "", out_signature = "a{ss}",
+                          async_callbacks = ("reply", "error"))
+    def CurrentSong (self, reply, error):
+        self.__player.respond (reply, error, self.__info)
+
+
+    @dbus.service.signal (dbus_interface = INTERFACE, signature = "")
+    def Paused (self):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = INTERFACE, signature = "")
+    def Unpaused (self):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = INTERFACE, signature = "a{ss}")
+    def SongStarted (self, info):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = INTERFACE, signature = "a{ss}b")
+    def SongEnded (self, info, skipped):
+        pass
@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Fake Rhythmbox, speaking the D-Bus API of Rhythmbox 0.12.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.mpris
+
+import dbus
+import dbus.service
+
+
+PLAYER_INTERFACE = "org.gnome.Rhythmbox.Player"
+SHELL_INTERFACE = "org.gnome.Rhythmbox.Shell"
+
+
+class Fake (object):
+    """
+    Claims Rhythmbox's bus name and serves its player and shell objects.
+    """
+
+    def __init__ (self, player):
+        bus = dbus.SessionBus ()
+        self.__name = dbus.service.BusName ("org.gnome.Rhythmbox", bus)
+        self.__player = Player (player, bus)
+        self.__shell = Shell (player, bus)
+
+
+##############################################################################
+
+
+class Player (dbus.service.Object):
+    """
+    The /org/gnome/Rhythmbox/Player object.
+    """
+
+    def __init__ (self, player, bus):
+        dbus.service.Object.__init__ (self, bus, "/org/gnome/Rhythmbox/Player")
+        self.__player = player
+        self.__last_uri = ""
+
+        player.connect ("state-changed", self.__state_changed_cb)
+        player.connect ("track-changed", self.__track_changed_cb)
+        player.connect ("tick", lambda player: self.elapsedChanged (player.position () // 1000))
+        player.connect ("seeked", lambda player: self.elapsedChanged (player.position () // 1000))
+        player.connect ("rating-changed", self.__rating_changed_cb)
+
+
+    def __playing (self):
+        return self.__player.state == panflute.mpris.STATE_PLAYING
+
+
+    def __uri (self):
+        track = self.__player.current ()
+        if track is not None and self.__player.state != panflute.mpris.STATE_STOPPED:
+            return track["uri"]
+        else:
+            return ""
+
+
+    def __state_changed_cb (self, player):
+        self.playingChanged (self.__playing ())
+        self.__track_changed_cb (player)
+
+
+    def __track_changed_cb (self, player):
+        uri = self.__uri ()
+        if uri != self.__last_uri:
+            self.__last_uri = uri
+            self.playingUriChanged (uri)
+
+
+    def __rating_changed_cb (self, player):
+        track = player.current ()
+        self.playingSongPropertyChanged (track["uri"], "rating",
+                                         dbus.Double (0.0, variant_level = 1),
+                                         dbus.Double (track["rating"], variant_level = 1))
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "", out_signature = "b",
+                          async_callbacks = ("reply", "error"))
+    def getPlaying (self, reply, error):
+        self.__player.respond (reply, error, self.__playing)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "", out_signature = "s",
+                          async_callbacks = ("reply", "error"))
+    def getPlayingUri (self, reply, error):
+        self.__player.respond (reply, error, self.__uri)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def next (self, reply, error):
+        self.__player.respond (reply, error, self.__player.next)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def previous (self, reply, error):
+        self.__player.respond (reply, error, self.__player.previous)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "b", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def playPause (self, arg, reply, error):
+        self.__player.respond (reply, error, self.__player.play_pause)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "", out_signature = "u",
+                          async_callbacks = ("reply", "error"))
+    def getElapsed (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.position () // 1000)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "u", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def setElapsed (self, elapsed, reply, error):
+        self.__player.respond (reply, error, self.__player.seek, elapsed * 1000)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "", out_signature = "d",
+                          async_callbacks = ("reply", "error"))
+    def getVolume (self, reply, error):
+        self.__player.respond (reply, error, lambda: self.__player.volume / 100)
+
+
+    @dbus.service.method (dbus_interface = PLAYER_INTERFACE, in_signature = "d", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def setVolume (self, volume, reply, error):
+        self.__player.respond (reply, error, self.__player.set_volume, int (volume * 100))
+
+
+    @dbus.service.signal (dbus_interface = PLAYER_INTERFACE, signature = "b")
+    def playingChanged (self, playing):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = PLAYER_INTERFACE, signature = "s")
+    def playingUriChanged (self, uri):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = PLAYER_INTERFACE, signature = "ssvv")
+    def playingSongPropertyChanged (self, uri, property, old_value, new_value):
+        pass
+
+
+    @dbus.service.signal (dbus_interface = PLAYER_INTERFACE, signature = "u")
+    def elapsedChanged (self, elapsed):
+        pass
+
+
+##############################################################################
+
+
+class Shell (dbus.service.Object):
+    """
+    The /org/gnome/Rhythmbox/Shell object.
+    """
+
+    def __init__ (self, player, bus):
+        dbus.service.Object.__init__ (self, bus, "/org/gnome/Rhythmbox/Shell")
+        self.__player = player
+
+
+    def __find (self, uri):
+        for track in self.__player.tracks:
+            if track["uri"] == uri:
+                return track
+        raise KeyError (uri)
+
+
+    def __properties (self, uri):
+        track = self.__find (uri)
+        return dbus.Dictionary ({"title":        track["title"],
+                                 "artist":       track["artist"],
+                                 "album":        track["album"],
+                                 "track-number": dbus.UInt32 (track["tracknumber"]),
+                                 "duration":     dbus.UInt32 (track["duration"]),
+                                 "rating":       dbus.Double (track["rating"]),
+                                 "bitrate":      dbus.UInt32 (128)},
+                                signature = "sv")
+
+
+    def __set_property (self, uri, name, value):
+        if name == "rating" and uri == self.__player.current ()["uri"]:
+            self.__player.set_rating (float (value))
+
+
+    @dbus.service.method (dbus_interface = SHELL_INTERFACE, in_signature = "s", out_signature = "a{sv}",
+                          async_callbacks = ("reply", "error"))
+    def getSongProperties (self, uri, reply, error):
+        self.__player.respond (reply, error, self.__properties, uri)
+
+
+    @dbus.service.method (dbus_interface = SHELL_INTERFACE, in_signature = "ssv", out_signature = "",
+                          async_callbacks = ("reply", "error"))
+    def setSongProperty (self, uri, name, value, reply, error):
+        self.__player.respond (reply, error, self.__set_property, uri, name, value)
+
+
+    @dbus.service.method (dbus_interface = SHELL_INTERFACE, in_signature = "", out_signature = "")
+    def quit (self):
+        self.__player.quit ()
@@ -52,7 +52,7 @@ class Runner (panflute.tests.mpris.Runner):
         self.rmdirs ("~/.guayadeque/")
         self.mkdir ("~/.guayadeque/")
 
-        with open (os.path.expanduser ("~/.guayadeque/guayadeque.conf"), "w") as conf:
+        with open (self.expand ("~/.guayadeque/guayadeque.conf"), "w") as conf:
             # Don't prompt on close, and rescan the library
             print ("[General]", file = conf)
             print ("ShowCloseConfirm=0", file = conf)
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Testing against a fake VLC whose connector runs in a child process of the
+daemon, as it would for any player listed in isolated_players.
+"""
+
+from __future__ import absolute_import, print_function
+
+import panflute.tests.mpris
+
+import mateconf
+import os.path
+
+
+ISOLATED_PLAYERS = "/apps/panflute/daemon/isolated_players"
+
+
+class Launcher (panflute.tests.mpris.Launcher):
+    """
+    Launcher for testing against an isolated fake player.
+    """
+
+    def __init__ (self, daemon_prefix, prefix, user, password, test_names, owner, data):
+        panflute.tests.mpris.Launcher.__init__ (self, daemon_prefix, prefix, user, password, test_names, owner, data,
+                                                "Isolated fake")
+
+
+class Runner (panflute.tests.mpris.Runner):
+    """
+    Runner for testing against an isolated fake player.
+
+    The daemon only reads isolated_players when it starts, so the setting
+    is changed before it's started and put back once it's stopped.  The
+    fake itself comes with the daemon being tested, so prefix is ignored.
+    """
+
+    FAKE = "vlc"
+
+
+    def __init__ (self, main_loop, daemon_prefix, prefix, user, password, tests):
+        panflute.tests.mpris.Runner.__init__ (self, main_loop, daemon_prefix, prefix, user, password, tests,
+                                              self.FAKE)
+        self.__fake_player = os.path.join (daemon_prefix, "bin/panflute-fake-player")
+        self.__isolated = None
+
+
+    def prepare_persistent (self):
+        client = mateconf.client_get_default ()
+        self.__isolated = client.get_list (ISOLATED_PLAYERS, mateconf.VALUE_STRING)
+        client.set_list (ISOLATED_PLAYERS, mateconf.VALUE_STRING, [self.FAKE])
+
+
+    def cleanup_persistent (self):
+        if self.__isolated is not None:
+            client = mateconf.client_get_default ()
+            client.set_list (ISOLATED_PLAYERS, mateconf.VALUE_STRING, self.__isolated)
+            self.__isolated = None
+
+
+    def prepare_single_mpris (self, prefix, user, password):
+        child = self.run_command ([self.__fake_player, self.FAKE])
+        self.set_child (child)
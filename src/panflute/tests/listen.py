@@ -58,7 +58,7 @@ class Runner (panflute.tests.runner.Runner):
         self.rmdirs ("~/.config/listen")
         self.mkdir ("~/.config/listen")
 
-        with open (os.path.expanduser ("~/.config/listen/config"), "w") as conf:
+        with open (self.expand ("~/.config/listen/config"), "w") as conf:
             print ("[library]", file = conf)
             print ("location = {0}".format (panflute.defs.PKG_DATA_DIR), file = conf)
             print ("startup_added = true", file = conf)
@@ -0,0 +1,462 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+
+"""
+Microbenchmarks for the pure-Python code every player event goes through.
+
+Each benchmark times one hot path in isolation, using timeit.  The MPRIS
+cache objects are handed a stand-in for the daemon's Player that counts
+cache hits like the real one but whose signal methods do nothing, so no
+D-Bus connection is needed.
+
+Results are in microseconds per call.  They can be saved as a JSON
+baseline, and later runs compared against it to catch regressions.
+
+Separately, count_relayouts counts how often the applet's song widgets
+redo their text for one track change, with and without the applet Player
+batching its property updates.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.applet.applet
+import panflute.applet.player
+import panflute.daemon.mpris
+import panflute.daemon.passthrough
+import panflute.daemon.stats
+import panflute.mpris
+
+import json
+import platform
+import timeit
+
+
+# How many times to repeat each measurement, keeping the fastest.
+REPEAT = 5
+
+# How long each measurement should take, in seconds.
+TARGET = 0.2
+
+# How much slower than the baseline, as a fraction, is a regression.
+TOLERANCE = 0.25
+
+
+TRACK = {
+    "location":    "file:///music/artist/album/01-title.ogg",
+    "title":       "Title",
+    "artist":      "Artist",
+    "album":       "Album",
+    "tracknumber": "1",
+    "genre":       "Rock",
+    "time":        215,
+    "mtime":       215000,
+    "year":        1997,
+    "rating":      4,
+    "arturl":      "",
+    "bitrate":     192
+}
+
+OTHER_TRACK = dict (TRACK, location = "file:///music/artist/album/02-other.ogg",
+                           title = "Other", tracknumber = "2")
+
+# What a passthrough player hands over, before it's cleaned up.
+RAW_TRACK = {
+    "location": "file:///music/artist/album/01-title.ogg",
+    "title":    "Title",
+    "artist":   "Artist",
+    "album":    "Album",
+    "length":   215000,
+    "rating":   4
+}
+
+
+class SilentPlayer (object):
+    """
+    Stands in for panflute.daemon.mpris.Player as the owner of the cache
+    objects, without any D-Bus behind it.
+    """
+
+    def __init__ (self):
+        self.stats = panflute.daemon.stats.Counters ()
+
+        # Where the real Player's cached_metadata property keeps its value.
+        self._Player__cached_metadata = panflute.daemon.mpris.CachedMetadata (self, TRACK)
+
+
+    def cache_written (self, kind, hit):
+        self.stats.cache (kind, hit)
+
+
+    def do_TrackChange (self, metadata):
+        pass
+
+
+    def do_StatusChange (self, status):
+        pass
+
+
+    def do_CapsChange (self, caps):
+        pass
+
+
+##############################################################################
+
+
+def bench_metadata_construct ():
+    """
+    Build a CachedMetadata, running every value through CONVERSIONS.
+    """
+
+    player = SilentPlayer ()
+    return lambda: panflute.daemon.mpris.CachedMetadata (player, TRACK)
+
+
+def bench_metadata_setter_same ():
+    """
+    Set cached_metadata to what it already is, which builds a CachedMetadata
+    and compares it, but sends nothing.
+    """
+
+    player = SilentPlayer ()
+    setter = panflute.daemon.mpris.Player.cached_metadata.fset
+    return lambda: setter (player, TRACK)
+
+
+def bench_metadata_setter_changed ():
+    """
+    Set cached_metadata to a different track each time.
+    """
+
+    player = SilentPlayer ()
+    setter = panflute.daemon.mpris.Player.cached_metadata.fset
+    tracks = [TRACK, OTHER_TRACK]
+
+    def run ():
+        setter (player, tracks[0])
+        tracks.reverse ()
+
+    return run
+
+
+def bench_setitem_converted ():
+    """
+    Change a key that has a conversion in CONVERSIONS.
+    """
+
+    metadata = panflute.daemon.mpris.CachedMetadata (SilentPlayer (), TRACK)
+    titles = ["Title", "Other"]
+
+    def run ():
+        metadata["title"] = titles[0]
+        titles.reverse ()
+
+    return run
+
+
+def bench_setitem_same ():
+    """
+    Set a key to the value it already has.
+    """
+
+    metadata = panflute.daemon.mpris.CachedMetadata (SilentPlayer (), TRACK)
+
+    def run ():
+        metadata["mtime"] = 215000
+
+    return run
+
+
+def bench_setitem_unconverted ():
+    """
+    Change a key that isn't in CONVERSIONS.
+    """
+
+    metadata = panflute.daemon.mpris.CachedMetadata (SilentPlayer (), TRACK)
+    bitrates = [192, 256]
+
+    def run ():
+        metadata["bitrate"] = bitrates[0]
+        bitrates.reverse ()
+
+    return run
+
+
+def bench_sanitize_string ():
+    """
+    Clean up a string value.
+    """
+
+    sanitize_string = panflute.daemon.mpris.sanitize_string
+    return lambda: sanitize_string ("Title")
+
+
+def bench_sanitize_empty ():
+    """
+    Clean up an empty string value.
+    """
+
+    sanitize_string = panflute.daemon.mpris.sanitize_string
+    return lambda: sanitize_string ("")
+
+
+def bench_status_tuple ():
+    """
+    Get the MPRIS status four-tuple.
+    """
+
+    status = panflute.daemon.mpris.CachedStatus (SilentPlayer (), panflute.mpris.STATE_PLAYING,
+                                                 panflute.mpris.ORDER_LINEAR,
+                                                 panflute.mpris.NEXT_NEXT,
+                                                 panflute.mpris.FUTURE_STOP)
+    return lambda: status.tuple
+
+
+def bench_bit_property_get ():
+    """
+    Read one capability bit.
+    """
+
+    caps = panflute.daemon.mpris.CachedCaps (SilentPlayer (), panflute.mpris.CAN_PLAY)
+    return lambda: caps.play
+
+
+def bench_bit_property_set ():
+    """
+    Flip one capability bit.
+    """
+
+    caps = panflute.daemon.mpris.CachedCaps (SilentPlayer (), panflute.mpris.CAN_PLAY)
+    values = [True, False]
+
+    def run ():
+        caps.pause = values[0]
+        values.reverse ()
+
+    return run
+
+
+def bench_normalize_metadata ():
+    """
+    Fill in the recommended fields of a passthrough player's metadata,
+    including the cost of copying it first.
+    """
+
+    normalize = panflute.daemon.passthrough.Player._normalize_metadata.im_func
+    return lambda: normalize (None, dict (RAW_TRACK))
+
+
+def bench_format_time ():
+    """
+    Format an elapsed time for the applet.
+    """
+
+    format_time = panflute.applet.applet.format_time
+    return lambda: format_time (215000)
+
+
+def bench_format_time_hours ():
+    """
+    Format an elapsed time of over an hour for the applet.
+    """
+
+    format_time = panflute.applet.applet.format_time
+    return lambda: format_time (4215000)
+
+
+BENCHMARKS = [
+    ("metadata_construct",       bench_metadata_construct),
+    ("metadata_setter_same",     bench_metadata_setter_same),
+    ("metadata_setter_changed",  bench_metadata_setter_changed),
+    ("setitem_converted",        bench_setitem_converted),
+    ("setitem_same",             bench_setitem_same),
+    ("setitem_unconverted",      bench_setitem_unconverted),
+    ("sanitize_string",          bench_sanitize_string),
+    ("sanitize_empty",           bench_sanitize_empty),
+    ("status_tuple",             bench_status_tuple),
+    ("bit_property_get",         bench_bit_property_get),
+    ("bit_property_set",         bench_bit_property_set),
+    ("normalize_metadata",       bench_normalize_metadata),
+    ("format_time",              bench_format_time),
+    ("format_time_hours",        bench_format_time_hours)
+]
+
+
+##############################################################################
+
+
+class StubConf (object):
+    """
+    Stand-in for the applet's MateConf wrapper, enough for the widgets
+    count_relayouts attaches, showing the default metadata lines.
+    """
+
+    METADATA_LINES = ["{title}", "{artist}", "{album}"]
+
+
+    def connect_string_list (self, key, callback, call_now = False):
+        if call_now:
+            callback (self.METADATA_LINES)
+        return 0
+
+
+    def disconnect (self, handler):
+        pass
+
+
+def count_relayouts ():
+    """
+    Count how often the applet's song widgets redo their text for one track
+    change.  A real MetadataScroller and SongTip are attached to an applet
+    Player with no daemon behind it.  The scroller's string updates, each
+    of which repacks its labels, and the tip's refreshes of its parts are
+    counted.
+
+    Batched, the track change is applied the way a TrackChange from the
+    daemon is, as one update.  Unbatched, each property is applied as an
+    update of its own, as happened before batching.
+
+    Returns a dict with the number of properties that changed, and the
+    counts for each case.
+    """
+
+    def attach (player):
+        counts = {"strings": 0, "refreshes": 0}
+
+        scroller = panflute.applet.applet.MetadataScroller (StubConf (), player)
+        set_strings = scroller.set_strings
+        def counting_set_strings (strings):
+            counts["strings"] += 1
+            set_strings (strings)
+        scroller.set_strings = counting_set_strings
+
+        tip = panflute.applet.applet.SongTip (player)
+        handlers = tip._SongTip__handlers
+        wrapped = {}
+        def counting (handler):
+            def refresh (player, pspec):
+                counts["refreshes"] += 1
+                handler (player, pspec)
+            return refresh
+        for (name, handler) in handlers.items ():
+            if handler not in wrapped:
+                wrapped[handler] = counting (handler)
+            handlers[name] = wrapped[handler]
+
+        return (counts, [scroller, tip])
+
+    results = {}
+
+    player = panflute.applet.player.Player ({})
+    (counts, widgets) = attach (player)
+    try:
+        player._Player__apply_metadata (dict (TRACK))
+    finally:
+        for widget in widgets:
+            widget.destroy ()
+        player.shutdown ()
+    results["batched"] = counts
+
+    player = panflute.applet.player.Player ({})
+    (counts, widgets) = attach (player)
+    try:
+        values = player._Player__track_values (dict (TRACK))
+        results["fields"] = len (values)
+        for (name, value) in values.iteritems ():
+            player._update_properties ({name: value})
+    finally:
+        for widget in widgets:
+            widget.destroy ()
+        player.shutdown ()
+    results["unbatched"] = counts
+
+    return results
+
+
+def measure (func, repeat = REPEAT, target = TARGET):
+    """
+    Time a function, returning the fastest of repeat runs in microseconds
+    per call.  Each run calls it enough times to take about target seconds.
+    """
+
+    timer = timeit.Timer (func)
+
+    number = 1
+    while True:
+        elapsed = timer.timeit (number)
+        if elapsed >= target / 10 or number >= 10 ** 8:
+            break
+        number *= 10
+    number = max (1, int (number * target / max (elapsed, 1e-9)))
+
+    return min (timer.repeat (repeat, number)) / number * 1e6
+
+
+def run (names = None, repeat = REPEAT, target = TARGET):
+    """
+    Run the named benchmarks, or all of them, returning a dict mapping each
+    name to microseconds per call.
+    """
+
+    results = {}
+    for (name, setup) in BENCHMARKS:
+        if names is None or name in names:
+            results[name] = measure (setup (), repeat, target)
+    return results
+
+
+def save (results, filename):
+    """
+    Write results out as a JSON baseline.
+    """
+
+    baseline = {
+        "python":  platform.python_version (),
+        "machine": platform.machine (),
+        "results": results
+    }
+    with open (filename, "w") as output:
+        json.dump (baseline, output, indent = 1, sort_keys = True)
+
+
+def load (filename):
+    """
+    Read the results back in from a JSON baseline.
+    """
+
+    with open (filename, "r") as input:
+        return json.load (input)["results"]
+
+
+def compare (results, baseline, tolerance = TOLERANCE):
+    """
+    Compare results against a baseline, returning a list of (name, result,
+    baseline, ratio) for every benchmark in both, and a list of the names of
+    those that got more than tolerance slower.
+    """
+
+    comparisons = []
+    regressions = []
+    for (name, setup) in BENCHMARKS:
+        if name in results and name in baseline:
+            ratio = results[name] / baseline[name]
+            comparisons.append ((name, results[name], baseline[name], ratio))
+            if ratio > 1 + tolerance:
+                regressions.append (name)
+    return comparisons, regressions
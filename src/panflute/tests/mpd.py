@@ -55,7 +55,7 @@ class Runner (panflute.tests.runner.Runner):
         self.rmdirs ("~/.mpd")
         self.mkdir ("~/.mpd")
 
-        with open (os.path.expanduser ("~/.mpd/mpd.conf"), "w") as conf:
+        with open (self.expand ("~/.mpd/mpd.conf"), "w") as conf:
             print ("music_directory \"{0}\"".format (panflute.defs.PKG_DATA_DIR), file = conf)
             print ("db_file \"~/.mpd/database\"", file = conf)
             print ("audio_output {", file = conf)
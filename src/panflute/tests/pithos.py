@@ -56,7 +56,7 @@ class Runner (panflute.tests.runner.Runner):
         self.rmfile ("~/.config/pithos.ini")
         self.mkdir ("~/.config")
 
-        with open (os.path.expanduser ("~/.config/pithos.ini"), "w") as ini:
+        with open (self.expand ("~/.config/pithos.ini"), "w") as ini:
             print ("username={0}".format (user), file = ini)
             print ("password={0}".format (password), file = ini)
 
@@ -56,7 +56,7 @@ class Runner (panflute.tests.mpris.Runner):
         self.mkdir ("~/.qmmp")
 
         # Enable the MPRIS plugin
-        with open (os.path.expanduser ("~/.qmmp/qmmprc"), "w") as rc:
+        with open (self.expand ("~/.qmmp/qmmprc"), "w") as rc:
             print ("[%General]", file = rc)
             print ("enabled_plugins=mpris", file = rc)
 
@@ -53,7 +53,7 @@ class Runner (panflute.tests.runner.Runner):
         self.rmdirs ("~/.quodlibet")
         self.mkdir ("~/.quodlibet")
 
-        with open (os.path.expanduser ("~/.quodlibet/config"), "w") as config:
+        with open (self.expand ("~/.quodlibet/config"), "w") as config:
             print ("[settings]", file = config)
             print ("scan = {0}".format (panflute.defs.PKG_DATA_DIR), file = config)
             print ("", file = config)
@@ -33,6 +33,7 @@ import os.path
 import shutil
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 import traceback
@@ -42,8 +43,17 @@ class Launcher (object):
     """
     Launch a subprocess for running a series of tests against the same
     player configuration.
+
+    Each subprocess gets a D-Bus session bus and XDG base directories of
+    its own, so launchers for different players can run side by side.
     """
 
+    XDG_DIRS = { "XDG_CONFIG_HOME": ".config",
+                 "XDG_DATA_HOME":   ".local/share",
+                 "XDG_CACHE_HOME":  ".cache"
+               }
+
+
     def __init__ (self, daemon_prefix, prefix, user, password, test_names, owner, data, player_name):
         self.__daemon_prefix = daemon_prefix
         self.__prefix = prefix
@@ -55,14 +65,27 @@ class Launcher (object):
         self.__player_name = player_name
 
         self.__child = None
+        self.__bus_daemon = None
+        self.__sandbox = None
         self.__env = os.environ.copy ()
 
+        self.started = None
+        self.finished = None
+
+
+    @property
+    def player_name (self):
+        return self.__player_name
+
 
     def start (self):
         """
         Start the subprocess and begin collecting results from it.
         """
 
+        self.started = time.time ()
+        self.__create_sandbox ()
+
         with open ("/dev/null", "r") as null:
             child = subprocess.Popen ([sys.argv[0], "--subprocess", self.__player_name, self.__daemon_prefix,
                                             self.__prefix, self.__user, self.__password] + self.__test_names,
@@ -72,6 +95,46 @@ class Launcher (object):
         glib.io_add_watch (child.stdout, glib.IO_IN | glib.IO_HUP, self.__child_io_cb)
 
 
+    def __create_sandbox (self):
+        """
+        Start a private session bus and create fresh XDG directories for the
+        subprocess.
+        """
+
+        self.__sandbox = tempfile.mkdtemp (prefix = "panflute-tests-")
+        for (name, path) in self.XDG_DIRS.iteritems ():
+            path = os.path.join (self.__sandbox, path)
+            os.makedirs (path, 0700)
+            self.__env[name] = path
+
+        with open ("/dev/null", "r+") as null:
+            self.__bus_daemon = subprocess.Popen (["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+                                                  shell = False, close_fds = True, preexec_fn = os.setsid,
+                                                  stdin = null, stdout = subprocess.PIPE, stderr = null)
+        self.__env["DBUS_SESSION_BUS_ADDRESS"] = self.__bus_daemon.stdout.readline ().strip ()
+        if self.__env.has_key ("DBUS_SESSION_BUS_PID"):
+            del self.__env["DBUS_SESSION_BUS_PID"]
+
+
+    def __destroy_sandbox (self):
+        """
+        Shut down the private session bus and delete the XDG directories.
+        """
+
+        if self.__bus_daemon is not None:
+            try:
+                self.__bus_daemon.terminate ()
+                self.__bus_daemon.wait ()
+            except OSError:
+                # Already gone
+                pass
+            self.__bus_daemon = None
+
+        if self.__sandbox is not None:
+            shutil.rmtree (self.__sandbox, True)
+            self.__sandbox = None
+
+
     def augment_env_path (self, name, value):
         """
         Augment a PATH-style environment variable, creating it if it doesn't
@@ -97,19 +160,30 @@ class Launcher (object):
         Called when the subprocess produces more data, or closes the pipe.
         """
 
-        if cond == glib.IO_IN:
+        if cond & glib.IO_IN:
             more = self.__process_message (source)
             if not more:
-                self.__owner.start_next_launcher ()
+                self.__finish ()
             return more
         else:
             # glib.IO_HUP indicates the subprocess crashed, probably leaving
             # behind its own children.  Abort testing since any results
             # produced without cleaning up the mess will be unreliable.
             self.__owner.abort_testing ()
+            self.__finish ()
             return False
 
 
+    def __finish (self):
+        """
+        Clean up after the subprocess and let the owner know it's done.
+        """
+
+        self.finished = time.time ()
+        self.__destroy_sandbox ()
+        self.__owner.launcher_finished (self)
+
+
     def __process_message (self, source):
         """
         Process a message from the subprocess, returning True if more
@@ -122,14 +196,19 @@ class Launcher (object):
             [result, test_name] = line.split (" ")
             if result != "***":
                 detail = ""
+                measurements = {}
                 line = source.readline ().rstrip ()
                 while line != "":
-                    detail += line + "\n"
+                    if line.startswith ("MEASURE "):
+                        [tag, name, value] = line.split (" ", 2)
+                        measurements[name] = float (value)
+                    else:
+                        detail += line + "\n"
                     line = source.readline ().rstrip ()
                 if result == "START":
                     self.__owner.process_start (self.__data, test_name)
                 else:
-                    self.__owner.process_result (self.__data, test_name, result, detail)
+                    self.__owner.process_result (self.__data, test_name, result, detail, measurements)
                 return True
             else:
                 return False
@@ -167,6 +246,11 @@ class Runner (threading.Thread):
         proxy = self.bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
         self.bus_obj = dbus.Interface (proxy, "org.freedesktop.DBus")
 
+        # Signals arrive in the main thread, but are waited for in this one.
+        self.__changed = threading.Condition ()
+        self.__owners = {}
+        self.bus_obj.connect_to_signal ("NameOwnerChanged", self.__name_owner_changed_cb)
+
 
     def run (self):
         if len (self.__tests) == 0:
@@ -175,24 +259,20 @@ class Runner (threading.Thread):
             try:
                 print ("DEBUG: prepare_persistent", file = sys.stderr)
                 self.prepare_persistent ()
-                time.sleep (3)
                 print ("DEBUG: prepare_single", file = sys.stderr)
                 self.prepare_single (self.__prefix, self.__user, self.__password)
-                time.sleep (3)
             finally:
                 self.__main_loop.quit ()
         else:
-            # The calls to sleep are to give various things a chance to settle
-            # down before continuing; having two instances of the same player
-            # running at the same time, for example, causes problems.
+            # Rather than sleeping to give things a chance to settle down,
+            # wait for the names involved to come and go, and for the daemon
+            # to stop chattering about a newly started player.
 
             try:
                 print ("DEBUG: prepare_persistent", file = sys.stderr)
                 self.prepare_persistent ()
                 print ("DEBUG: start_daemon", file = sys.stderr)
                 self.start_daemon ()
-                print ("DEBUG: sleep", file = sys.stderr)
-                time.sleep (3)
 
                 for test in self.__tests:
                     try:
@@ -202,11 +282,10 @@ class Runner (threading.Thread):
 
                         print ("DEBUG: prepare_single", file = sys.stderr)
                         self.prepare_single (self.__prefix, self.__user, self.__password)
-                        time.sleep (3)
                         print ("DEBUG: create_proxies", file = sys.stderr)
                         player, player_ex = self.create_proxies ()
-                        print ("DEBUG: sleep", file = sys.stderr)
-                        time.sleep (3)
+                        print ("DEBUG: settle", file = sys.stderr)
+                        self.settle ("org.mpris.panflute")
 
                         print ("DEBUG: should_be_run", file = sys.stderr)
                         if test.should_be_run (player_ex):
@@ -226,8 +305,6 @@ class Runner (threading.Thread):
                             self.cleanup_single ()
                             print ("DEBUG: wait_for", file = sys.stderr)
                             self.wait_for ("org.mpris.panflute", False)
-                            print ("DEBUG: sleep", file = sys.stderr)
-                            time.sleep (3)
                         except Exception, e:
                             if result != "FAIL":
                                 result = "FAIL"
@@ -239,6 +316,8 @@ class Runner (threading.Thread):
                                 self.__child = None
 
                     print ("{0} {1}".format (result, test.__class__.__name__))
+                    for (name, value) in sorted (test.measurements.iteritems ()):
+                        print ("MEASURE {0} {1}".format (name, value))
                     if detail != "":
                         print (detail.rstrip ())
                     print ()
@@ -248,8 +327,6 @@ class Runner (threading.Thread):
                 self.stop_daemon ()
                 print ("DEBUG: cleanup_persistent", file = sys.stderr)
                 self.cleanup_persistent ()
-                print ("DEBUG: sleep", file = sys.stderr)
-                time.sleep (3)
 
             finally:
                 print ("*** ***")
@@ -299,13 +376,26 @@ class Runner (threading.Thread):
         self.__child = child
 
 
+    def expand (self, path):
+        """
+        Expand a path starting with ~, taking into account that the usual
+        XDG directories may have been moved elsewhere.
+        """
+
+        for (name, subdir) in Launcher.XDG_DIRS.iteritems ():
+            prefix = os.path.join ("~", subdir)
+            if os.environ.has_key (name) and (path == prefix or path.startswith (prefix + "/")):
+                return os.environ[name] + path[len (prefix):]
+        return os.path.expanduser (path)
+
+
     def rmdirs (self, path):
         """
         Recursive remove a directory.
         """
 
         try:
-            shutil.rmtree (os.path.expanduser (path))
+            shutil.rmtree (self.expand (path))
         except OSError:
             # don't care if directory didn't exist
             pass
@@ -317,7 +407,7 @@ class Runner (threading.Thread):
         """
 
         try:
-            os.unlink (os.path.expanduser (path))
+            os.unlink (self.expand (path))
         except OSError:
             # don't care if file didn't exist
             pass
@@ -329,7 +419,7 @@ class Runner (threading.Thread):
         """
 
         try:
-            os.makedirs (os.path.expanduser (path))
+            os.makedirs (self.expand (path))
         except OSError:
             # don't care if directory already exists
             pass
@@ -345,15 +435,18 @@ class Runner (threading.Thread):
                                      stdin = null, stdout = null, stderr = null)
 
 
-    def end_process (self, child):
+    def end_process (self, child, timeout = 3):
         """
-        Forcibly terminate a subprocess.
+        Forcibly terminate a subprocess, killing it if it hasn't exited
+        within timeout seconds.
         """
 
         try:
             if child.poll () is None:
                 child.terminate ()
-                time.sleep (3)
+                deadline = time.time () + timeout
+                while child.poll () is None and time.time () < deadline:
+                    time.sleep (0.05)
                 if child.poll () is None:
                     child.kill ()
                     child.wait ()
@@ -408,18 +501,66 @@ class Runner (threading.Thread):
         return player, player_ex
 
 
-    def wait_for (self, name, wanted, tries = 20):
+    def wait_for (self, name, wanted, timeout = 20):
         """
-        Wait for a D-Bus name to appear, giving up after too many tries.
+        Wait for a D-Bus name to appear or disappear, giving up after timeout
+        seconds.
         """
 
-        while tries > 0:
-            time.sleep (1)
-            if self.bus_obj.NameHasOwner (name) == wanted:
-                return
-            tries = tries - 1
+        deadline = time.time () + timeout
+        with self.__changed:
+            self.__owners.pop (name, None)
+
+        # Don't hold the lock during the call, since the main thread may need
+        # it to finish handling a signal.
+        has_owner = bool (self.bus_obj.NameHasOwner (name))
+
+        with self.__changed:
+            has_owner = self.__owners.get (name, has_owner)
+            while has_owner != wanted:
+                remaining = deadline - time.time ()
+                if remaining <= 0:
+                    raise TestError ("Timed out waiting for {0} to {1}".format (
+                        name, wanted and "appear" or "disappear"))
+                self.__changed.wait (remaining)
+                has_owner = self.__owners.get (name, has_owner)
+
+
+    def settle (self, name, quiet = 0.5, timeout = 10):
+        """
+        Wait until whoever owns a D-Bus name has gone quiet seconds without
+        sending a signal, or timeout seconds have passed, whichever comes
+        first.
+        """
+
+        last = [time.time ()]
+
+        def signal_cb (*args):
+            with self.__changed:
+                last[0] = time.time ()
+
+        match = self.bus.add_signal_receiver (signal_cb, bus_name = name)
+        try:
+            deadline = time.time () + timeout
+            with self.__changed:
+                while True:
+                    now = time.time ()
+                    until = min (last[0] + quiet, deadline)
+                    if now >= until:
+                        break
+                    self.__changed.wait (until - now)
+        finally:
+            match.remove ()
+
+
+    def __name_owner_changed_cb (self, name, old_owner, new_owner):
+        """
+        Record a name coming or going, and wake up anyone waiting on it.
+        """
 
-        raise TestError
+        with self.__changed:
+            self.__owners[name] = (new_owner != "")
+            self.__changed.notify_all ()
 
 
 class TestError (Exception):
@@ -0,0 +1,543 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Recording and replaying the D-Bus traffic between a player and Panflute.
+
+A Recorder watches the session bus and writes every signal, method call and
+reply involving a player or Panflute to a file, one JSON list per line.  A
+Replayer later takes the place of the player, sending the signals it sent
+with the same timing (or as fast as possible) and answering the daemon's
+method calls with the replies the player gave, so that the daemon can be
+exercised without the player being installed.
+
+The records are:
+
+    ["session", VERSION, start]
+    ["owner", t, name, unique]
+    ["signal", t, sender, path, interface, member, signature, args]
+    ["call", t, sender, serial, destination, path, interface, member, signature, args]
+    ["return", t, sender, reply_serial, destination, signature, args]
+    ["error", t, sender, reply_serial, destination, error_name, args]
+
+where t is the number of seconds since the recording started.  Arguments
+are encoded according to the message's signature, with each variant
+written as a [signature, value] pair so its type survives the round trip.
+"""
+
+from __future__ import absolute_import, print_function
+
+import dbus
+import dbus.bus
+import dbus.exceptions
+import dbus.lowlevel
+import gobject
+import json
+import time
+
+
+VERSION = 1
+
+# Interfaces and bus names starting with any of these are recorded.
+DEFAULT_PREFIXES = ["org.mpris.", "org.freedesktop.MediaPlayer", "org.kuliniewicz.Panflute"]
+
+# Bus names belonging to Panflute itself, which are never impersonated.
+OWN_NAMES = ["org.mpris.panflute", "org.mpris.MediaPlayer2.panflute", "org.kuliniewicz.Panflute"]
+
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+
+class Recorder (object):
+    """
+    Writes the session bus traffic of interest to a file.
+    """
+
+    from panflute.util import log
+
+    FLUSH_INTERVAL = 1000
+
+    MATCHES = ["type='signal'",
+               "type='method_call'",
+               "type='method_return'",
+               "type='error'"]
+
+
+    def __init__ (self, filename, prefixes = DEFAULT_PREFIXES):
+        self.__prefixes = tuple (prefixes)
+        self.__output = open (filename, "w")
+        self.__start = time.time ()
+        self.__calls = set ()
+        self.count = 0
+
+        self.__write (["session", VERSION, self.__start])
+
+        self.__bus = dbus.SessionBus ()
+        for match in self.MATCHES:
+            try:
+                self.__bus.add_match_string ("eavesdrop='true'," + match)
+            except dbus.exceptions.DBusException:
+                # Buses before 1.5 don't know about eavesdrop, but let
+                # anyone eavesdrop anyway.
+                self.__bus.add_match_string (match)
+        self.__bus.add_message_filter (self.__filter_cb)
+
+        bus_obj = self.__bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+        bus_iface = dbus.Interface (bus_obj, "org.freedesktop.DBus")
+        for name in bus_iface.ListNames ():
+            if name.startswith (self.__prefixes):
+                self.__write (["owner", 0.0, name, bus_iface.GetNameOwner (name)])
+
+        self.__flush_source = gobject.timeout_add (self.FLUSH_INTERVAL, self.__flush_cb)
+
+
+    def close (self):
+        """
+        Stop recording.
+        """
+
+        self.__bus.remove_message_filter (self.__filter_cb)
+        gobject.source_remove (self.__flush_source)
+        self.__output.close ()
+
+
+    def __flush_cb (self):
+        self.__output.flush ()
+        return True
+
+
+    def __write (self, record):
+        """
+        Append a record to the file.
+        """
+
+        self.__output.write (json.dumps (record, separators = (",", ":")))
+        self.__output.write ("\n")
+
+
+    def __interesting (self, interface, args):
+        """
+        Check whether a message is to or from an interface of interest.
+        """
+
+        if interface is None:
+            return False
+        elif interface.startswith (self.__prefixes):
+            return True
+        elif interface == PROPERTIES_INTERFACE and len (args) > 0:
+            return unicode (args[0]).startswith (self.__prefixes)
+        else:
+            return False
+
+
+    def __filter_cb (self, bus, message):
+        """
+        Record a message if it's one of interest.
+        """
+
+        now = round (time.time () - self.__start, 6)
+        kind = message.get_type ()
+        args = message.get_args_list ()
+        signature = message.get_signature ()
+
+        if kind == dbus.lowlevel.MESSAGE_TYPE_SIGNAL:
+            if message.get_member () == "NameOwnerChanged" and message.get_interface () == "org.freedesktop.DBus":
+                if args[0].startswith (self.__prefixes):
+                    self.__write (["owner", now, args[0], args[2]])
+                    self.count += 1
+            elif self.__interesting (message.get_interface (), args):
+                self.__write (["signal", now, message.get_sender (), message.get_path (),
+                               message.get_interface (), message.get_member (),
+                               signature, encode_args (args, signature)])
+                self.count += 1
+
+        elif kind == dbus.lowlevel.MESSAGE_TYPE_METHOD_CALL:
+            if self.__interesting (message.get_interface (), args):
+                self.__calls.add ((message.get_sender (), message.get_serial ()))
+                self.__write (["call", now, message.get_sender (), message.get_serial (),
+                               message.get_destination (), message.get_path (),
+                               message.get_interface (), message.get_member (),
+                               signature, encode_args (args, signature)])
+                self.count += 1
+
+        elif kind in [dbus.lowlevel.MESSAGE_TYPE_METHOD_RETURN, dbus.lowlevel.MESSAGE_TYPE_ERROR]:
+            key = (message.get_destination (), message.get_reply_serial ())
+            if key in self.__calls:
+                self.__calls.remove (key)
+                if kind == dbus.lowlevel.MESSAGE_TYPE_METHOD_RETURN:
+                    self.__write (["return", now, message.get_sender (), message.get_reply_serial (),
+                                   message.get_destination (), signature, encode_args (args, signature)])
+                else:
+                    self.__write (["error", now, message.get_sender (), message.get_reply_serial (),
+                                   message.get_destination (), message.get_error_name (),
+                                   [unicode (arg) for arg in args]])
+                self.count += 1
+
+        return dbus.lowlevel.HANDLER_RESULT_NOT_YET_HANDLED
+
+
+##############################################################################
+
+
+class Replayer (object):
+    """
+    Takes the place of a recorded player.
+
+    Every message the player sent on its own -- its signals, and taking and
+    releasing its bus names -- is replayed at the recorded time divided by
+    speed, or as fast as the main loop allows if speed is 0.  Method calls
+    are answered with the reply the player gave to the most recent call
+    with the same arguments, or failing that to the same method, as of the
+    point the replay has reached.
+    """
+
+    from panflute.util import log
+
+    # How many records to send per main loop iteration when replaying as
+    # fast as possible, so method calls still get answered.
+    FAST_BATCH = 100
+
+
+    def __init__ (self, filename, names = None, speed = 1.0, done_cb = None):
+        self.__speed = speed
+        self.__done_cb = done_cb
+        self.__events = []
+        self.__replies = {}
+        self.__now = 0.0
+
+        self.signals = 0
+        self.answered = 0
+        self.unanswered = 0
+        self.elapsed = None
+
+        self.__load (filename, names)
+
+        self.__bus = dbus.SessionBus ()
+        self.__bus.add_message_filter (self.__filter_cb)
+
+
+    def start (self):
+        """
+        Start replaying.
+        """
+
+        self.__next = 0
+        self.__started = time.time ()
+        if len (self.__events) > 0:
+            self.__origin = self.__events[0][0]
+        self.__schedule ()
+
+
+    def __load (self, filename, names):
+        """
+        Read a recording, and pick out what the impersonated player did.
+        """
+
+        with open (filename, "r") as recording:
+            records = [json.loads (line) for line in recording if line.strip () != ""]
+
+        if len (records) == 0 or records[0][0] != "session" or records[0][1] != VERSION:
+            raise ValueError ("{0} is not a session recording".format (filename))
+
+        if names is None:
+            names = set ()
+            for record in records:
+                if record[0] == "call" and not record[4].startswith (":") and record[4] not in OWN_NAMES:
+                    names.add (record[4])
+        self.log.info ("Impersonating {0}".format (", ".join (sorted (names))))
+
+        uniques = set ()
+        calls = {}
+        for record in records:
+            kind = record[0]
+            if kind == "owner":
+                (t, name, unique) = record[1:]
+                if name in names:
+                    self.__events.append ((t, "owner", name, unique))
+                    if unique != "":
+                        uniques.add (unique)
+            elif kind == "signal":
+                (t, sender, path, interface, member, signature, args) = record[1:]
+                if sender in uniques:
+                    self.__events.append ((t, "signal", path, interface, member, signature, args))
+            elif kind == "call":
+                (t, sender, serial, destination, path, interface, member, signature, args) = record[1:]
+                if destination in names or destination in uniques:
+                    calls[(sender, serial)] = (path, interface, member, json.dumps (args))
+            elif kind in ["return", "error"]:
+                (t, sender, reply_serial, destination) = record[1:5]
+                call = calls.pop ((destination, reply_serial), None)
+                if call is not None:
+                    (path, interface, member, args) = call
+                    for key in [(path, interface, member, args), (path, interface, member)]:
+                        self.__replies.setdefault (key, []).append ((t, kind, record[5], record[6]))
+
+
+    ##########################################################################
+    #
+    # Replaying the player's own messages
+    #
+    ##########################################################################
+
+
+    def __schedule (self):
+        """
+        Arrange for the next record to be replayed when it's due.
+        """
+
+        if self.__next >= len (self.__events):
+            self.elapsed = time.time () - self.__started
+            self.log.info ("Replayed {0} signals in {1:.3f} s; answered {2} calls, couldn't answer {3}".format (
+                self.signals, self.elapsed, self.answered, self.unanswered))
+            if self.__done_cb is not None:
+                self.__done_cb ()
+        elif self.__speed == 0:
+            gobject.idle_add (self.__replay_cb)
+        else:
+            due = self.__started + (self.__events[self.__next][0] - self.__origin) / self.__speed
+            delay = max (0, int ((due - time.time ()) * 1000))
+            gobject.timeout_add (delay, self.__replay_cb)
+
+
+    def __replay_cb (self):
+        """
+        Replay every record that's now due.
+        """
+
+        batch = 0
+        while self.__next < len (self.__events):
+            event = self.__events[self.__next]
+            if self.__speed == 0:
+                if batch >= self.FAST_BATCH:
+                    break
+            elif self.__started + (event[0] - self.__origin) / self.__speed > time.time ():
+                break
+
+            self.__replay (event)
+            self.__next += 1
+            batch += 1
+
+        self.__schedule ()
+        return False
+
+
+    def __replay (self, event):
+        """
+        Replay a single record.
+        """
+
+        self.__now = event[0]
+        if event[1] == "owner":
+            (t, kind, name, unique) = event
+            if unique != "":
+                self.__bus.request_name (name, dbus.bus.NAME_FLAG_DO_NOT_QUEUE)
+            else:
+                self.__bus.release_name (name)
+        else:
+            (t, kind, path, interface, member, signature, args) = event
+            message = dbus.lowlevel.SignalMessage (path, interface, member)
+            if signature != "":
+                message.append (signature = signature, *decode_args (args, signature))
+            self.__bus.send_message (message)
+            self.signals += 1
+
+
+    ##########################################################################
+    #
+    # Answering method calls
+    #
+    ##########################################################################
+
+
+    def __filter_cb (self, bus, message):
+        """
+        Answer a method call the way the player did.
+        """
+
+        if message.get_type () != dbus.lowlevel.MESSAGE_TYPE_METHOD_CALL:
+            return dbus.lowlevel.HANDLER_RESULT_NOT_YET_HANDLED
+
+        signature = message.get_signature ()
+        args = json.dumps (encode_args (message.get_args_list (), signature))
+        path = message.get_path ()
+        interface = message.get_interface ()
+        member = message.get_member ()
+
+        reply = self.__find_reply ((path, interface, member, args))
+        if reply is None:
+            reply = self.__find_reply ((path, interface, member))
+
+        if reply is None:
+            self.unanswered += 1
+            self.log.debug ("No recorded reply for {0}.{1} on {2}".format (interface, member, path))
+            response = dbus.lowlevel.ErrorMessage (message, "org.freedesktop.DBus.Error.UnknownMethod",
+                                                   "No recorded reply for {0}.{1}".format (interface, member))
+        else:
+            self.answered += 1
+            (t, kind, name_or_signature, reply_args) = reply
+            if kind == "return":
+                response = dbus.lowlevel.MethodReturnMessage (message)
+                if name_or_signature != "":
+                    response.append (signature = name_or_signature, *decode_args (reply_args, name_or_signature))
+            else:
+                response = dbus.lowlevel.ErrorMessage (message, name_or_signature, " ".join (reply_args))
+
+        if not message.get_no_reply ():
+            bus.send_message (response)
+        return dbus.lowlevel.HANDLER_RESULT_HANDLED
+
+
+    def __find_reply (self, key):
+        """
+        Find the latest recorded reply for a call as of the current point in
+        the replay, or the earliest one if none were that early.
+        """
+
+        replies = self.__replies.get (key)
+        if replies is None:
+            return None
+
+        best = replies[0]
+        for reply in replies:
+            if reply[0] <= self.__now:
+                best = reply
+            else:
+                break
+        return best
+
+
+##############################################################################
+
+
+BASIC_TYPES = {
+    "y": dbus.Byte,
+    "b": dbus.Boolean,
+    "n": dbus.Int16,
+    "q": dbus.UInt16,
+    "i": dbus.Int32,
+    "u": dbus.UInt32,
+    "x": dbus.Int64,
+    "t": dbus.UInt64,
+    "d": dbus.Double,
+    "s": dbus.String,
+    "o": dbus.ObjectPath,
+    "g": dbus.Signature,
+}
+
+
+def encode_args (args, signature):
+    """
+    Convert the arguments of a message into something JSON can hold.
+    """
+
+    return [encode (arg, arg_signature) for (arg, arg_signature) in zip (args, dbus.Signature (signature))]
+
+
+def decode_args (args, signature):
+    """
+    Convert arguments encoded by encode_args back into D-Bus values.
+    """
+
+    return [decode (arg, arg_signature) for (arg, arg_signature) in zip (args, dbus.Signature (signature))]
+
+
+def encode (value, signature):
+    """
+    Encode a single value of a single complete type.
+    """
+
+    code = signature[0]
+    if code == "v":
+        inner = signature_of (value)
+        return [inner, encode (value, inner)]
+    elif signature.startswith ("a{"):
+        (key_signature, value_signature) = list (dbus.Signature (signature[2:-1]))
+        return [[encode (k, key_signature), encode (v, value_signature)] for (k, v) in value.iteritems ()]
+    elif code == "a":
+        return [encode (item, signature[1:]) for item in value]
+    elif code == "(":
+        return [encode (item, item_signature) for (item, item_signature) in zip (value, dbus.Signature (signature[1:-1]))]
+    elif code == "b":
+        return bool (value)
+    elif code == "d":
+        return float (value)
+    elif code in "sog":
+        return unicode (value)
+    else:
+        return int (value)
+
+
+def decode (value, signature):
+    """
+    Decode a single value of a single complete type.
+    """
+
+    code = signature[0]
+    if code == "v":
+        (inner, inner_value) = value
+        return decode (inner_value, inner)
+    elif signature.startswith ("a{"):
+        (key_signature, value_signature) = list (dbus.Signature (signature[2:-1]))
+        return dbus.Dictionary (((decode (k, key_signature), decode (v, value_signature)) for (k, v) in value),
+                                signature = key_signature + value_signature)
+    elif code == "a":
+        return dbus.Array ([decode (item, signature[1:]) for item in value], signature = signature[1:])
+    elif code == "(":
+        return dbus.Struct ([decode (item, item_signature) for (item, item_signature) in zip (value, dbus.Signature (signature[1:-1]))],
+                            signature = signature[1:-1])
+    else:
+        return BASIC_TYPES[code] (value)
+
+
+def signature_of (value):
+    """
+    Determine the signature of the value held in a variant.
+    """
+
+    for (code, cls) in BASIC_TYPES.iteritems ():
+        if type (value) == cls:
+            return code
+
+    if isinstance (value, dbus.Dictionary):
+        if value.signature is not None:
+            return "a{" + value.signature + "}"
+        elif len (value) > 0:
+            (k, v) = value.iteritems ().next ()
+            return "a{" + signature_of (k) + signature_of (v) + "}"
+        else:
+            return "a{sv}"
+    elif isinstance (value, dbus.Array):
+        if value.signature is not None:
+            return "a" + value.signature
+        elif len (value) > 0:
+            return "a" + signature_of (value[0])
+        else:
+            return "av"
+    elif isinstance (value, dbus.Struct):
+        if value.signature is not None:
+            return "(" + value.signature + ")"
+        else:
+            return "(" + "".join (signature_of (item) for item in value) + ")"
+    elif isinstance (value, bool):
+        return "b"
+    elif isinstance (value, (int, long)):
+        return "i"
+    elif isinstance (value, float):
+        return "d"
+    else:
+        return "s"
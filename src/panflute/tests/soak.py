@@ -0,0 +1,321 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Soak testing the daemon for leaks.
+
+Fake players are connected and disconnected, swapped in and out as the
+exposed player, and made to change tracks, thousands of times over.  Every
+so often the daemon is asked how much memory, how many file descriptors,
+bus matches and Python objects it is holding on to.  Anything that only
+ever goes up is reported as a leak.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import panflute.tests.fake
+import panflute.tests.fake.player
+
+import dbus
+import glib
+import Queue
+import sys
+import threading
+import time
+
+
+PHASES = ["connect", "expose", "track"]
+
+# How much each measure may grow over a phase before a steady climb counts
+# as a leak, allowing for caches and allocator slack.
+SLACK = { "rss":     2048,
+          "fds":     2,
+          "matches": 2,
+          "bus_matches": 2
+        }
+OBJECT_SLACK = 50
+
+
+class Soak (threading.Thread):
+    """
+    Runs the soak cycles against a daemon already on the session bus,
+    taking a sample of its resources every sample_every cycles.
+
+    The fakes are created in the main thread, which runs the main loop;
+    the cycles run in this thread, waiting on the daemon's signals to know
+    when each step has taken effect.
+    """
+
+    TIMEOUT = 10
+
+
+    def __init__ (self, main_loop, player_name, other_name, cycles, sample_every, latency = 0, event_rate = 1.0):
+        threading.Thread.__init__ (self, name = "Soak")
+        self.daemon = True
+
+        self.__main_loop = main_loop
+        self.__player_name = player_name
+        self.__other_name = other_name
+        self.__cycles = cycles
+        self.__sample_every = sample_every
+        self.__latency = latency
+        self.__event_rate = event_rate
+
+        self.__events = Queue.Queue ()
+        self.__models = {}
+        self.__fakes = []
+
+        self.samples = []
+        self.leaks = []
+        self.error = None
+
+        self.__bus = dbus.SessionBus ()
+        proxy = self.__bus.get_object ("org.kuliniewicz.Panflute", "/connectors")
+        self.__manager = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Manager")
+        self.__stats = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Stats")
+
+        proxy = self.__bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+        self.__bus_stats = dbus.Interface (proxy, "org.freedesktop.DBus.Debug.Stats")
+        self.__bus_obj = dbus.Interface (proxy, "org.freedesktop.DBus")
+
+        self.__bus.add_signal_receiver (self.__connected_changed_cb, "ConnectedChanged",
+                                        "org.kuliniewicz.Panflute.Connector", "org.kuliniewicz.Panflute",
+                                        path_keyword = "path")
+        self.__bus.add_signal_receiver (self.__track_change_cb, "TrackChange",
+                                        "org.freedesktop.MediaPlayer", "org.mpris.panflute", "/Player")
+
+
+    def run (self):
+        try:
+            self.__in_main (self.__start_fakes)
+            self.__expect ("connected", "/connectors/{0}".format (panflute.tests.fake.connector_name (self.__player_name)))
+            self.__expect ("connected", "/connectors/{0}".format (panflute.tests.fake.connector_name (self.__other_name)))
+
+            for phase in PHASES:
+                print ("Soaking: {0} x {1}".format (phase, self.__cycles), file = sys.stderr)
+                step = getattr (self, "_cycle_" + phase)
+                self.__sample (phase, 0)
+                for n in range (1, self.__cycles + 1):
+                    step ()
+                    if n % self.__sample_every == 0:
+                        self.__sample (phase, n)
+                self.__check (phase)
+        except Exception, e:
+            self.error = e
+        finally:
+            glib.idle_add (self.__main_loop.quit)
+
+
+    ##########################################################################
+    #
+    # Cycles
+    #
+    ##########################################################################
+
+
+    def _cycle_connect (self):
+        """
+        Drop the player off the bus and bring it back.
+        """
+
+        name = panflute.tests.fake.BUS_NAMES[self.__player_name]
+        path = "/connectors/{0}".format (panflute.tests.fake.connector_name (self.__player_name))
+
+        self.__drain ()
+        self.__bus.release_name (name)
+        self.__expect ("disconnected", path)
+        self.__bus.request_name (name, dbus.bus.NAME_FLAG_DO_NOT_QUEUE)
+        self.__expect ("connected", path)
+
+
+    def _cycle_expose (self):
+        """
+        Expose the other player, then the main one again.
+        """
+
+        self.__manager.Expose (panflute.tests.fake.connector_name (self.__other_name))
+        self.__manager.Expose (panflute.tests.fake.connector_name (self.__player_name))
+
+
+    def _cycle_track (self):
+        """
+        Skip to the next track.
+        """
+
+        self.__drain ()
+        self.__in_main (self.__models[self.__player_name].next)
+        self.__expect ("track", None)
+
+
+    ##########################################################################
+    #
+    # Measurement
+    #
+    ##########################################################################
+
+
+    def __sample (self, phase, cycle):
+        """
+        Record what the daemon is holding on to right now.
+        """
+
+        res = self.__stats.Resources ()
+        sample = { "phase":   phase,
+                   "cycle":   cycle,
+                   "time":    time.time (),
+                   "rss":     int (res["rss"]),
+                   "fds":     int (res["fds"]),
+                   "matches": int (res["matches"]),
+                   "objects": dict ((str (name), int (count)) for (name, count) in res["objects"].iteritems ())
+                 }
+
+        # The bus's own count of the daemon's match rules, if it keeps one.
+        try:
+            owner = self.__bus_obj.GetNameOwner ("org.kuliniewicz.Panflute")
+            stats = self.__bus_stats.GetConnectionStats (owner)
+            sample["bus_matches"] = int (stats["MatchRules"])
+        except dbus.DBusException:
+            pass
+
+        self.samples.append (sample)
+
+
+    def __check (self, phase):
+        """
+        Look for anything that grew steadily throughout a phase.
+        """
+
+        samples = [sample for sample in self.samples if sample["phase"] == phase]
+
+        for (measure, slack) in SLACK.iteritems ():
+            series = [sample[measure] for sample in samples if measure in sample]
+            if grew (series, slack):
+                self.leaks.append ((phase, measure, series[0], series[-1]))
+
+        names = set ()
+        for sample in samples:
+            names.update (sample["objects"].keys ())
+        for name in sorted (names):
+            series = [sample["objects"].get (name, 0) for sample in samples]
+            if grew (series, OBJECT_SLACK):
+                self.leaks.append ((phase, name, series[0], series[-1]))
+
+
+    ##########################################################################
+    #
+    # Plumbing
+    #
+    ##########################################################################
+
+
+    def __start_fakes (self):
+        """
+        Start both fake players.  Called in the main thread.
+        """
+
+        for name in [self.__player_name, self.__other_name]:
+            model = panflute.tests.fake.player.Player (latency = self.__latency, event_rate = self.__event_rate)
+            model.repeat = True
+            self.__models[name] = model
+            self.__fakes.append (panflute.tests.fake.create (name, model))
+
+
+    def __in_main (self, func, *args):
+        """
+        Call a function in the main thread and wait for it to finish.
+        """
+
+        done = threading.Event ()
+        outcome = []
+
+        def call ():
+            try:
+                outcome.append ((True, func (*args)))
+            except Exception, e:
+                outcome.append ((False, e))
+            done.set ()
+            return False
+
+        glib.idle_add (call)
+        done.wait ()
+        (ok, value) = outcome[0]
+        if ok:
+            return value
+        else:
+            raise value
+
+
+    def __drain (self):
+        """
+        Forget about any events that have already happened.
+        """
+
+        while not self.__events.empty ():
+            self.__events.get ()
+
+
+    def __expect (self, kind, detail):
+        """
+        Wait for an event of a particular kind, or raise SoakError if it
+        doesn't happen in time.
+        """
+
+        deadline = time.time () + self.TIMEOUT
+        while True:
+            remaining = deadline - time.time ()
+            try:
+                if remaining <= 0:
+                    raise Queue.Empty
+                (event_kind, event_detail) = self.__events.get (True, remaining)
+            except Queue.Empty:
+                raise SoakError ("Timed out waiting for {0} {1}".format (kind, detail or ""))
+            if event_kind == kind and (detail is None or event_detail == detail):
+                return
+
+
+    def __connected_changed_cb (self, connected, path = None):
+        if connected:
+            self.__events.put (("connected", path))
+        else:
+            self.__events.put (("disconnected", path))
+
+
+    def __track_change_cb (self, metadata):
+        self.__events.put (("track", None))
+
+
+##############################################################################
+
+
+def grew (series, slack):
+    """
+    Check whether a series of samples never went down, and went up by more
+    than slack overall.
+    """
+
+    if len (series) < 3:
+        return False
+    for (before, after) in zip (series, series[1:]):
+        if after < before:
+            return False
+    return series[-1] - series[0] > slack
+
+
+class SoakError (Exception):
+    pass
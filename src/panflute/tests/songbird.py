@@ -78,7 +78,7 @@ class Runner (panflute.tests.mpris.Runner):
 
 
     def prepare_single_mpris (self, prefix, user, password):
-        ext_dir = os.path.expanduser ("~/.songbird2/abcdefgh.default/extensions/{0}".format (self.ADDON_UUID))
+        ext_dir = self.expand ("~/.songbird2/abcdefgh.default/extensions/{0}".format (self.ADDON_UUID))
         self.rmdirs ("~/.songbird2")
         self.mkdir (ext_dir)
 
@@ -86,12 +86,12 @@ class Runner (panflute.tests.mpris.Runner):
         xpi_file = zipfile.ZipFile (self.ADDON_PATH, "r")
         xpi_file.extractall (ext_dir)
         xpi_file.close ()
-        with open (os.path.expanduser ("~/.songbird2/abcdefgh.default/extensions.ini"), "w") as ext_ini:
+        with open (self.expand ("~/.songbird2/abcdefgh.default/extensions.ini"), "w") as ext_ini:
             print ("[ExtensionDirs]", file = ext_ini)
             print ("Extension0={0}".format (ext_dir), file = ext_ini)
 
         # Enable the extension and disable Songbird's first-run nags.
-        with open (os.path.expanduser ("~/.songbird2/abcdefgh.default/prefs.js"), "w") as prefs:
+        with open (self.expand ("~/.songbird2/abcdefgh.default/prefs.js"), "w") as prefs:
             print ('user_pref("songbird.firstrun.check.0.3", true);', file = prefs)
             print ('user_pref("songbird.firstrun.do_scan_directory", true);', file = prefs)
             print ('user_pref("songbird.firstrun.scan_directory_path", "{0}");'.format (panflute.defs.PKG_DATA_DIR),
@@ -101,7 +101,7 @@ class Runner (panflute.tests.mpris.Runner):
             print ('user_pref("extensions.enabledItems", "{0}:0.1.10");'.format (self.ADDON_UUID), file = prefs)
 
         # And tell Songbird where this profile can be found.
-        with open (os.path.expanduser ("~/.songbird2/profiles.ini"), "w") as prof_ini:
+        with open (self.expand ("~/.songbird2/profiles.ini"), "w") as prof_ini:
             print ("[General]", file = prof_ini)
             print ("StartWithLastProfile=1", file = prof_ini)
             print ("[Profile0]", file = prof_ini)
@@ -0,0 +1,538 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Signal storm benchmark.
+
+A fake player is made to change tracks, flip between playing and paused,
+change ratings and seek hundreds of times a second, while the daemon passes
+it all along to two clients in this process: a bare D-Bus listener, which
+times how long each new track took to arrive, and the applet's own Player
+object.  The daemon's CPU time and the number of signals it received and
+sent are compared before and after.
+
+With stall, a second fake player is run in a process of its own, taking so
+long to answer that any connector waiting on it in the daemon's main loop
+holds up everything else, including the storm's signals.
+
+Switch instead flips the daemon between two fake players, timing how long
+the one on standby takes to go live.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import panflute.applet.player
+import panflute.mpris
+import panflute.tests.fake
+import panflute.tests.fake.player
+import panflute.tests.testcase
+
+import dbus
+import glib
+import os
+import os.path
+import subprocess
+import sys
+import time
+
+
+KINDS = ["track", "status", "rating", "seek"]
+
+
+class Storm (object):
+    """
+    Runs one storm against the daemon already on the session bus, quitting
+    the main loop once the results are in.
+
+    rates maps each of KINDS to how many times a second to do it.  Once the
+    storm has gone on for duration seconds, stragglers get drain seconds to
+    arrive before anything is counted as lost.
+
+    If stall names another player, a fake of it that waits stall_latency ms
+    before every answer runs alongside for the whole storm.
+    """
+
+    from panflute.util import log
+
+    WARM_UP = 1000
+
+
+    def __init__ (self, main_loop, player_name, rates, duration, drain = 2, latency = 0,
+                  stall = None, stall_latency = 30000):
+        self.__main_loop = main_loop
+        self.__player_name = player_name
+        self.__connector_name = panflute.tests.fake.connector_name (player_name)
+        self.__rates = rates
+        self.__duration = duration
+        self.__drain = drain
+
+        count = int (rates.get ("track", 0) * duration) + 10
+        self.__model = panflute.tests.fake.player.Player (panflute.tests.fake.player.make_tracks (count),
+                                                          latency, 0)
+        self.__model.repeat = True
+        self.__fake = None
+        self.__client = None
+        self.__sources = []
+        self.__stall = stall
+        self.__stall_latency = stall_latency
+        self.__staller = None
+
+        self.results = None
+        self.error = None
+
+        # What was done, and what was heard back.
+        self.__sent = dict ((kind, 0) for kind in KINDS)
+        self.__received = dict ((kind, 0) for kind in KINDS)
+        self.__track_sent = {}
+        self.__track_order = []
+        self.__latencies = []
+        self.__state = None
+        self.__rating = None
+        self.__location = None
+        self.__applet_updates = 0
+
+        self.__bus = dbus.SessionBus ()
+        proxy = self.__bus.get_object ("org.kuliniewicz.Panflute", "/connectors")
+        self.__manager = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Manager")
+        self.__stats = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Stats")
+        proxy = self.__bus.get_object ("org.kuliniewicz.Panflute", "/connectors/{0}".format (self.__connector_name))
+        self.__connector = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Connector")
+        proxy = self.__bus.get_object ("org.freedesktop.DBus", "/org/freedesktop/DBus")
+        bus_obj = dbus.Interface (proxy, "org.freedesktop.DBus")
+        self.__daemon_pid = bus_obj.GetConnectionUnixProcessID ("org.kuliniewicz.Panflute")
+
+        self.__handlers = []
+
+
+    def start (self):
+        """
+        Bring up the fake player and wait for the daemon to connect to it.
+        """
+
+        if self.__stall is not None:
+            self.__start_staller ()
+        self.__handlers.append (self.__connector.connect_to_signal ("ConnectedChanged", self.__connected_changed_cb))
+        self.__fake = panflute.tests.fake.create (self.__player_name, self.__model)
+        if self.__connector.GetConnected ():
+            self.__connected_changed_cb (True)
+
+
+    def __start_staller (self):
+        """
+        Run the stalled fake player in a process of its own, so that its
+        slowness can't hold up this one's main loop too.
+        """
+
+        fake_player = os.path.join (os.path.dirname (os.path.abspath (sys.argv[0])), "panflute-fake-player")
+        self.log.debug ("stalling {0} by {1} ms".format (self.__stall, self.__stall_latency))
+        with open ("/dev/null", "r+") as null:
+            self.__staller = subprocess.Popen ([fake_player, self.__stall,
+                                                "--latency", str (self.__stall_latency), "--play"],
+                                               shell = False, close_fds = True, preexec_fn = os.setsid,
+                                               stdin = null, stdout = null, stderr = null)
+
+
+    def __connected_changed_cb (self, connected):
+        if connected and self.__client is None:
+            self.__manager.Expose (self.__connector_name)
+            self.__model.play ()
+            self.__connect_clients ()
+            glib.timeout_add (self.WARM_UP, self.__begin_cb)
+
+
+    def __connect_clients (self):
+        """
+        Listen to the daemon both directly and through the applet's Player.
+        """
+
+        proxy = self.__bus.get_object ("org.mpris.panflute", "/Player")
+        player = dbus.Interface (proxy, panflute.mpris.INTERFACE)
+        player_ex = dbus.Interface (proxy, "org.kuliniewicz.Panflute")
+        self.__handlers.extend ([
+            player.connect_to_signal ("TrackChange", self.__track_change_cb),
+            player.connect_to_signal ("StatusChange", self.__status_change_cb),
+            player_ex.connect_to_signal ("PositionChange", self.__position_change_cb)
+        ])
+        player_ex.SubscribePosition (0)
+        self.__player_ex = player_ex
+
+        self.__client = panflute.applet.player.Player ()
+        self.__client.connect ("state-changed", self.__applet_state_changed_cb)
+
+
+    ##########################################################################
+    #
+    # The storm itself
+    #
+    ##########################################################################
+
+
+    def __begin_cb (self):
+        """
+        Take the starting measurements and unleash the storm.
+        """
+
+        self.__before = self.__measure ()
+
+        for kind in KINDS:
+            rate = self.__rates.get (kind, 0)
+            if rate > 0:
+                interval = max (1, int (1000 / rate))
+                self.__sources.append (glib.timeout_add (interval, self.__generate_cb, kind))
+
+        glib.timeout_add (int (self.__duration * 1000), self.__end_cb)
+        return False
+
+
+    def __generate_cb (self, kind):
+        """
+        Make the fake player do one more thing.
+        """
+
+        self.__sent[kind] += 1
+        if kind == "track":
+            self.__model.next ()
+            location = self.__model.current ()["uri"]
+            self.__track_sent[location] = time.time ()
+            self.__track_order.append (location)
+        elif kind == "status":
+            self.__model.play_pause ()
+        elif kind == "rating":
+            self.__model.set_rating (self.__sent[kind] % 5 + 1)
+        else:
+            self.__model.seek ((self.__sent[kind] % 100) * 1000)
+        return True
+
+
+    def __end_cb (self):
+        """
+        Stop the storm, and give stragglers a chance to arrive.
+        """
+
+        for source in self.__sources:
+            glib.source_remove (source)
+        self.__sources = []
+        self.__elapsed = time.time () - self.__before["time"]
+        glib.timeout_add (int (self.__drain * 1000), self.__finish_cb)
+        return False
+
+
+    def __finish_cb (self):
+        """
+        Work out the results and shut everything down.
+        """
+
+        try:
+            self.results = self.__summarize (self.__measure ())
+        except Exception, e:
+            self.error = e
+
+        for handler in self.__handlers:
+            handler.remove ()
+        self.__handlers = []
+        self.__player_ex.UnsubscribePosition ()
+        self.__client.shutdown ()
+        self.__model.stop ()
+        if self.__staller is not None:
+            self.__staller.terminate ()
+            self.__staller.wait ()
+            self.__staller = None
+        self.__main_loop.quit ()
+        return False
+
+
+    ##########################################################################
+    #
+    # Listening
+    #
+    ##########################################################################
+
+
+    def __track_change_cb (self, metadata):
+        now = time.time ()
+        location = metadata.get ("location", None)
+        if location != self.__location:
+            self.__location = location
+            self.__rating = metadata.get ("rating", None)
+            self.__received["track"] += 1
+            sent = self.__track_sent.pop (location, None)
+            if sent is not None:
+                self.__latencies.append ((now - sent) * 1000)
+        elif metadata.get ("rating", None) != self.__rating:
+            self.__rating = metadata.get ("rating", None)
+            self.__received["rating"] += 1
+
+
+    def __status_change_cb (self, status):
+        state = status[panflute.mpris.STATUS_STATE]
+        if state != self.__state:
+            self.__state = state
+            self.__received["status"] += 1
+
+
+    def __position_change_cb (self, position):
+        self.__received["seek"] += 1
+
+
+    def __applet_state_changed_cb (self, player, changed):
+        self.__applet_updates += 1
+
+
+    ##########################################################################
+    #
+    # Measurement
+    #
+    ##########################################################################
+
+
+    def __measure (self):
+        """
+        Read the daemon's CPU time so far and its signal counters.
+        """
+
+        with open ("/proc/{0}/stat".format (self.__daemon_pid)) as stat:
+            # The command name is in parentheses and may contain spaces.
+            fields = stat.read ().rsplit (")", 1)[1].split ()
+        ticks = int (fields[11]) + int (fields[12])
+
+        counters = self.__stats.Snapshot ()[self.__connector_name]
+        return { "time":     time.time (),
+                 "cpu":      ticks / os.sysconf ("SC_CLK_TCK"),
+                 "received": sum (counters["signals_received"].values ()),
+                 "emitted":  sum (counters["signals_emitted"].values ())
+               }
+
+
+    def __summarize (self, after):
+        """
+        Turn the raw counts into the benchmark's results.
+        """
+
+        before = self.__before
+        elapsed = self.__elapsed
+
+        # A track that never arrived was coalesced if a later one did, or
+        # dropped if nothing after it made it through either.
+        coalesced = 0
+        dropped = 0
+        later_arrived = False
+        for location in reversed (self.__track_order):
+            if location not in self.__track_sent:
+                later_arrived = True
+            elif later_arrived:
+                coalesced += 1
+            else:
+                dropped += 1
+
+        latencies = sorted (self.__latencies)
+        results = {
+            "seconds":        elapsed,
+            "daemon_cpu":     (after["cpu"] - before["cpu"]) / elapsed,
+            "received_rate":  (after["received"] - before["received"]) / elapsed,
+            "emitted_rate":   (after["emitted"] - before["emitted"]) / elapsed,
+            "sent":           dict (self.__sent),
+            "heard":          dict (self.__received),
+            "applet_updates": self.__applet_updates,
+            "coalesced":      coalesced,
+            "dropped":        dropped,
+            "stalled":        self.__stall
+        }
+        if len (latencies) > 0:
+            for p in [50, 90, 99]:
+                results["latency_p{0}".format (p)] = panflute.tests.testcase.percentile (latencies, p)
+            results["latency_max"] = latencies[-1]
+        return results
+
+
+##############################################################################
+
+
+class Switch (object):
+    """
+    Switches the daemon back and forth between two fake players already
+    warmed up on standby, timing how long each takes to go live.
+
+    Each switch asks the Manager to expose the other player and, right
+    behind it, moves that player on to its next track.  The time from the
+    request to the daemon's TrackChange for that track on /Player is how
+    long the switch took.  A switch that hasn't been heard from within
+    timeout seconds counts as missed.
+    """
+
+    from panflute.util import log
+
+    WARM_UP = 1000
+
+
+    def __init__ (self, main_loop, player_names, count, interval = 0.5, timeout = 5):
+        self.__main_loop = main_loop
+        self.__player_names = player_names
+        self.__connector_names = [panflute.tests.fake.connector_name (name) for name in player_names]
+        self.__count = count
+        self.__interval = interval
+        self.__timeout = timeout
+
+        self.__models = []
+        for name in player_names:
+            model = panflute.tests.fake.player.Player (panflute.tests.fake.player.make_tracks (count + 10, directory = name),
+                                                       0, 0)
+            model.repeat = True
+            self.__models.append (model)
+        self.__fakes = []
+        self.__connected = [False] * len (player_names)
+        self.__started = False
+
+        self.results = None
+        self.error = None
+
+        self.__live = 0
+        self.__sent = None
+        self.__expected = None
+        self.__timeout_source = None
+        self.__latencies = []
+        self.__missed = 0
+
+        self.__bus = dbus.SessionBus ()
+        proxy = self.__bus.get_object ("org.kuliniewicz.Panflute", "/connectors")
+        self.__manager = dbus.Interface (proxy, "org.kuliniewicz.Panflute.Manager")
+        self.__daemon = self.__bus.get_name_owner ("org.kuliniewicz.Panflute")
+        self.__connectors = []
+        for name in self.__connector_names:
+            proxy = self.__bus.get_object ("org.kuliniewicz.Panflute", "/connectors/{0}".format (name))
+            self.__connectors.append (dbus.Interface (proxy, "org.kuliniewicz.Panflute.Connector"))
+
+        self.__handlers = []
+
+
+    def start (self):
+        """
+        Bring up both fake players and wait for the daemon to connect to
+        them.
+        """
+
+        for which, connector in enumerate (self.__connectors):
+            self.__handlers.append (connector.connect_to_signal ("ConnectedChanged",
+                                                                 lambda connected, which = which:
+                                                                     self.__connected_changed_cb (connected, which)))
+            self.__fakes.append (panflute.tests.fake.create (self.__player_names[which], self.__models[which]))
+        for which, connector in enumerate (self.__connectors):
+            if connector.GetConnected ():
+                self.__connected_changed_cb (True, which)
+
+
+    def __connected_changed_cb (self, connected, which):
+        self.__connected[which] = connected
+        if all (self.__connected) and not self.__started:
+            self.__started = True
+            for model in self.__models:
+                model.play ()
+            self.__manager.Expose (self.__connector_names[self.__live])
+
+            # The fakes' own /Player objects use the same interface, so only
+            # listen to the daemon's.
+            self.__handlers.append (self.__bus.add_signal_receiver (self.__track_change_cb,
+                                                                    signal_name = "TrackChange",
+                                                                    dbus_interface = panflute.mpris.INTERFACE,
+                                                                    path = "/Player",
+                                                                    sender_keyword = "sender"))
+            glib.timeout_add (self.WARM_UP, self.__switch_cb)
+
+
+    ##########################################################################
+    #
+    # Switching
+    #
+    ##########################################################################
+
+
+    def __switch_cb (self):
+        """
+        Expose the player on standby and give it something to say.
+        """
+
+        self.__live = 1 - self.__live
+        model = self.__models[self.__live]
+
+        self.__sent = time.time ()
+        self.__manager.Expose (self.__connector_names[self.__live],
+                               reply_handler = lambda: None,
+                               error_handler = self.__expose_error_cb)
+        model.next ()
+        self.__expected = model.current ()["uri"]
+        self.__timeout_source = glib.timeout_add (int (self.__timeout * 1000), self.__timeout_cb)
+        return False
+
+
+    def __track_change_cb (self, metadata, sender = None):
+        if sender != self.__daemon or self.__expected is None:
+            return
+        if metadata.get ("location", None) == self.__expected:
+            self.__latencies.append ((time.time () - self.__sent) * 1000)
+            glib.source_remove (self.__timeout_source)
+            self.__next ()
+
+
+    def __timeout_cb (self):
+        self.log.warning ("no TrackChange from {0} after switching to it".format (
+            self.__player_names[self.__live]))
+        self.__missed += 1
+        self.__next ()
+        return False
+
+
+    def __expose_error_cb (self, error):
+        self.error = error
+        if self.__timeout_source is not None:
+            glib.source_remove (self.__timeout_source)
+        self.__finish ()
+
+
+    def __next (self):
+        """
+        Go on to the next switch after a breather, or stop if that was the
+        last one.
+        """
+
+        self.__expected = None
+        self.__timeout_source = None
+        if len (self.__latencies) + self.__missed < self.__count:
+            glib.timeout_add (int (self.__interval * 1000), self.__switch_cb)
+        else:
+            self.__finish ()
+
+
+    def __finish (self):
+        """
+        Work out the results and shut everything down.
+        """
+
+        latencies = sorted (self.__latencies)
+        self.results = { "switches": len (latencies) + self.__missed,
+                         "missed":   self.__missed }
+        if len (latencies) > 0:
+            for p in [50, 90, 99]:
+                self.results["latency_p{0}".format (p)] = panflute.tests.testcase.percentile (latencies, p)
+            self.results["latency_max"] = latencies[-1]
+
+        for handler in self.__handlers:
+            handler.remove ()
+        self.__handlers = []
+        for model in self.__models:
+            model.stop ()
+        self.__main_loop.quit ()
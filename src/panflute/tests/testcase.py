@@ -21,10 +21,12 @@
 Collection of test cases to run against each player.
 """
 
-from __future__ import absolute_import, print_function
+from __future__ import absolute_import, division, print_function
 
 import panflute.mpris
 
+import math
+import os
 import Queue
 import time
 
@@ -37,6 +39,9 @@ class TestCase (object):
     def __init__ (self, prereqs):
         self.prereqs = prereqs
 
+        # Numbers worth keeping along with the result, by name.
+        self.measurements = {}
+
 
     def should_be_run (self, player_ex):
         """
@@ -283,12 +288,13 @@ class Elapsed (TestCase):
     """
 
     def __init__ (self):
-        TestCase.__init__ (self, ["Play", "PositionGet", "PositionChange"])
+        TestCase.__init__ (self, ["Play", "PositionGet", "PositionChange", "SubscribePosition"])
         self.__queue = Queue.Queue ()
 
 
     def test (self, player, player_ex):
         handler = player_ex.connect_to_signal ("PositionChange", self.__position_change_cb)
+        player_ex.SubscribePosition (1000)
 
         try:
             player.Play ()
@@ -308,6 +314,7 @@ class Elapsed (TestCase):
             direct1 = player.PositionGet ()
             self.assert_greater (direct1, direct0)
         finally:
+            player_ex.UnsubscribePosition ()
             handler.remove ()
 
 
@@ -436,6 +443,292 @@ class RatingScaleSet (TestCase):
         self.assert_greater_or_equal (info["panflute rating scale"], info["rating"])
 
 
+class Snapshot (TestCase):
+    """
+    The snapshot of the player's state should agree with the values fetched
+    individually, and its version should advance as the state changes.
+    """
+
+    def __init__ (self):
+        TestCase.__init__ (self, ["GetSnapshot", "GetCaps", "GetStatus", "GetMetadata", "Play", "Pause"])
+
+
+    def test (self, player, player_ex):
+        snapshot = player_ex.GetSnapshot ()
+        self.assert_equal (snapshot["caps"], player.GetCaps ())
+        self.assert_equal (tuple (snapshot["status"]), tuple (player.GetStatus ()))
+        self.assert_equal (snapshot["metadata"].get ("location", None),
+                           player.GetMetadata ().get ("location", None))
+        self.assert_equal (sorted (snapshot["features"]), sorted (player_ex.GetFeatures ()))
+
+        player.Play ()
+        time.sleep (1)
+        player.Pause ()
+        time.sleep (1)
+
+        later = player_ex.GetSnapshot ()
+        self.assert_greater (later["version"], snapshot["version"])
+        self.assert_greater_or_equal (later["timestamp"], snapshot["timestamp"])
+
+
+class Latency (TestCase):
+    """
+    Base for test cases that time how long it takes for the effect of a
+    command to be signalled back through the daemon.
+
+    Each of SAMPLES round trips is timed, and the test fails if the
+    BUDGET_PERCENTILE of them took longer than BUDGET ms.  The budget can
+    be overridden for every latency test at once by setting
+    PANFLUTE_LATENCY_BUDGET to a number of ms.
+    """
+
+    SAMPLES = 10
+    PERCENTILES = [50, 90, 99]
+    BUDGET_PERCENTILE = 90
+    BUDGET = 1000
+    TIMEOUT = 3
+
+
+    def __init__ (self, prereqs):
+        TestCase.__init__ (self, prereqs)
+        self.__queue = Queue.Queue ()
+
+
+    def test (self, player, player_ex):
+        self.measurements = {}
+        samples = []
+
+        handler = self.connect (player, player_ex, self.__signal_cb)
+        try:
+            self.prepare (player, player_ex)
+            for n in range (self.SAMPLES):
+                samples.append (self.sample (player, player_ex, n))
+        finally:
+            handler.remove ()
+            self.finish (player, player_ex)
+
+        samples.sort ()
+        for p in self.PERCENTILES:
+            self.measurements["p{0}".format (p)] = percentile (samples, p)
+        self.measurements["mean"] = sum (samples) / len (samples)
+        self.measurements["max"] = samples[-1]
+
+        budget = float (os.getenv ("PANFLUTE_LATENCY_BUDGET", self.BUDGET))
+        self.measurements["budget"] = budget
+
+        tested = percentile (samples, self.BUDGET_PERCENTILE)
+        if tested > budget:
+            raise AssertionError ("p{0} latency of {1:.1f} ms exceeds budget of {2:.1f} ms".format (
+                self.BUDGET_PERCENTILE, tested, budget))
+
+
+    def connect (self, player, player_ex, callback):
+        """
+        Connect the callback to the signal being timed, returning the match.
+        """
+
+        raise NotImplementedError
+
+
+    def prepare (self, player, player_ex):
+        """
+        Get the player ready for the first sample.
+        """
+
+        pass
+
+
+    def sample (self, player, player_ex, n):
+        """
+        Time the nth round trip, returning the latency in ms.
+        """
+
+        raise NotImplementedError
+
+
+    def finish (self, player, player_ex):
+        """
+        Undo anything done by prepare.
+        """
+
+        pass
+
+
+    def time_command (self, command, predicate, *args):
+        """
+        Send a command, then wait for a signal whose arguments satisfy the
+        predicate, returning how long that took in ms.
+        """
+
+        # Anything that arrived before now isn't a reaction to this command.
+        while not self.__queue.empty ():
+            self.__queue.get ()
+
+        start = time.time ()
+        command (*args)
+        while True:
+            try:
+                (arrived, signal_args) = self.__queue.get (True, self.TIMEOUT)
+            except Queue.Empty:
+                raise AssertionError ("no response signal within {0} s".format (self.TIMEOUT))
+            if predicate (*signal_args):
+                return (arrived - start) * 1000
+
+
+    def __signal_cb (self, *args):
+        """
+        Pass the signal and when it arrived to the test thread.
+        """
+
+        self.__queue.put ((time.time (), args))
+
+
+class StatusLatency (Latency):
+    """
+    Time from Play or Pause until the new state is signalled.
+    """
+
+    BUDGET = 500
+
+
+    def __init__ (self):
+        Latency.__init__ (self, ["GetStatus", "StatusChange", "Play", "Pause"])
+        self.__playing = False
+
+
+    def connect (self, player, player_ex, callback):
+        return player.connect_to_signal ("StatusChange", callback)
+
+
+    def prepare (self, player, player_ex):
+        status = player.GetStatus ()
+        self.__playing = (status[panflute.mpris.STATUS_STATE] == panflute.mpris.STATE_PLAYING)
+
+
+    def sample (self, player, player_ex, n):
+        if self.__playing:
+            wanted = panflute.mpris.STATE_PAUSED
+            command = player.Pause
+        else:
+            wanted = panflute.mpris.STATE_PLAYING
+            command = player.Play if n == 0 else player.Pause
+
+        latency = self.time_command (command, lambda status: status[panflute.mpris.STATUS_STATE] == wanted)
+        self.__playing = not self.__playing
+        return latency
+
+
+class TrackLatency (Latency):
+    """
+    Time from Next or Prev until the new song is signalled.
+    """
+
+    def __init__ (self):
+        Latency.__init__ (self, ["GetMetadata", "TrackChange", "Play", "Next", "Prev"])
+        self.__location = None
+
+
+    def connect (self, player, player_ex, callback):
+        return player.connect_to_signal ("TrackChange", callback)
+
+
+    def prepare (self, player, player_ex):
+        player.Play ()
+        self.__location = player.GetMetadata ().get ("location", None)
+
+
+    def sample (self, player, player_ex, n):
+        # Players temporarily reporting no song at all, or sending the same
+        # song more than once, are ignored as in Metadata.
+
+        def changed (metadata):
+            location = metadata.get ("location", None)
+            if location is not None and location != self.__location:
+                self.__location = location
+                return True
+            else:
+                return False
+
+        if n % 2 == 0:
+            return self.time_command (player.Next, changed)
+        else:
+            return self.time_command (player.Prev, changed)
+
+
+class PositionLatency (Latency):
+    """
+    Time from PositionSet until the new position is signalled to a client
+    subscribed to PositionChange.
+    """
+
+    BUDGET = 1500
+    TARGETS = [7000, 2000]
+    TOLERANCE = 1500
+
+
+    def __init__ (self):
+        Latency.__init__ (self, ["Play", "PositionSet", "PositionChange", "SubscribePosition"])
+
+
+    def connect (self, player, player_ex, callback):
+        return player_ex.connect_to_signal ("PositionChange", callback)
+
+
+    def prepare (self, player, player_ex):
+        player_ex.SubscribePosition (1000)
+        player.Play ()
+
+
+    def sample (self, player, player_ex, n):
+        target = self.TARGETS[n % len (self.TARGETS)]
+        return self.time_command (player.PositionSet,
+                                  lambda position: abs (position - target) < self.TOLERANCE,
+                                  target)
+
+
+    def finish (self, player, player_ex):
+        player_ex.UnsubscribePosition ()
+
+
+class RatingLatency (Latency):
+    """
+    Time from setting the rating until the new rating is signalled.  Each
+    sample picks a rating different from the current one, so that setting
+    it always causes a change.
+    """
+
+    def __init__ (self):
+        Latency.__init__ (self, ["Play", "GetMetadata", "TrackChange", "SetMetadata:rating"])
+        self.__rating = 0
+
+
+    def connect (self, player, player_ex, callback):
+        return player.connect_to_signal ("TrackChange", callback)
+
+
+    def prepare (self, player, player_ex):
+        player.Play ()
+        self.__rating = int (player.GetMetadata ().get ("rating", 0))
+
+
+    def sample (self, player, player_ex, n):
+        rating = (self.__rating % 5) + 1
+        latency = self.time_command (player_ex.SetMetadata,
+                                     lambda metadata: metadata.get ("rating", None) == rating,
+                                     "rating", rating)
+        self.__rating = rating
+        return latency
+
+
+def percentile (samples, p):
+    """
+    Find the pth percentile of a sorted list of samples, by nearest rank.
+    """
+
+    rank = max (0, int (math.ceil (p / 100 * len (samples))) - 1)
+    return samples[rank]
+
+
 ALL_TESTS = [
     Volume (),
     State (),
@@ -444,5 +737,10 @@ ALL_TESTS = [
     Seek (),
     SetRating (),
     RatingScale (),
-    RatingScaleSet ()
+    RatingScaleSet (),
+    Snapshot (),
+    StatusLatency (),
+    TrackLatency (),
+    PositionLatency (),
+    RatingLatency ()
 ]
@@ -31,6 +31,7 @@ import panflute.tests.clementine
 import panflute.tests.decibel
 import panflute.tests.exaile
 import panflute.tests.guayadeque
+import panflute.tests.isolated
 import panflute.tests.listen
 import panflute.tests.muine
 import panflute.tests.pithos
@@ -46,9 +47,12 @@ import dbus
 from   gettext import gettext as _
 import gobject
 import gtk
+import json
+import multiprocessing
 import os.path
 import sys
 import threading
+import time
 import traceback
 
 
@@ -65,12 +69,18 @@ class Tester (object):
     COL_COMMENT  = 5
     COL_USER     = 6
     COL_PASSWORD = 7
+    COL_MEASUREMENTS = 8
 
     MUTATORS = ["panflute_prefix", "run", "clear", "add", "remove", "player", "version", "prefix", "user", "password"]
     USER_DATA_DIR = os.getenv ("XDG_DATA_HOME", os.path.expanduser ("~/.local/share"))
     SAVE_DIR = os.path.join (USER_DATA_DIR, "panflute")
     SAVE_FILE = os.path.join (SAVE_DIR, "tester.dat")
 
+    # Each launcher gets its own session bus, so configurations of different
+    # players can be tested at once.  Two configurations of the same player
+    # still have to take turns, since they'd fight over its files and ports.
+    MAX_RUNNING = multiprocessing.cpu_count ()
+
     # Commented-out ones get loaded later on, since importing
     # their modules could fail due to missing dependencies
     PLAYERS = {
@@ -81,6 +91,7 @@ class Tester (object):
         "Decibel": panflute.tests.decibel,
         "Exaile": panflute.tests.exaile,
         "Guayadeque": panflute.tests.guayadeque,
+        "Isolated fake": panflute.tests.isolated,
         "Listen": panflute.tests.listen,
         # "MOC": panflute.tests.moc,
         # "MPD": panflute.tests.mpd,
@@ -103,8 +114,11 @@ class Tester (object):
 
         status = builder.get_object ("status")
         self.__progress_id = status.get_context_id ("Test progress")
+        self.__timing_id = status.get_context_id ("Test timing")
 
         self.__launchers = []
+        self.__running = []
+        self.__started = None
 
         self.__initialize_player_list ()
         self.__initialize_test_tree ()
@@ -146,18 +160,22 @@ class Tester (object):
         """
 
         player = self.__test_store.append (None,
-                (config.name, config.version, config.prefix, "", "", config.comment, config.user, config.password))
+                (config.name, config.version, config.prefix, "", "", config.comment, config.user, config.password, ""))
         for test in panflute.tests.testcase.ALL_TESTS:
             testname = test.__class__.__name__
             if testname in config.results:
                 result = config.results[testname].result
                 detail = config.results[testname].detail
                 comment = config.results[testname].comment
+                # Results saved before measurements were kept don't have any.
+                measurements = getattr (config.results[testname], "measurements", {})
             else:
                 result = ""
                 detail = ""
                 comment = ""
-            self.__test_store.append (player, (testname, "", "", result, detail, comment, "", ""))
+                measurements = {}
+            self.__test_store.append (player, (testname, "", "", result, detail, comment, "", "",
+                                               json.dumps (measurements)))
         return player
 
 
@@ -177,7 +195,8 @@ class Tester (object):
                 result = self.__test_store.get_value (child, self.COL_RESULT)
                 if result != "" and (test_sel.iter_is_selected (child) or test_sel.iter_is_selected (parent) or
                                      test_sel.count_selected_rows () == 0):
-                    self.__test_store.set (child, self.COL_RESULT, "", self.COL_DETAIL, "")
+                    self.__test_store.set (child, self.COL_RESULT, "", self.COL_DETAIL, "",
+                                           self.COL_MEASUREMENTS, json.dumps ({}))
                     changed_something = True
                 child = self.__test_store.iter_next (child)
             if changed_something:
@@ -214,7 +233,8 @@ class Tester (object):
                 self.__queue_launcher (name, parent, prefix, user, password, test_names)
             parent = self.__test_store.iter_next (parent)
 
-        self.start_next_launcher ()
+        self.__started = time.time ()
+        self.__start_launchers ()
 
 
     def __queue_launcher (self, name, parent, prefix, user, password, test_names):
@@ -236,22 +256,21 @@ class Tester (object):
 
         player_name, player_version = self.__test_store.get (parent, self.COL_NAME, self.COL_VERSION)
         status = self.__builder.get_object ("status")
+        status.pop (self.__progress_id)
         status.push (self.__progress_id, "Testing {0} {1}: {2}".format (player_name, player_version, test_name))
 
 
-    def process_result (self, parent, test_name, result, detail):
+    def process_result (self, parent, test_name, result, detail, measurements):
         """
         Display a test result.
         """
 
-        status = self.__builder.get_object ("status")
-        status.pop (self.__progress_id)
-
         child = self.__test_store.iter_children (parent)
         while child is not None:
             name = self.__test_store.get_value (child, self.COL_NAME)
             if name == test_name:
-                self.__test_store.set (child, self.COL_RESULT, result, self.COL_DETAIL, detail)
+                self.__test_store.set (child, self.COL_RESULT, result, self.COL_DETAIL, detail,
+                                       self.COL_MEASUREMENTS, json.dumps (measurements))
                 break
             child = self.__test_store.iter_next (child)
         self.__summarize_parent (parent)
@@ -276,32 +295,65 @@ class Tester (object):
         self.__test_store.set (parent, self.COL_RESULT, overall)
 
 
-    def start_next_launcher (self):
+    def __start_launchers (self):
         """
-        Start the next launcher in the queue, or un-freeze the GUI if none are
-        left.
+        Start as many queued launchers as are allowed to run at once, or
+        un-freeze the GUI if none are left.
         """
 
-        if len (self.__launchers) > 0:
-            launcher = self.__launchers[0]
-            self.__launchers = self.__launchers[1:]
-            launcher.start ()
-        else:
+        busy = set (launcher.player_name for launcher in self.__running)
+        for launcher in list (self.__launchers):
+            if len (self.__running) >= self.MAX_RUNNING:
+                break
+            if launcher.player_name not in busy:
+                self.__launchers.remove (launcher)
+                self.__running.append (launcher)
+                busy.add (launcher.player_name)
+                launcher.start ()
+
+        if len (self.__running) == 0:
+            if self.__started is not None:
+                self.__report_time (time.time () - self.__started)
+                self.__started = None
             for name in self.MUTATORS:
                 self.__builder.get_object (name).props.sensitive = True
 
 
+    def launcher_finished (self, launcher):
+        """
+        Note that a launcher's subprocess is done, and start the next ones.
+        """
+
+        status = self.__builder.get_object ("status")
+        status.pop (self.__timing_id)
+        status.push (self.__timing_id, _("Finished {player} in {seconds:.1f} s").format (
+            player = launcher.player_name, seconds = launcher.finished - launcher.started))
+
+        self.__running.remove (launcher)
+        self.__start_launchers ()
+
+
+    def __report_time (self, elapsed):
+        """
+        Report how long the whole run took.
+        """
+
+        status = self.__builder.get_object ("status")
+        status.pop (self.__progress_id)
+        status.pop (self.__timing_id)
+        status.push (self.__timing_id, _("Finished testing in {seconds:.1f} s").format (seconds = elapsed))
+
+
     def abort_testing (self):
         """
         Give up on testing, on account of a fatal error in the subprocess.
+        Configurations already being tested are left to finish.
         """
 
         status = self.__builder.get_object ("status")
         status.pop (self.__progress_id)
 
         self.__launchers = []
-        for name in self.MUTATORS:
-            self.__builder.get_object (name).props.sensitive = True
 
         parent = self.__builder.get_object ("main_window")
         dialog = gtk.MessageDialog (parent = parent,
@@ -327,7 +379,8 @@ class Tester (object):
                         self.COL_NAME, self.COL_VERSION, self.COL_PREFIX, self.COL_USER, self.COL_PASSWORD)
                 self.__show_properties (name, version, prefix, user, password)
             else:
-                self.__show_detail (model.get_value (iter, self.COL_DETAIL))
+                detail, measurements = model.get (iter, self.COL_DETAIL, self.COL_MEASUREMENTS)
+                self.__show_detail (detail, json.loads (measurements or "{}"))
         else:
             self.__show_detail ("")
 
@@ -363,15 +416,18 @@ class Tester (object):
         notebook.set_current_page (1)
 
 
-    def __show_detail (self, detail):
+    def __show_detail (self, detail, measurements = {}):
         """
-        Show detail text for the item.
+        Show detail text for the item, followed by any measurements taken.
         """
 
         buffer = self.__builder.get_object ("detail_buffer")
         notebook = self.__builder.get_object ("notebook")
 
-        buffer.set_text (detail)
+        lines = ["{0}: {1:.1f}".format (name, value) for (name, value) in sorted (measurements.iteritems ())]
+        if detail != "" and len (lines) > 0:
+            lines.insert (0, "")
+        buffer.set_text (detail + "\n".join (lines))
         notebook.set_current_page (0)
 
 
@@ -539,9 +595,9 @@ class Tester (object):
             config = SavedConfig (name, version, prefix, comment, user, password)
             child = self.__test_store.iter_children (iter)
             while child is not None:
-                name, result, detail, comment = self.__test_store.get (child,
-                        self.COL_NAME, self.COL_RESULT, self.COL_DETAIL, self.COL_COMMENT)
-                res = SavedResult (name, result, detail, comment)
+                name, result, detail, comment, measurements = self.__test_store.get (child,
+                        self.COL_NAME, self.COL_RESULT, self.COL_DETAIL, self.COL_COMMENT, self.COL_MEASUREMENTS)
+                res = SavedResult (name, result, detail, comment, json.loads (measurements or "{}"))
                 config.add_result (res)
                 child = self.__test_store.iter_next (child)
             configs.append (config)
@@ -655,11 +711,15 @@ class SavedResult (object):
     Struct for holding the persistent information about an individual test.
     """
 
-    def __init__ (self, name, result, detail, comment):
+    def __init__ (self, name, result, detail, comment, measurements = None):
         self.name = name
         self.result = result
         self.detail = detail
         self.comment = comment
+        if measurements is not None:
+            self.measurements = measurements
+        else:
+            self.measurements = {}
 
 
 def create_tester ():
@@ -52,7 +52,7 @@ class Runner (panflute.tests.mpris.Runner):
         self.rmdirs ("~/.local/share/vlc")
         self.mkdir ("~/.config/vlc")
 
-        with open (os.path.expanduser ("~/.config/vlc/vlcrc"), "w") as rc:
+        with open (self.expand ("~/.config/vlc/vlcrc"), "w") as rc:
             # Turn off "connect to Internet?" prompt at startup
             print ("[qt4]", file = rc)
             print ("qt-privacy-ask=0", file = rc)
@@ -0,0 +1,640 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+
+"""
+Opt-in tracing, written out as timelines that chrome://tracing (or any
+other viewer of the Chrome trace event format) can display.
+
+The startup tracer times each phase of getting the daemon or applet going,
+and each module imported along the way, in both wall and CPU time.  It's
+enabled by setting PANFLUTE_TRACE_STARTUP in the environment, or for the
+daemon by passing --trace-startup, and writes its timeline to
+<process>-startup.json in Panflute's XDG data directory a few seconds
+after the main loop starts.
+
+The event tracer follows a command from the applet through the daemon and
+the player and back again.  It's enabled by setting PANFLUTE_TRACE in the
+environment of both processes.  The applet tags each command it sends with
+a correlation id, the daemon tags the signals that result with the same
+id, and each process notes when the event passed through it.  Each process
+writes its own file to the traces directory, and merge combines them into
+one timeline, since timestamps come from a clock every process shares.
+"""
+
+from __future__ import absolute_import, division
+
+import panflute.util
+
+import __builtin__
+import contextlib
+import ctypes
+import ctypes.util
+import json
+import os
+import os.path
+import sys
+import thread
+import threading
+import time
+
+
+STARTUP_ENV = "PANFLUTE_TRACE_STARTUP"
+TRACE_ENV = "PANFLUTE_TRACE"
+
+# How long after the main loop starts to keep recording, in ms, so that
+# the replies to the first D-Bus calls make it into the timeline.
+STARTUP_SETTLE = 3000
+
+# How often to write out traced events, in ms.
+FLUSH_INTERVAL = 1000
+
+# How long a correlation id is waited on for the event it's tagging, in
+# seconds, before it's given up on.
+PENDING_TIMEOUT = 5
+
+
+##############################################################################
+
+
+class _timespec (ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+CLOCK_MONOTONIC = 1
+
+try:
+    _clock_gettime = ctypes.CDLL (ctypes.util.find_library ("rt") or "libc.so.6",
+                                  use_errno = True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER (_timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+
+def monotonic ():
+    """
+    Get the time in seconds from a clock that never goes backwards and is
+    shared by every process on the machine, falling back to the wall clock
+    if there's no such thing.
+    """
+
+    if _clock_gettime is not None:
+        now = _timespec ()
+        if _clock_gettime (CLOCK_MONOTONIC, ctypes.byref (now)) == 0:
+            return now.tv_sec + now.tv_nsec * 1e-9
+    return time.time ()
+
+
+##############################################################################
+
+
+class Timeline (object):
+    """
+    The events recorded by one process, in the Chrome trace event format.
+    Times are in seconds from monotonic, and converted to microseconds when
+    written out.
+    """
+
+    def __init__ (self, process_name):
+        self.pid = os.getpid ()
+        self.events = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                        "args": {"name": "{0} ({1})".format (process_name, self.pid)}}]
+
+
+    def complete (self, name, category, start, duration, args = None):
+        """
+        Record something that took duration seconds, starting at start.
+        """
+
+        event = {"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": thread.get_ident (),
+                 "ts": start * 1e6, "dur": duration * 1e6}
+        if args is not None:
+            event["args"] = args
+        self.events.append (event)
+
+
+    def instant (self, name, category, when = None, args = None):
+        """
+        Record something that happened at a single moment, by default now.
+        """
+
+        if when is None:
+            when = monotonic ()
+        event = {"name": name, "cat": category, "ph": "i", "s": "p", "pid": self.pid,
+                 "tid": thread.get_ident (), "ts": when * 1e6}
+        if args is not None:
+            event["args"] = args
+        self.events.append (event)
+
+
+    def take (self):
+        """
+        Remove and return every event recorded so far.
+        """
+
+        (events, self.events) = (self.events, [])
+        return events
+
+
+    def write (self, filename):
+        """
+        Write the timeline to a file as JSON.
+        """
+
+        with open (filename, "w") as output:
+            json.dump ({"traceEvents": self.events, "displayTimeUnit": "ms"}, output)
+
+
+##############################################################################
+
+
+class StartupTracer (object):
+    """
+    Records the phases of startup and the modules imported during it.
+
+    A module import is only recorded if it actually loaded something new,
+    so repeated imports of the same module don't clutter the timeline.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, process_name):
+        self.process_name = process_name
+        self.timeline = Timeline (process_name)
+        self.__original_import = None
+
+
+    def install (self):
+        """
+        Start timing module imports.
+        """
+
+        if self.__original_import is None:
+            self.__original_import = __builtin__.__import__
+            __builtin__.__import__ = self.__import
+
+
+    def uninstall (self):
+        """
+        Stop timing module imports.
+        """
+
+        if self.__original_import is not None:
+            __builtin__.__import__ = self.__original_import
+            self.__original_import = None
+
+
+    @contextlib.contextmanager
+    def phase (self, name):
+        """
+        Time the body of a with statement as one phase of startup.
+        """
+
+        start = monotonic ()
+        cpu = time.clock ()
+        try:
+            yield
+        finally:
+            self.timeline.complete (name, "phase", start, monotonic () - start,
+                                    {"cpu_ms": (time.clock () - cpu) * 1000})
+
+
+    def mark (self, name):
+        """
+        Note something that happened during startup.
+        """
+
+        self.timeline.instant (name, "mark")
+
+
+    def write (self):
+        """
+        Write the timeline out to Panflute's data directory, returning the
+        name of the file.
+        """
+
+        filename = os.path.join (panflute.util.get_xdg_data_home_directory (),
+                                 "{0}-startup.json".format (self.process_name))
+        self.timeline.write (filename)
+        return filename
+
+
+    def __import (self, name, globals = None, locals = None, fromlist = None, level = -1):
+        """
+        Stand-in for __import__ that times anything new that gets loaded.
+        """
+
+        loaded = len (sys.modules)
+        start = monotonic ()
+        cpu = time.clock ()
+        try:
+            return self.__original_import (name, globals, locals, fromlist, level)
+        finally:
+            if len (sys.modules) != loaded:
+                self.timeline.complete (name, "import", start, monotonic () - start,
+                                        {"cpu_ms": (time.clock () - cpu) * 1000})
+
+
+##############################################################################
+
+
+class EventTracer (object):
+    """
+    Records the hops events make through this process, appending them to
+    <process>-<pid>.json in the traces directory every FLUSH_INTERVAL ms.
+
+    The file is in the JSON array form of the trace event format, which
+    viewers accept without the closing bracket, so it can simply be added
+    to for as long as the process runs.
+    """
+
+    from panflute.util import log
+
+
+    def __init__ (self, process_name):
+        self.process_name = process_name
+        self.timeline = Timeline (process_name)
+        self.filename = os.path.join (trace_directory (),
+                                      "{0}-{1}.json".format (process_name, self.timeline.pid))
+        self.__lock = threading.Lock ()
+        self.__count = 0
+        self.__pending = None
+        self.__pending_since = None
+
+        with open (self.filename, "w") as output:
+            output.write ("[\n")
+
+
+    def new_correlation (self):
+        """
+        Make up a correlation id for a new event, unique across processes.
+        """
+
+        with self.__lock:
+            self.__count += 1
+            return "{0}-{1}-{2}".format (self.process_name, self.timeline.pid, self.__count)
+
+
+    def set_pending (self, correlation):
+        """
+        Remember the correlation id of the event whose effects are expected
+        next.
+        """
+
+        with self.__lock:
+            self.__pending = correlation
+            self.__pending_since = monotonic ()
+
+
+    def pending (self):
+        """
+        Get the correlation id of the event whose effects are expected next,
+        if there is one.
+        """
+
+        with self.__lock:
+            if self.__pending is not None and monotonic () - self.__pending_since > PENDING_TIMEOUT:
+                self.__pending = None
+            return self.__pending
+
+
+    def take_pending (self):
+        """
+        Get the correlation id of the event whose effects are expected next,
+        which are now here.
+        """
+
+        correlation = self.pending ()
+        with self.__lock:
+            self.__pending = None
+        return correlation
+
+
+    def hop (self, name, correlation, start = None):
+        """
+        Note an event with the given correlation id passing through, either
+        just now or from start until now.
+        """
+
+        args = {"correlation": correlation}
+        with self.__lock:
+            if start is None:
+                self.timeline.instant (name, "hop", args = args)
+            else:
+                self.timeline.complete (name, "hop", start, monotonic () - start, args)
+
+
+    @contextlib.contextmanager
+    def span (self, name, correlation):
+        """
+        Time the body of a with statement as one hop of an event.
+        """
+
+        start = monotonic ()
+        try:
+            yield
+        finally:
+            self.hop (name, correlation, start)
+
+
+    def flush (self):
+        """
+        Append everything recorded since the last flush to the file.
+        """
+
+        with self.__lock:
+            events = self.timeline.take ()
+        if len (events) > 0:
+            try:
+                with open (self.filename, "a") as output:
+                    for event in events:
+                        output.write (json.dumps (event))
+                        output.write (",\n")
+            except (IOError, OSError), e:
+                self.log.warn ("Couldn't write trace: {0}".format (e))
+
+
+##############################################################################
+
+
+def trace_directory ():
+    """
+    Determine where trace files go, creating the directory if it doesn't
+    already exist.
+    """
+
+    dirname = os.path.join (panflute.util.get_xdg_data_home_directory (), "traces")
+
+    try:
+        os.makedirs (dirname, 0700)
+    except OSError:
+        # Directory already existing is not a failure
+        pass
+
+    return dirname
+
+
+def read (filename):
+    """
+    Read the events from a trace file, whether it's a complete JSON object,
+    a complete array, or an array still being added to.
+    """
+
+    with open (filename, "r") as input:
+        text = input.read ().strip ()
+
+    if text.startswith ("[") and not text.endswith ("]"):
+        text = text.rstrip (",") + "]"
+    data = json.loads (text)
+    if isinstance (data, dict):
+        return data.get ("traceEvents", [])
+    else:
+        return data
+
+
+def merge (filenames):
+    """
+    Combine the events from several trace files into one list, adding flow
+    events that link together the hops of each correlated event.
+    """
+
+    events = []
+    for filename in filenames:
+        events.extend (read (filename))
+
+    hops = correlate (events)
+    for (n, correlation) in enumerate (sorted (hops)):
+        chain = hops[correlation]
+        if len (chain) < 2:
+            continue
+        for (i, hop) in enumerate (chain):
+            if i == 0:
+                phase = "s"
+            elif i == len (chain) - 1:
+                phase = "f"
+            else:
+                phase = "t"
+            flow = {"name": correlation, "cat": "flow", "ph": phase, "id": n,
+                    "pid": hop["pid"], "tid": hop["tid"], "ts": hop["ts"]}
+            if phase == "f":
+                flow["bp"] = "e"
+            events.append (flow)
+
+    return events
+
+
+def correlate (events):
+    """
+    Group the hops in a list of events by correlation id, each in the order
+    they started.
+    """
+
+    hops = {}
+    for event in events:
+        correlation = event.get ("args", {}).get ("correlation")
+        if correlation is not None and event.get ("ph") in ["X", "i"]:
+            hops.setdefault (correlation, []).append (event)
+    for chain in hops.itervalues ():
+        chain.sort (key = lambda event: event["ts"])
+    return hops
+
+
+class _Nothing (object):
+    """
+    A with statement body that isn't timed.
+    """
+
+    def __enter__ (self):
+        pass
+
+    def __exit__ (self, type, value, traceback):
+        return False
+
+
+_NOTHING = _Nothing ()
+
+
+##############################################################################
+
+
+_startup = None
+_events = None
+
+
+def start_startup (process_name, requested = False):
+    """
+    Begin tracing startup, if requested (such as by a command line option)
+    or asked to by the environment.  This should happen before importing
+    anything else.
+    """
+
+    global _startup
+
+    if _startup is None and (requested or os.getenv (STARTUP_ENV)):
+        _startup = StartupTracer (process_name)
+        _startup.install ()
+
+
+def startup_phase (name):
+    """
+    Time the body of a with statement as one phase of startup, if startup
+    is being traced.
+    """
+
+    if _startup is not None:
+        return _startup.phase (name)
+    else:
+        return _NOTHING
+
+
+def startup_mark (name):
+    """
+    Note something that happened during startup, if startup is being
+    traced.
+    """
+
+    if _startup is not None:
+        _startup.mark (name)
+
+
+def finish_startup (settle = STARTUP_SETTLE):
+    """
+    Arrange for the startup trace to be written out once the main loop has
+    run for settle ms.
+    """
+
+    if _startup is None:
+        return
+
+    # Imported here rather than up top so that gobject is loaded after the
+    # import hook is in place, and gets timed along with everything else.
+    import gobject
+
+    def running_cb ():
+        startup_mark ("main loop running")
+        return False
+
+    def write_cb ():
+        global _startup
+
+        tracer = _startup
+        _startup = None
+        tracer.uninstall ()
+        try:
+            filename = tracer.write ()
+            tracer.log.info ("Startup trace written to {0}".format (filename))
+        except (IOError, OSError), e:
+            tracer.log.warn ("Couldn't write startup trace: {0}".format (e))
+        return False
+
+    gobject.idle_add (running_cb)
+    gobject.timeout_add (settle, write_cb)
+
+
+def start_tracing (process_name):
+    """
+    Begin tracing events, if asked to by the environment.
+    """
+
+    global _events
+
+    if _events is None and os.getenv (TRACE_ENV):
+        _events = EventTracer (process_name)
+
+        # See finish_startup for why this is imported here.
+        import gobject
+        gobject.timeout_add (FLUSH_INTERVAL, lambda: _events.flush () or True)
+
+
+def tracing ():
+    """
+    Check whether events are being traced.
+    """
+
+    return _events is not None
+
+
+def new_correlation ():
+    """
+    Make up a correlation id for a new event, or None if events aren't
+    being traced.
+    """
+
+    if _events is not None:
+        return _events.new_correlation ()
+    else:
+        return None
+
+
+def set_pending (correlation):
+    """
+    Remember the correlation id of the event whose effects are expected
+    next.
+    """
+
+    if _events is not None:
+        _events.set_pending (correlation)
+
+
+def pending ():
+    """
+    Get the correlation id of the event whose effects are expected next, if
+    there is one.
+    """
+
+    if _events is not None:
+        return _events.pending ()
+    else:
+        return None
+
+
+def take_pending ():
+    """
+    Get the correlation id of the event whose effects are expected next,
+    which are now here.
+    """
+
+    if _events is not None:
+        return _events.take_pending ()
+    else:
+        return None
+
+
+def hop (name, correlation, start = None):
+    """
+    Note an event passing through, either just now or from start until now.
+    Events without a correlation id aren't noted.
+    """
+
+    if _events is not None and correlation is not None:
+        _events.hop (name, correlation, start)
+
+
+def span (name, correlation):
+    """
+    Time the body of a with statement as one hop of an event.  Events
+    without a correlation id aren't noted.
+    """
+
+    if _events is not None and correlation is not None:
+        return _events.span (name, correlation)
+    else:
+        return _NOTHING
+
@@ -28,6 +28,7 @@ import panflute.defs
 import gettext
 import locale
 import logging
+import os
 import os.path
 import urllib
 
@@ -84,3 +85,34 @@ def get_xdg_data_home_directory ():
         pass
 
     return dirname
+
+
+def get_resident_size ():
+    """
+    Determine how much memory the current process has resident, in bytes,
+    or 0 if that can't be found out.
+    """
+
+    try:
+        with open ("/proc/self/statm", "r") as statm:
+            pages = int (statm.read ().split ()[1])
+        return pages * os.sysconf ("SC_PAGE_SIZE")
+    except (IOError, ValueError, IndexError, OSError):
+        return 0
+
+
+def get_process_age ():
+    """
+    Determine how long ago the current process was started, in seconds, or
+    None if that can't be found out.
+    """
+
+    try:
+        with open ("/proc/self/stat", "r") as stat:
+            # The command name may contain spaces, but is always in parens.
+            fields = stat.read ().rsplit (")", 1)[1].split ()
+        with open ("/proc/uptime", "r") as uptime:
+            now = float (uptime.read ().split ()[0])
+        return now - int (fields[19]) / float (os.sysconf ("SC_CLK_TCK"))
+    except (IOError, ValueError, IndexError, OSError):
+        return None
@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+
+# Panflute
+# Copyright (C) 2010 Paul Kuliniewicz <paul@kuliniewicz.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02111-1301, USA.
+
+"""
+Watchdog for stalls in the main loop.
+
+Anything that blocks the main loop -- a synchronous D-Bus call, decoding a
+large image, waiting on a subprocess -- freezes everything else the process
+does.  The watchdog notices when that happens and logs what the main thread
+was doing at the time.
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import gobject
+import os.path
+import sys
+import threading
+import time
+import traceback
+
+
+PACKAGE_DIR = os.path.dirname (os.path.abspath (__file__))
+
+
+class Watchdog (threading.Thread):
+    """
+    Thread that notices when the main loop hasn't run for a while.
+
+    The main loop is expected to run a heartbeat every BEAT_INTERVAL ms.  If
+    the thread finds the heartbeat more than the threshold overdue, it logs
+    the main thread's stack.  It checks every half threshold, or every
+    CHECK_INTERVAL ms if that's longer.  Once the heartbeat runs again, how
+    late it was goes into a histogram, whose buckets have the upper bounds
+    in BUCKETS, plus one more for anything longer.
+
+    The watchdog has to be created in the main thread.
+    """
+
+    from panflute.util import log
+
+    BEAT_INTERVAL = 100
+    CHECK_INTERVAL = 50
+
+    # Heartbeats less late than this are just the main loop being busy.
+    MIN_STALL = 50
+
+    BUCKETS = [100, 250, 500, 1000, 2500, 5000]
+
+    MAX_RECENT = 10
+
+
+    def __init__ (self, threshold):
+        threading.Thread.__init__ (self, name = "Main loop watchdog")
+        self.daemon = True
+        self.threshold = threshold
+        self.__check_interval = max (self.CHECK_INTERVAL, threshold // 2)
+
+        # Only touched from the main thread.
+        self.counts = [0] * (len (self.BUCKETS) + 1)
+        self.longest = 0
+        self.recent = []
+
+        # Shared with the watchdog thread.
+        self.__lock = threading.Lock ()
+        self.__main_thread = threading.current_thread ().ident
+        self.__last_beat = None
+        self.__culprit = None
+
+        gobject.threads_init ()
+
+        # Don't start watching until the main loop is actually running, so
+        # that startup doesn't look like one big stall.
+        gobject.timeout_add (self.BEAT_INTERVAL, self.__beat_cb)
+
+
+    def run (self):
+        while True:
+            time.sleep (self.__check_interval / 1000.0)
+
+            with self.__lock:
+                overdue = (time.time () - self.__last_beat) * 1000 - self.BEAT_INTERVAL
+                if overdue < self.threshold or self.__culprit is not None:
+                    continue
+
+            frame = sys._current_frames ().get (self.__main_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack (frame)
+            del frame
+
+            culprit = find_culprit (stack)
+            with self.__lock:
+                self.__culprit = culprit
+
+            self.log.warn ("Main loop stalled for {0} ms so far in {1}:\n{2}".format (
+                int (overdue), culprit, "".join (traceback.format_list (stack))))
+
+
+    def __beat_cb (self):
+        """
+        Show the main loop is still running, and record how late it was in
+        doing so.
+        """
+
+        now = time.time ()
+        with self.__lock:
+            last = self.__last_beat
+            culprit = self.__culprit
+            self.__last_beat = now
+            self.__culprit = None
+
+        if last is None:
+            self.start ()
+            return True
+
+        late = int ((now - last) * 1000) - self.BEAT_INTERVAL
+        if late >= self.MIN_STALL:
+            self.counts[bisect.bisect_left (self.BUCKETS, late)] += 1
+            self.longest = max (self.longest, late)
+
+        if culprit is not None:
+            self.log.warn ("Main loop stall in {0} lasted {1} ms".format (culprit, late))
+            self.recent.append ((now, late, culprit))
+            del self.recent[:-self.MAX_RECENT]
+
+        return True
+
+
+##############################################################################
+
+
+def find_culprit (stack):
+    """
+    Describe the function the main loop called into, given a stack as
+    returned by traceback.extract_stack.
+
+    That's the outermost frame in Panflute's own code, below which
+    everything is the main loop and the libraries dispatching to the D-Bus
+    method or callback being run.
+    """
+
+    for (filename, lineno, name, line) in stack:
+        filename = os.path.abspath (filename)
+        if filename.startswith (PACKAGE_DIR + os.sep):
+            return "{0} ({1}:{2})".format (name, os.path.relpath (filename, PACKAGE_DIR), lineno)
+
+    if len (stack) > 0:
+        (filename, lineno, name, line) = stack[-1]
+        return "{0} ({1}:{2})".format (name, os.path.basename (filename), lineno)
+    else:
+        return "unknown code"